@@ -0,0 +1,434 @@
+import asyncio
+import inspect
+import json
+import time
+from datetime import datetime
+from functools import wraps
+from typing import AsyncIterator, Awaitable, Callable, Iterator
+from uuid import UUID
+import asyncpg
+from elasticsearch import AsyncElasticsearch, ApiError, ConnectionError, ConnectionTimeout
+from config import (logger, dsn, elastic_host, pg_pool_min, index_alias, bulk_chunk_size, bulk_max_chunk_bytes,
+                    bulk_adaptive, bulk_target_latency, bulk_min_chunk_size, bulk_max_chunk_size, bulk_max_retries, bulk_retry_backoff,
+                    transformer_mode, transformer_validate, hash_cache_enabled, hash_cache_path,
+                    inspect_probe_ttl, schedule_min_interval, schedule_max_interval, async_concurrency, bulk_thread_count,
+                    partial_updates, extra_indices, change_capture, coalesce_window)
+from etl import BaseETLComponent
+from extractor import Batch, ExtractorComponent, FilmworkExtractor, GenreExtractor, PersonExtractor
+from inspector import FilmworkInspector, GenreInspector, PersonInspector
+from transformer import Transformer, FastTransformer
+from loader import BULK_REJECTED, ComponentLoader, NdjsonLoader
+from bulk_sizing import AdaptiveChunkSize
+from serializer import BulkSerializer
+from hash_cache import HashCache
+from scheduler import Schedule
+from state import State
+from utils import ES_RETRY_STATUSES, jittered
+from metrics import BACKOFF_RETRIES, LAG_SECONDS, observe_stage, summary, timed_stage
+
+PG_ERRORS = (asyncpg.PostgresConnectionError, asyncpg.InterfaceError, OSError)
+# ApiError повторяется только с ES_RETRY_STATUSES, как в es_backoff
+ES_ERRORS = (ConnectionError, ConnectionTimeout, ApiError)
+
+
+def async_backoff(target: str, errors: tuple[type[Exception], ...], start_sleep_time=0.1, factor=2, border_sleep_time=10, jitter=False):
+    """Аналог pg_backoff/es_backoff для корутин и асинхронных генераторов.
+
+    Асинхронный генератор перезапускается целиком, как и в pg_backoff.
+    ApiError повторяется только с ответами 429/502/503/504, остальные
+    ответы Elasticsearch пробрасываются сразу. С jitter паузы получают
+    случайный разброс, как в es_backoff.
+    """
+    def func_wrapper(func):
+        async def pause(err: Exception, n: int) -> None:
+            if isinstance(err, ApiError) and err.meta.status not in ES_RETRY_STATUSES:
+                raise err
+            t = min(start_sleep_time * (factor ** n), border_sleep_time)
+            if jitter:
+                t = jittered(t)
+            BACKOFF_RETRIES.inc(target=target, operation=func.__qualname__)
+            logger.error(f' BACKOFF: {err}, retrying in {t:.2f}s')
+            await asyncio.sleep(t)
+
+        if inspect.isasyncgenfunction(func):
+            @wraps(func)
+            async def inner_gen(*args, **kwargs):
+                n = 0
+                while True:
+                    try:
+                        async for item in func(*args, **kwargs):
+                            yield item
+                        return
+                    except errors as err:
+                        await pause(err, n)
+                        n += 1
+            return inner_gen
+
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            n = 0
+            while True:
+                try:
+                    return await func(*args, **kwargs)
+                except errors as err:
+                    await pause(err, n)
+                    n += 1
+        return inner
+    return func_wrapper
+
+
+def _row(record: asyncpg.Record) -> dict[str, any]:
+    """Строка в том виде, в каком её отдаёт psycopg2 с RealDictCursor (UUID - строкой)."""
+    return {key: str(value) if isinstance(value, UUID) else value for key, value in record.items()}
+
+
+def _timestamp(value: str | datetime) -> datetime:
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    for type_name in ('json', 'jsonb'):
+        await conn.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+async def _timed_batches(entity: str, stage: str, batches: AsyncIterator[list]) -> AsyncIterator[list]:
+    while True:
+        start = time.perf_counter()
+        try:
+            batch = await anext(batches)
+        except StopAsyncIteration:
+            return
+        observe_stage(entity, stage, len(batch), time.perf_counter() - start)
+        yield batch
+
+
+class AsyncExtractor:
+    """Асинхронная выгрузка одной сущности.
+
+    Тексты запросов, отметки modified и сдвиг отметки берутся у синхронного
+    экстрактора той же сущности; здесь выполняется только ввод-вывод.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, extractor: ExtractorComponent, fetch_size: int) -> None:
+        self._pool = pool
+        self._extractor = extractor
+        self._fetch_size = fetch_size
+        self.entity = extractor.entity
+
+    async def _stream(self, query: str) -> AsyncIterator[list[dict[str, any]]]:
+        async with self._pool.acquire() as conn, conn.transaction():
+            cursor = await conn.cursor(query)
+            while rows := await cursor.fetch(self._fetch_size):
+                yield [_row(record) for record in rows]
+
+    async def _iter_enriched(self, data: list[dict[str, any]]) -> AsyncIterator[Batch]:
+        checkpoint = self._extractor._checkpoint(data)
+        if isinstance(self._extractor, FilmworkExtractor):
+            yield Batch(data, *checkpoint)
+            return
+        prev = None
+        async for rows in _timed_batches(self.entity, 'enrich', self._stream(self._extractor._enrich_query(data))):
+            if prev is not None:
+                yield Batch(prev)
+            prev = rows
+        yield Batch(prev or [], *checkpoint)
+
+    @async_backoff('postgres', PG_ERRORS)
+    async def iter_film_ids(self, until: str | None = None) -> AsyncIterator[Batch]:
+        async for data in _timed_batches(self.entity, 'extract', self._stream(self._extractor._resume_query(until))):
+            async for batch in self._iter_enriched(data):
+                yield batch
+
+    @async_backoff('postgres', PG_ERRORS)
+    async def merge(self, rows: list[dict[str, any]]) -> list[dict[str, any]]:
+        async with self._pool.acquire() as conn:
+            films = await conn.fetch(ExtractorComponent._merge_films_query(rows))
+            persons = await conn.fetch(ExtractorComponent._merge_persons_query(rows))
+        persons = {str(record['film_work_id']): record['persons'] for record in persons}
+        data = [_row(record) for record in films]
+        for row in data:
+            row['persons'] = persons[row['film_work_id']]
+        return data
+
+    def commit(self, batch: Batch) -> None:
+        self._extractor.commit(batch)
+
+
+class AsyncInspector:
+    """Асинхронная проба изменений всех таблиц одним запросом с кэшем на probe_ttl, как в DBInspector."""
+
+    def __init__(self, pool: asyncpg.Pool, state: State, probe_ttl: float = 0) -> None:
+        self._pool = pool
+        self._probe_ttl = probe_ttl
+        self._inspectors = (FilmworkInspector(None, state), GenreInspector(None, state), PersonInspector(None, state))
+        self._lock = asyncio.Lock()
+        self._probed_at = float('-inf')
+        self._watermarks: dict[str, str | None] = {}
+
+    @async_backoff('postgres', PG_ERRORS)
+    async def probe(self) -> dict[str, str | None]:
+        columns, params = [], []
+        for inspector in self._inspectors:
+            time_modified, last_id = inspector.probe_params()
+            params.extend((_timestamp(time_modified), last_id))
+            columns.append(f'({inspector.probe_query() % (f"${len(params) - 1}", f"${len(params)}")}) AS "{inspector.table_name}"')
+        async with self._pool.acquire() as conn:
+            row = await conn.fetchrow(f'SELECT {", ".join(columns)}', *params)
+        return {name: None if val is None else str(val) for name, val in row.items()}
+
+    async def _watermark(self, table_name: str) -> str | None:
+        async with self._lock:
+            if table_name not in self._watermarks or time.monotonic() - self._probed_at >= self._probe_ttl:
+                self._watermarks = await self.probe()
+                self._probed_at = time.monotonic()
+            return self._watermarks.pop(table_name)
+
+    async def inspect_filmwork(self) -> str | None:
+        return await self._watermark('film_work')
+
+    async def inspect_genre(self) -> str | None:
+        return await self._watermark('genre')
+
+    async def inspect_person(self) -> str | None:
+        return await self._watermark('person')
+
+
+class AsyncNdjsonLoader(NdjsonLoader):
+    """NdjsonLoader поверх AsyncElasticsearch: bulk-запросы пачки отправляются одновременно.
+
+    Пул потоков NdjsonLoader не создаётся: конкурентность запросов даёт цикл событий,
+    а общий на все пачки семафор держит в полёте не более thread_count запросов.
+    Следующий запрос нарезается, когда освобождается место, поэтому sizer
+    учитывает задержку уже полученных ответов; отклонённые с 429 документы
+    отправляются повторно, как в NdjsonLoader. Запросы к кешу хешей (SQLite)
+    и запись в журнал отказов выполняются в потоке (asyncio.to_thread),
+    чтобы не останавливать цикл событий.
+    """
+
+    def __init__(self, client: AsyncElasticsearch, index: str, chunk_size: int, thread_count: int, max_chunk_bytes: int,
+                 hash_cache: HashCache | None = None, sizer: AdaptiveChunkSize | None = None,
+                 max_retries: int = bulk_max_retries, retry_backoff: float = bulk_retry_backoff):
+        ComponentLoader.__init__(self, client, index, chunk_size, hash_cache)
+        self._max_chunk_bytes = max_chunk_bytes
+        self._thread_count = thread_count
+        self._sizer = sizer
+        self._max_retries = max_retries
+        self._retry_backoff = retry_backoff
+        self._requests = asyncio.Semaphore(thread_count)
+        self._serializer = BulkSerializer(index)
+        self._body_bytes = summary('bulk_body_bytes', 'Size of bulk request bodies in bytes')
+        self._encode_seconds = summary('bulk_encode_seconds', 'Time to serialize a batch of documents')
+
+    @async_backoff('elasticsearch', ES_ERRORS, jitter=True)
+    async def _send(self, body: bytes) -> list[dict[str, any]]:
+        self._body_bytes.observe(len(body), index=self._index)
+        response = await self._client.bulk(operations=body, filter_path=self.response_filter)
+        return [next(iter(item.values())) for item in response.get('items', [])]
+
+    async def _send_chunk(self, chunk: list[tuple[str, bytes]]) -> list[dict[str, any]]:
+        """Отправить запрос; отклонённые с 429 документы отправлять повторно, пока есть попытки."""
+        items: list[dict[str, any] | None] = [None] * len(chunk)
+        pending = list(range(len(chunk)))
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            response = await self._send(b''.join(chunk[i][1] for i in pending))
+            latency = time.perf_counter() - start
+            rejected = []
+            for i, item in zip(pending, response):
+                items[i] = item
+                if item.get('status') == 429:
+                    rejected.append(i)
+            if self._sizer is not None:
+                self._sizer.observe(len(pending), latency, len(rejected))
+            if not rejected or attempt >= self._max_retries:
+                return items
+            t = jittered(min(self._retry_backoff * (2 ** attempt), 30))
+            BULK_REJECTED.inc(len(rejected), index=self._index)
+            logger.warning(f'ndjson bulk: {len(rejected)} of {len(pending)} documents rejected (429), resending in {t:.2f}s')
+            await asyncio.sleep(t)
+            pending = rejected
+            attempt += 1
+
+    async def _send_released(self, chunk: list[tuple[str, bytes]]) -> list[dict[str, any]]:
+        try:
+            return await self._send_chunk(chunk)
+        finally:
+            self._requests.release()
+
+    async def _send_chunks(self, chunks: Iterator[list[tuple[str, bytes]]]) -> list[list[dict[str, any]]]:
+        """Отправить запросы одновременно, не более thread_count на весь загрузчик."""
+        tasks = []
+        try:
+            for chunk in chunks:
+                await self._requests.acquire()
+                tasks.append(asyncio.create_task(self._send_released(chunk)))
+            return await asyncio.gather(*tasks)
+        finally:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def load_data(self, models: list) -> None:
+        rendered, hashes = await asyncio.to_thread(
+            self._skip_unchanged, self._render(models), lambda item: (item[0], BulkSerializer.source(item[1])))
+        responses = await self._send_chunks(self._chunks(rendered))
+        await asyncio.to_thread(self._record, responses, hashes, rendered)
+
+
+class AsyncETLComponent(BaseETLComponent):
+    """ETL на asyncio: один поток, асинхронные клиенты Postgres (asyncpg) и Elasticsearch.
+
+    Каждая сущность опрашивается своей корутиной; merge -> transform -> bulk
+    пачек выполняются задачами, одновременно не более async_concurrency
+    на весь процесс. Отметки modified сдвигаются строго по порядку, после
+    загрузки всех предшествующих пачек. Поддерживается только режим опроса
+    (CHANGE_CAPTURE=poll) без общего буфера изменений, частичных обновлений
+    и дополнительных индексов: несовместимые настройки отклоняются при старте.
+    """
+
+    @property
+    def db_inspector(self):
+        return self._db_inspector
+
+    @property
+    def extractor(self):
+        return self._extractors
+
+    @property
+    def transformer(self):
+        return self._transformer
+
+    @property
+    def loader(self):
+        return self._loader
+
+    @staticmethod
+    def _unsupported_settings() -> list[str]:
+        settings = []
+        if change_capture != 'poll':
+            settings.append(f'CHANGE_CAPTURE={change_capture}')
+        if coalesce_window > 0:
+            settings.append(f'COALESCE_WINDOW={coalesce_window:g}')
+        if partial_updates:
+            settings.append('PARTIAL_UPDATES=true')
+        if extra_indices:
+            settings.append(f'EXTRA_INDICES={",".join(extra_indices)}')
+        return settings
+
+    def __init__(self, state: State, fetch_size: int, fetch_timeout: int):
+        if unsupported := self._unsupported_settings():
+            raise ValueError(f'ETL_ENGINE=async does not support {", ".join(unsupported)}')
+        self._state = state
+        self._fetch_size = fetch_size
+        self._fetch_timeout = fetch_timeout
+        self._sync_extractors = {
+            'film_work': FilmworkExtractor(None, self._state, self._fetch_size),
+            'genre': GenreExtractor(None, self._state, self._fetch_size),
+            'person': PersonExtractor(None, self._state, self._fetch_size),
+        }
+        self._transformer = FastTransformer(transformer_validate) if transformer_mode == 'fast' else Transformer()
+        self._hash_cache = HashCache(hash_cache_path) if hash_cache_enabled else None
+        self._db_inspector = None
+        self._extractors: dict[str, AsyncExtractor] = {}
+        self._loader = None
+        self._loop = None
+        self._stop = None
+        self._slots = None
+        self.schedules: dict[str, Schedule] = {}
+        for name, extractor in self._sync_extractors.items():
+            LAG_SECONDS.set_function(extractor.lag, entity=name)
+
+    async def _load_batch(self, extractor: AsyncExtractor, rows: list[dict[str, any]]) -> None:
+        try:
+            with timed_stage(extractor.entity, 'merge', len(rows)):
+                data = await extractor.merge(rows)
+            with timed_stage(extractor.entity, 'transform', len(data)):
+                models = self._transformer.transform(data)
+            with timed_stage(extractor.entity, 'bulk', len(models)):
+                await self._loader.load_data(models)
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    async def _commit_after(loads: list[asyncio.Task], previous: asyncio.Task | None, extractor: AsyncExtractor, batch: Batch) -> None:
+        await asyncio.gather(*loads)
+        if previous is not None:
+            await previous
+        extractor.commit(batch)
+
+    async def _sync(self, extractor: AsyncExtractor, until: str) -> int:
+        processed, loads, tasks, committed = 0, [], [], None
+        try:
+            async for batch in extractor.iter_film_ids(until):
+                if batch.rows:
+                    await self._slots.acquire()
+                    load = asyncio.create_task(self._load_batch(extractor, batch.rows))
+                    loads.append(load)
+                    tasks.append(load)
+                    processed += len(batch.rows)
+                if batch.checkpoint is not None:
+                    committed = asyncio.create_task(self._commit_after(loads, committed, extractor, batch))
+                    tasks.append(committed)
+                    loads = []
+                if self._stop.is_set():
+                    break
+            await asyncio.gather(*loads)
+            if committed is not None:
+                await committed
+        finally:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return processed
+
+    async def _process_entity(self, schedule: Schedule, inspector_method: Callable[[], Awaitable[str | None]], extractor: AsyncExtractor) -> None:
+        while not self._stop.is_set():
+            processed = 0
+            with timed_stage(extractor.entity, 'inspect'):
+                until = await inspector_method()
+            if until:
+                processed = await self._sync(extractor, until)
+            try:
+                await asyncio.wait_for(self._stop.wait(), schedule.next_delay(processed))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _setup(self, pool: asyncpg.Pool, client: AsyncElasticsearch) -> None:
+        """Создать инспектор, экстракторы и загрузчик поверх подключений; вызывается в работающем цикле событий."""
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        self._slots = asyncio.Semaphore(async_concurrency)
+        self._db_inspector = AsyncInspector(pool, self._state, inspect_probe_ttl)
+        self._extractors = {name: AsyncExtractor(pool, extractor, self._fetch_size) for name, extractor in self._sync_extractors.items()}
+        sizer = AdaptiveChunkSize(index_alias, bulk_chunk_size, bulk_min_chunk_size, bulk_max_chunk_size, bulk_target_latency) if bulk_adaptive else None
+        self._loader = AsyncNdjsonLoader(client, index_alias, bulk_chunk_size, bulk_thread_count, bulk_max_chunk_bytes, self._hash_cache, sizer)
+
+    async def _run(self) -> None:
+        # на каждую сущность до двух открытых курсоров (изменения и связи) плюс по подключению на пачку в работе
+        pool = await asyncpg.create_pool(
+            database=dsn['dbname'], user=dsn['user'], password=dsn['password'], host=dsn['host'], port=int(dsn['port'] or 5432),
+            min_size=pg_pool_min, max_size=async_concurrency + 2 * len(self._sync_extractors), init=_init_connection,
+        )
+        client = AsyncElasticsearch(elastic_host)
+        try:
+            await self._setup(pool, client)
+            inspectors = {
+                'film_work': self._db_inspector.inspect_filmwork,
+                'genre': self._db_inspector.inspect_genre,
+                'person': self._db_inspector.inspect_person,
+            }
+            workers = []
+            for name, extractor in self._extractors.items():
+                self.schedules[name] = Schedule(self._fetch_size, schedule_min_interval, schedule_max_interval)
+                workers.append(self._process_entity(self.schedules[name], inspectors[name], extractor))
+            await asyncio.gather(*workers)
+        finally:
+            await client.close()
+            await pool.close()
+
+    def perform_etl(self) -> None:
+        asyncio.run(self._run())
+        self._state.flush()
+        logger.info('ETL stopped')
+
+    def stop(self) -> None:
+        """Попросить корутины завершиться после текущей пачки; можно вызывать из обработчика сигнала."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
@@ -0,0 +1,261 @@
+"""Сквозной бенчмарк ETL: синтетические данные -> FakePool -> ETLComponent -> FakeElasticsearch.
+
+Сценарии:
+    full         первичная загрузка всех фильмов (отметки жанров и персон уже актуальны);
+    incremental  изменение части фильмов, жанров и персон и их догрузка;
+    full-load    выгрузка всех фильмов одним шардом полной загрузки (--full-load-extract copy|select).
+
+--engine async прогоняет full и incremental через AsyncETLComponent (asyncpg заменяет
+benchmarks.fake_asyncpg). Число документов, принятых FakeElasticsearch, сверяется
+с ожидаемым по данным; при расхождении бенчмарк завершается с ошибкой.
+
+Для каждого сценария печатаются документы в секунду, пиковый RSS и время
+по стадиям (из метрики etl_stage_seconds). С --results результаты
+дописываются строкой JSON в файл, чтобы отслеживать их от коммита к коммиту.
+
+Запуск из каталога etl:
+    python -m benchmarks.bench_etl --films 50000 --loader ndjson --transformer fast
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=20000)
+    parser.add_argument('--persons', type=int, default=5000)
+    parser.add_argument('--genres', type=int, default=30)
+    parser.add_argument('--persons-per-film', type=int, default=12)
+    parser.add_argument('--genres-per-film', type=int, default=3)
+    parser.add_argument('--touch-films', type=int, default=1000, help='films changed in the incremental scenario')
+    parser.add_argument('--touch-persons', type=int, default=100)
+    parser.add_argument('--touch-genres', type=int, default=1)
+    parser.add_argument('--fetch-size', type=int, default=1000)
+    parser.add_argument('--loader', choices=('serial', 'parallel', 'ndjson'), default='serial')
+    parser.add_argument('--transformer', choices=('model', 'fast'), default='model')
+    parser.add_argument('--execution', choices=('sequential', 'pipelined'), default='sequential')
+    parser.add_argument('--es-latency', type=float, default=0, help='artificial delay of each bulk response, ms')
+    parser.add_argument('--es-doc-latency', type=float, default=0, help='artificial delay per document of a bulk request, ms')
+    parser.add_argument('--es-reject', type=float, default=0, help='share of documents answered with 429')
+    parser.add_argument('--es-error', type=float, default=0, help='share of documents answered with 400 (mapping error)')
+    parser.add_argument('--dimension-cache', choices=('true', 'false'), default='false', help='genre and person names from the in-process cache')
+    parser.add_argument('--engine', choices=('threads', 'async'), default='threads', help='ETL_ENGINE of the full and incremental scenarios')
+    parser.add_argument('--full-load-extract', choices=('copy', 'select'), default='copy', help='shard extractor of the full-load scenario')
+    parser.add_argument('--scenario', choices=('full', 'incremental', 'full-load', 'all'), default='all')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--results', help='append results as a JSON line to this file')
+    args = parser.parse_args()
+    if args.engine == 'async' and args.scenario == 'full-load':
+        parser.error('the full-load scenario runs shard extractors of the threads engine only')
+    return args
+
+
+def _configure(args: argparse.Namespace, elastic_host: str) -> None:
+    """Настройки ETL читаются из окружения при импорте config, поэтому задаются до импорта модулей ETL."""
+    os.environ.update({
+        'FETCH_TIMEOUT': '1',
+        'FETCH_SIZE': str(args.fetch_size),
+        'TARGET_SCHEMA': 'content',
+        'ELASTIC_HOST': elastic_host,
+        'LOADER_MODE': args.loader,
+        'TRANSFORMER': args.transformer,
+        'EXECUTION_MODE': args.execution,
+        'STREAM_EXTRACT': 'true',
+        'CHANGE_CAPTURE': 'poll',
+        'COALESCE_WINDOW': '0',
+        'HASH_CACHE': 'false',
+        'DIMENSION_CACHE': args.dimension_cache,
+        'ETL_ENGINE': args.engine,
+    })
+    os.environ.setdefault('LOGS_PATH', os.path.join(tempfile.gettempdir(), 'etl-bench', 'etl.log'))
+    os.environ.setdefault('LOGGING_LEVEL', 'WARNING')
+
+
+def _reset_peak_rss() -> None:
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    """Пик RSS после последнего _reset_peak_rss (VmHWM); без /proc - пик за всё время процесса."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _stage_seconds() -> dict[str, float]:
+    from metrics import STAGE_SECONDS
+    totals = {}
+    for name, key, value in STAGE_SECONDS.samples():
+        if name.endswith('_sum'):
+            stage = dict(key)['stage']
+            totals[stage] = totals.get(stage, 0.0) + value
+    return totals
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _affected_films(links: list[tuple], touched: list[str], fetch_size: int) -> int:
+    """Документов фильмов после изменения touched записей справочника: фильмы связей каждой пачки по fetch_size."""
+    films_by = {}
+    for film_id, id, *_ in links:
+        films_by.setdefault(id, set()).add(film_id)
+    return sum(len(set().union(*(films_by.get(id, ()) for id in touched[i:i + fetch_size]))) for i in range(0, len(touched), fetch_size))
+
+
+def _measure(name: str, run, fake_es, expected=None) -> dict[str, any]:
+    """Замерить сценарий; expected - функция, возвращающая ожидаемое число документов после прогона."""
+    fake_es.reset()
+    stages_before = _stage_seconds()
+    _reset_peak_rss()
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    stages = {stage: seconds - stages_before.get(stage, 0.0) for stage, seconds in _stage_seconds().items()}
+    result = {
+        'scenario': name,
+        'documents': fake_es.documents,
+        'bulk_requests': fake_es.requests,
+        'rejected': fake_es.rejected,
+        'seconds': round(elapsed, 3),
+        'docs_per_second': round(fake_es.documents / elapsed, 1) if elapsed else 0.0,
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'stage_seconds': {stage: round(seconds, 3) for stage, seconds in sorted(stages.items()) if seconds > 0},
+    }
+    stages_str = ' '.join(f'{stage}={seconds:.2f}s' for stage, seconds in result['stage_seconds'].items())
+    print(f'{name:<12} {result["documents"]:>8} docs {elapsed:>8.2f}s {result["docs_per_second"]:>10.0f} docs/s '
+          f'peak RSS {result["peak_rss_mb"]:>7.1f} MB   {stages_str}')
+    # документы с ошибкой маппинга уходят в журнал отказов, их число не сверяется
+    if expected is not None and not fake_es.error_rate and fake_es.documents != expected():
+        raise SystemExit(f'{name}: expected {expected()} documents in Elasticsearch, got {fake_es.documents}')
+    return result
+
+
+def main() -> None:
+    args = _parse_args()
+    from benchmarks.fake_es import FakeElasticsearch
+    from benchmarks.fake_pg import FakePool
+    from benchmarks.synthetic import content_dataset
+
+    fake_es = FakeElasticsearch(latency=args.es_latency / 1000, document_latency=args.es_doc_latency / 1000, reject_rate=args.es_reject, error_rate=args.es_error).start()
+    _configure(args, fake_es.url)
+    from elasticsearch import Elasticsearch
+    from etl import ETLComponent
+    from extractor import CopyShardExtractor, FilmworkShardExtractor
+    from storage import MemoryStorage
+    from state import State
+
+    dataset = content_dataset(args.films, args.persons, args.genres, args.persons_per_film, args.genres_per_film, args.seed)
+    caught_up = str(dataset.max_modified())
+    state = State(MemoryStorage({'genre_time_modified': caught_up, 'person_time_modified': caught_up}))
+    client = Elasticsearch(fake_es.url)
+    pool = FakePool(dataset)
+    component = ETLComponent(pool, client, state, args.fetch_size, 1)
+    if args.engine == 'async':
+        import asyncio
+        from elasticsearch import AsyncElasticsearch
+        from async_etl import AsyncETLComponent
+        from benchmarks.fake_asyncpg import FakeAsyncPool
+
+        loop = asyncio.new_event_loop()
+        async_client = AsyncElasticsearch(fake_es.url)
+        async_component = AsyncETLComponent(state, args.fetch_size, 1)
+        loop.run_until_complete(async_component._setup(FakeAsyncPool(pool), async_client))
+        async_inspector = async_component.db_inspector
+        entities = (
+            (async_inspector.inspect_filmwork, async_component.extractor['film_work']),
+            (async_inspector.inspect_genre, async_component.extractor['genre']),
+            (async_inspector.inspect_person, async_component.extractor['person']),
+        )
+
+        async def sync_async(inspector_method, extractor) -> None:
+            if until := await inspector_method():
+                await async_component._sync(extractor, until)
+
+        def sync(inspector_method, extractor) -> None:
+            loop.run_until_complete(sync_async(inspector_method, extractor))
+    else:
+        inspector = component.db_inspector
+        if component._dimensions is not None:
+            component._dimensions.warm()
+        entities = (
+            (inspector.inspect_filmwork, component._filmwork_extractor),
+            (inspector.inspect_genre, component._genre_extractor),
+            (inspector.inspect_person, component._person_extractor),
+        )
+
+        def sync(inspector_method, extractor) -> None:
+            if until := component._inspect(inspector_method, extractor):
+                component._sync(extractor, component.transformer, component.loader, until=until)
+
+    touched = {}
+
+    def full() -> None:
+        sync(*entities[0])
+
+    def incremental() -> None:
+        touched['film_work'] = dataset.touch('film_work', args.touch_films, args.seed)
+        touched['genre'] = dataset.touch('genre', args.touch_genres, args.seed)
+        touched['person'] = dataset.touch('person', args.touch_persons, args.seed)
+        for inspector_method, extractor in entities:
+            sync(inspector_method, extractor)
+
+    def incremental_expected() -> int:
+        films = len(touched['film_work']) if args.scenario == 'all' else args.films
+        return (films + _affected_films(dataset.genre_film_work, touched['genre'], args.fetch_size)
+                + _affected_films(dataset.person_film_work, touched['person'], args.fetch_size))
+
+    def full_load() -> None:
+        extractor_class = CopyShardExtractor if args.full_load_extract == 'copy' else FilmworkShardExtractor
+        for batch in extractor_class(pool, state, args.fetch_size).extract_shard(str(uuid.UUID(int=0)), None):
+            component.loader.load_data(component.transformer.transform(batch.rows))
+
+    print(f'films={args.films} persons={args.persons} genres={args.genres} links={len(dataset.person_film_work) + len(dataset.genre_film_work)} '
+          f'loader={args.loader} transformer={args.transformer} execution={args.execution} fetch_size={args.fetch_size} '
+          f'dimension_cache={args.dimension_cache} engine={args.engine}')
+    results = []
+    if args.scenario in ('full', 'all'):
+        results.append(_measure('full', full, fake_es, lambda: args.films))
+    if args.scenario in ('incremental', 'all'):
+        results.append(_measure('incremental', incremental, fake_es, incremental_expected))
+    if args.scenario == 'full-load':
+        results.append(_measure('full-load', full_load, fake_es, lambda: args.films))
+    if args.engine == 'async':
+        loop.run_until_complete(async_client.close())
+        loop.close()
+    client.transport.close()
+    fake_es.shutdown()
+
+    if args.results:
+        record = {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': _git_revision(),
+            'params': {key: value for key, value in vars(args).items() if key != 'results'},
+            'results': results,
+        }
+        with open(args.results, 'a') as results_file:
+            results_file.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Сравнение Transformer и FastTransformer на синтетических строках.
+
+Запуск из каталога etl:
+    python -m benchmarks.bench_transformer --films 100000
+"""
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault('FETCH_TIMEOUT', '1')
+
+from transformer import Transformer, FastTransformer
+from loader import ComponentLoader
+from benchmarks.synthetic import merged_rows
+
+
+def _measure(name: str, rows: list[dict[str, any]], transformer, loader: ComponentLoader, repeat: int) -> None:
+    best_transform = best_total = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        docs = transformer.transform(rows)
+        transformed = time.perf_counter()
+        loader._get_bulk_data(docs)
+        done = time.perf_counter()
+        best_transform = min(best_transform, transformed - start)
+        best_total = min(best_total, done - start)
+    print(f'{name:<24} transform {len(rows) / best_transform:>10.0f} rows/s   '
+          f'transform+bulk actions {len(rows) / best_total:>10.0f} rows/s')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=20000)
+    parser.add_argument('--persons', type=int, default=12, help='persons per film')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = merged_rows(args.films, args.persons)
+    loader = ComponentLoader(None, 'movies', 1000)
+    # быстрый путь должен давать те же документы
+    reference = loader._get_bulk_data(Transformer().transform(rows[:100]))
+    fast = loader._get_bulk_data(FastTransformer().transform(rows[:100]))
+    assert json.dumps(reference, default=str) == json.dumps(fast, default=str)
+
+    _measure('Transformer', rows, Transformer(), loader, args.repeat)
+    _measure('FastTransformer', rows, FastTransformer(), loader, args.repeat)
+    _measure('FastTransformer+validate', rows, FastTransformer(validate=True), loader, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import re
+from contextlib import asynccontextmanager
+from benchmarks.fake_pg import FakePool
+
+_PLACEHOLDER = re.compile(r'\$\d+')
+
+
+class FakeAsyncCursor:
+    def __init__(self, rows: list[dict[str, any]]) -> None:
+        self._rows = rows
+        self._pos = 0
+
+    async def fetch(self, size: int) -> list[dict[str, any]]:
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+
+class FakeAsyncConnection:
+    """Подключение asyncpg поверх FakePool: записи - словари, у них те же items() и [ключ]."""
+
+    def __init__(self, pool: FakePool) -> None:
+        self._pool = pool
+
+    def _answer(self, query: str, params: tuple) -> list[dict[str, any]]:
+        # FakePool понимает плейсхолдеры psycopg2; $n в запросах идут по порядку
+        return self._pool.answer(_PLACEHOLDER.sub('%s', query), list(params))
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def cursor(self, query: str, *params) -> FakeAsyncCursor:
+        return FakeAsyncCursor(self._answer(query, params))
+
+    async def fetch(self, query: str, *params) -> list[dict[str, any]]:
+        return self._answer(query, params)
+
+    async def fetchrow(self, query: str, *params) -> dict[str, any] | None:
+        rows = self._answer(query, params)
+        return rows[0] if rows else None
+
+
+class FakeAsyncPool:
+    """Замена пула asyncpg для бенчмарка ETL_ENGINE=async: отвечает по данным FakePool."""
+
+    def __init__(self, pool: FakePool) -> None:
+        self._pool = pool
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield FakeAsyncConnection(self._pool)
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,114 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'FakeElasticsearch'
+
+    def _reply(self, status: int, payload: dict[str, any]) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_GET(self) -> None:
+        self._reply(200, {'name': 'fake', 'cluster_name': 'benchmark', 'version': {'number': '8.13.0'}, 'tagline': 'You Know, for Search'})
+
+    def do_HEAD(self) -> None:
+        self._reply(200, {})
+
+    def do_PUT(self) -> None:
+        if self.path.split('?')[0].endswith('/_bulk'):
+            return self.do_POST()
+        self._body()
+        self._reply(200, {'acknowledged': True})
+
+    def do_POST(self) -> None:
+        body = self._body()
+        if not self.path.split('?')[0].endswith('/_bulk'):
+            self._reply(200, {'acknowledged': True})
+            return
+        start = time.perf_counter()
+        items = self.server.bulk(body)
+        delay = self.server.latency + self.server.document_latency * len(items)
+        if delay:
+            time.sleep(delay)
+        took = int((time.perf_counter() - start) * 1000)
+        self._reply(200, {'took': took, 'errors': any(next(iter(item.values()))['status'] >= 300 for item in items), 'items': items})
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class FakeElasticsearch(ThreadingHTTPServer):
+    """HTTP-сервер, принимающий _bulk как Elasticsearch и считающий документы.
+
+    Документы не хранятся и не индексируются: сервер только разбирает
+    NDJSON и отвечает успехом на каждое действие, поэтому в замерах
+    остаётся стоимость сериализации и HTTP на стороне ETL. latency -
+    искусственная задержка ответа на bulk-запрос в секундах,
+    document_latency - добавка к ней за каждый документ запроса.
+    reject_rate - доля документов, на которые сервер отвечает 429
+    (es_rejected_execution_exception), как перегруженный кластер;
+    error_rate - доля документов, на которые сервер отвечает 400
+    (strict_dynamic_mapping_exception), как на документ не по маппингу.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0, document_latency: float = 0, reject_rate: float = 0, error_rate: float = 0) -> None:
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.document_latency = document_latency
+        self.reject_rate = reject_rate
+        self.error_rate = error_rate
+        self.rejected = 0
+        self.requests = 0
+        self.documents = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def bulk(self, body: bytes) -> list[dict[str, any]]:
+        items, rejected = [], 0
+        lines = iter(line for line in body.split(b'\n') if line.strip())
+        for line in lines:
+            action, meta = next(iter(json.loads(line).items()))
+            if action != 'delete':
+                next(lines)
+            item = {'_index': meta.get('_index'), '_id': meta.get('_id'), 'status': 201 if action != 'delete' else 200}
+            if self.reject_rate and random.random() < self.reject_rate:
+                item.update(status=429, error={'type': 'es_rejected_execution_exception', 'reason': 'rejected execution'})
+                rejected += 1
+            elif self.error_rate and random.random() < self.error_rate:
+                item.update(status=400, error={'type': 'strict_dynamic_mapping_exception', 'reason': 'mapping set to strict'})
+                rejected += 1
+            items.append({action: item})
+        with self._lock:
+            self.requests += 1
+            self.documents += len(items) - rejected
+            self.rejected += rejected
+            self.bytes += len(body)
+        return items
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = self.documents = self.bytes = self.rejected = 0
+
+    def start(self) -> 'FakeElasticsearch':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
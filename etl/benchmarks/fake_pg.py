@@ -0,0 +1,270 @@
+import bisect
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from benchmarks.synthetic import ContentDataset
+
+_PROBE = re.compile(r'FROM "\w+"\."(\w+)" WHERE \(modified, id\) > \(%s, %s\)')
+_CHANGED = re.compile(r"FROM content\.(\w+)(?: \w+)? WHERE \((?:\w+\.)?modified, (?:\w+\.)?id\) > \('([^']*)', '([^']*)'\)(?: AND modified <= '([^']*)')?")
+_ENRICH = re.compile(r'WHERE (pfw\.person_id|gfw\.genre_id) IN \(([^)]*)\)')
+_SHARD = re.compile(r"WHERE fw\.id >= '([^']*)'(?: AND fw\.id < '([^']*)')? ORDER BY fw\.id")
+_FILM_IDS = re.compile(r'WHERE fw\.id IN \(([^)]*)\)')
+_LINK_IDS = re.compile(r'WHERE film_work_id IN \(([^)]*)\)')
+_COPY = re.compile(r"^COPY \(SELECT .*? FROM content\.(\w+) .*WHERE \w+\.\w+ >= '([^']*)'(?: AND \w+\.\w+ < '([^']*)')? ORDER BY", re.S)
+_DIMENSION = re.compile(r'SELECT id, (?:name|full_name), modified FROM content\.(genre|person)(?: WHERE id IN \(([^)]*)\))?(?: ORDER BY modified DESC LIMIT (\d+))?')
+
+
+def _timestamp(value: str | datetime) -> datetime:
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(value)
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def _copy_line(values: tuple) -> bytes:
+    fields = ('\\N' if value is None else str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n') for value in values)
+    return ('\t'.join(fields) + '\n').encode()
+
+
+def _ids(in_list: str) -> list[str]:
+    return [id.strip().strip("'") for id in in_list.split(',') if id.strip()]
+
+
+class FakeCursor:
+    """Курсор, отвечающий на запросы экстракторов и инспектора по данным ContentDataset."""
+
+    def __init__(self, pool: 'FakePool') -> None:
+        self._pool = pool
+        self._rows: list[dict[str, any]] = []
+        self._pos = 0
+        self.itersize = 2000
+
+    def execute(self, query: str, params: tuple | list | None = None) -> None:
+        self._rows = self._pool.answer(query, list(params or ()))
+        self._pos = 0
+
+    def copy_expert(self, sql: str, file, size: int = 8192) -> None:
+        rows = self._pool.copy(sql)
+        for i in range(0, len(rows), 100):
+            file.write(b''.join(_copy_line(values) for values in rows[i:i + 100]))
+
+    def fetchmany(self, size: int) -> list[dict[str, any]]:
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    def fetchone(self) -> dict[str, any] | None:
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def fetchall(self) -> list[dict[str, any]]:
+        return self.fetchmany(len(self._rows))
+
+    def close(self) -> None:
+        self._rows = []
+
+
+class FakeConnection:
+    def __init__(self, pool: 'FakePool') -> None:
+        self._pool = pool
+        self.autocommit = False
+        self.closed = 0
+
+    def cursor(self, name: str | None = None) -> FakeCursor:
+        return FakeCursor(self._pool)
+
+    def commit(self) -> None:
+        pass
+
+    def cancel(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = 1
+
+
+class FakePool:
+    """Замена PGConnectionPool для бенчмарков: Postgres в памяти процесса.
+
+    Понимает только запросы, которые выполняют экстракторы и DBInspector,
+    и разбирает их регулярными выражениями, поэтому при изменении текста
+    запросов его нужно обновлять. Время ответа - это время Python-кода,
+    сетевые задержки и план запроса Postgres не моделируются.
+    """
+
+    def __init__(self, dataset: ContentDataset) -> None:
+        self._dataset = dataset
+        self._lock = threading.Lock()
+        self._version = None
+        self._ordered: dict[str, tuple[list[datetime], list[str]]] = {}
+        self._genres_by_film: dict[str, list[str]] = {}
+        self._persons_by_film: dict[str, list[tuple[str, str]]] = {}
+        self._films_by: dict[str, dict[str, set[str]]] = {'pfw.person_id': {}, 'gfw.genre_id': {}}
+        for film_id, genre_id in dataset.genre_film_work:
+            self._genres_by_film.setdefault(film_id, []).append(genre_id)
+            self._films_by['gfw.genre_id'].setdefault(genre_id, set()).add(film_id)
+        for film_id, person_id, role in dataset.person_film_work:
+            self._persons_by_film.setdefault(film_id, []).append((person_id, role))
+            self._films_by['pfw.person_id'].setdefault(person_id, set()).add(film_id)
+        self.queries = 0
+
+    @contextmanager
+    def connection(self):
+        yield FakeConnection(self)
+
+    def closeall(self) -> None:
+        pass
+
+    def _ordered_table(self, table: str) -> tuple[list[datetime], list[str]]:
+        with self._lock:
+            if self._version != self._dataset.version:
+                self._ordered, self._version = {}, self._dataset.version
+            if table not in self._ordered:
+                rows = sorted(getattr(self._dataset, table).values(), key=lambda row: (row['modified'], row['id']))
+                self._ordered[table] = ([row['modified'] for row in rows], [row['id'] for row in rows])
+            return self._ordered[table]
+
+    def answer(self, query: str, params: list) -> list[dict[str, any]]:
+        self.queries += 1
+        if 'pg_indexes' in query:
+            return [{'indexdef': f'CREATE INDEX {params[1]}_modified_idx ON {params[0]}.{params[1]} USING btree (modified, id)'}]
+        if 'max(modified)' in query:
+            return [self._probe(query, params)]
+        if 'p.id AS person_id, p.full_name' in query:
+            return self._person_patches(_ids(_ENRICH.search(query).group(2)))
+        if 'gfw.film_work_id IN (SELECT' in query:
+            return self._genre_patches(_ids(re.search(r'genre_id IN \(([^)]*)\)', query).group(1)))
+        if 'array_agg' in query:
+            return self._merge_films(_ids(_FILM_IDS.search(query).group(1)))
+        if 'json_agg' in query:
+            return self._merge_persons(_ids(_FILM_IDS.search(query).group(1)))
+        if 'UNION ALL' in query:
+            return self._links(_ids(_LINK_IDS.search(query).group(1)))
+        if 'fw.title' in query:
+            return self._films(_ids(_FILM_IDS.search(query).group(1)))
+        if match := _DIMENSION.search(query):
+            return self._dimension(*match.groups())
+        if match := _ENRICH.search(query):
+            return self._enrich(match.group(1), _ids(match.group(2)))
+        if match := _SHARD.search(query):
+            return self._shard(*match.groups())
+        if match := _CHANGED.search(query):
+            return self._changed(*match.groups())
+        if 'now()' in query:
+            return [{'now': datetime.now(timezone.utc)}]
+        raise NotImplementedError(f'FakePool does not understand query: {query[:200]}')
+
+    def copy(self, query: str) -> list[tuple]:
+        """Строки COPY-выгрузки шарда: film_work или таблица связей с именами, по возрастанию film_work_id."""
+        self.queries += 1
+        table, lower, upper = _COPY.search(query).groups()
+        ids = [id for id in sorted(self._dataset.film_work) if id >= lower and (upper is None or id < upper)]
+        if table == 'film_work':
+            films = self._dataset.film_work
+            return [(id, films[id]['title'], films[id]['description'], films[id]['rating'], films[id]['type'],
+                     films[id]['created'], films[id]['modified']) for id in ids]
+        if table == 'genre_film_work':
+            genres = self._dataset.genre
+            return [(id, genre_id, genres[genre_id]['name']) for id in ids for genre_id in self._genres_by_film.get(id, ())]
+        persons = self._dataset.person
+        return [(id, role, person_id, persons[person_id]['full_name']) for id in ids for person_id, role in self._persons_by_film.get(id, ())]
+
+    def _after(self, table: str, since: str, last_id: str) -> int:
+        """Позиция первой строки после курсора (modified, id)."""
+        modified, ids = self._ordered_table(table)
+        since = _timestamp(since)
+        start = bisect.bisect_left(modified, since)
+        end = bisect.bisect_right(modified, since)
+        return start + bisect.bisect_right(ids[start:end], last_id)
+
+    def _probe(self, query: str, params: list) -> dict[str, any]:
+        row = {}
+        for i, table in enumerate(_PROBE.findall(query)):
+            modified, _ = self._ordered_table(table)
+            row[table] = modified[-1] if self._after(table, params[2 * i], params[2 * i + 1]) < len(modified) else None
+        return row
+
+    def _changed(self, table: str, since: str, last_id: str, until: str | None) -> list[dict[str, any]]:
+        modified, ids = self._ordered_table(table)
+        start = self._after(table, since, last_id)
+        end = bisect.bisect_right(modified, _timestamp(until)) if until else len(modified)
+        return [{'id': ids[i], 'modified': modified[i]} for i in range(start, end)]
+
+    def _shard(self, lower: str, upper: str | None) -> list[dict[str, any]]:
+        ids = sorted(self._dataset.film_work)
+        start = bisect.bisect_left(ids, lower)
+        end = bisect.bisect_left(ids, upper) if upper else len(ids)
+        return [{'id': id} for id in ids[start:end]]
+
+    def _enrich(self, link: str, ids: list[str]) -> list[dict[str, any]]:
+        films = self._dataset.film_work
+        film_ids = set().union(*(self._films_by[link].get(id, ()) for id in ids))
+        rows = [{'id': id, 'modified': films[id]['modified']} for id in film_ids]
+        rows.sort(key=lambda row: row['modified'])
+        return rows
+
+    def _person_patches(self, person_ids: list[str]) -> list[dict[str, any]]:
+        persons, wanted = self._dataset.person, set(person_ids)
+        rows = [{'film_work_id': film_id, 'role': role, 'person_id': person_id, 'full_name': persons[person_id]['full_name']}
+                for film_id, person_id, role in self._dataset.person_film_work if person_id in wanted]
+        rows.sort(key=lambda row: row['film_work_id'])
+        return rows
+
+    def _genre_patches(self, genre_ids: list[str]) -> list[dict[str, any]]:
+        genres = self._dataset.genre
+        film_ids = sorted(set().union(*(self._films_by['gfw.genre_id'].get(id, ()) for id in genre_ids)))
+        return [{
+            'film_work_id': id,
+            'genres': sorted({genres[genre_id]['name'] for genre_id in self._genres_by_film[id]}),
+            'genres_list': self._genres_list(id),
+        } for id in film_ids]
+
+    def _genres_list(self, film_id: str) -> list[dict[str, str]]:
+        genres = self._dataset.genre
+        return [{'genre_id': genre_id, 'genre_name': genres[genre_id]['name']} for genre_id in sorted(set(self._genres_by_film.get(film_id, ())))]
+
+    def _films(self, film_ids: list[str]) -> list[dict[str, any]]:
+        films = self._dataset.film_work
+        return [{
+            'film_work_id': id,
+            'title': films[id]['title'],
+            'description': films[id]['description'],
+            'rating': films[id]['rating'],
+            'type': films[id]['type'],
+            'created': films[id]['created'],
+            'modified': films[id]['modified'],
+        } for id in film_ids]
+
+    def _merge_films(self, film_ids: list[str]) -> list[dict[str, any]]:
+        genres = self._dataset.genre
+        rows = self._films(film_ids)
+        for row in rows:
+            id = row['film_work_id']
+            row['genres'] = sorted({genres[genre_id]['name'] for genre_id in self._genres_by_film.get(id, ())}) or [None]
+            row['genres_list'] = self._genres_list(id)
+        return rows
+
+    def _links(self, film_ids: list[str]) -> list[dict[str, any]]:
+        rows = [{'film_work_id': id, 'dimension': 'genre', 'id': genre_id, 'role': None}
+                for id in film_ids for genre_id in self._genres_by_film.get(id, ())]
+        rows += [{'film_work_id': id, 'dimension': 'person', 'id': person_id, 'role': role}
+                 for id in film_ids for person_id, role in self._persons_by_film.get(id, ())]
+        return rows
+
+    def _dimension(self, table: str, in_list: str | None, limit: str | None) -> list[dict[str, any]]:
+        records = getattr(self._dataset, table)
+        rows = [records[id] for id in _ids(in_list) if id in records] if in_list is not None else list(records.values())
+        if limit is not None:
+            rows = sorted(rows, key=lambda row: row['modified'], reverse=True)[:int(limit)]
+        return rows
+
+    def _merge_persons(self, film_ids: list[str]) -> list[dict[str, any]]:
+        persons = self._dataset.person
+        return [{
+            'film_work_id': id,
+            'persons': [{'person_role': role, 'person_id': person_id, 'person_name': persons[person_id]['full_name']}
+                        for person_id, role in self._persons_by_film.get(id, ())],
+        } for id in film_ids]
@@ -0,0 +1,93 @@
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+ROLES = ('actor', 'director', 'writer')
+
+
+def merged_rows(films: int, persons_per_film: int = 12, genres_per_film: int = 3, seed: int = 42) -> list[dict[str, any]]:
+    """Строки в том виде, в каком их возвращает ExtractorComponent._merge_data."""
+    rnd = random.Random(seed)
+    people = [(str(uuid.UUID(int=rnd.getrandbits(128))), f'Person {i}') for i in range(max(films, 100))]
+    genres = [f'Genre {i}' for i in range(30)]
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(films):
+        modified = start + timedelta(seconds=i)
+        rows.append({
+            'film_work_id': str(uuid.UUID(int=rnd.getrandbits(128))),
+            'title': f'Film {i}',
+            'description': f'Description of film {i}' if i % 5 else None,
+            'rating': round(rnd.uniform(1, 10), 1),
+            'type': 'movie',
+            'created': modified,
+            'modified': modified,
+            'genres': rnd.sample(genres, genres_per_film),
+            'persons': [
+                {'person_role': rnd.choice(ROLES), 'person_id': person_id, 'person_name': name}
+                for person_id, name in rnd.sample(people, persons_per_film)
+            ],
+        })
+    return rows
+
+
+@dataclass
+class ContentDataset:
+    """Таблицы схемы content в памяти: id -> строка и связи фильмов с жанрами и персонами."""
+    film_work: dict[str, dict[str, any]]
+    genre: dict[str, dict[str, any]]
+    person: dict[str, dict[str, any]]
+    genre_film_work: list[tuple[str, str]]
+    person_film_work: list[tuple[str, str, str]]
+    version: int = 0
+
+    def max_modified(self) -> datetime:
+        return max(row['modified'] for table in (self.film_work, self.genre, self.person) for row in table.values())
+
+    def touch(self, table: str, count: int, seed: int = 0) -> list[str]:
+        """Обновить modified у count случайных строк таблицы, как это сделала бы правка в админке."""
+        rows = getattr(self, table)
+        ids = random.Random(seed).sample(sorted(rows), min(count, len(rows)))
+        modified = self.max_modified()
+        for i, id in enumerate(ids, start=1):
+            rows[id]['modified'] = modified + timedelta(milliseconds=i)
+        self.version += 1
+        return ids
+
+
+def content_dataset(films: int, persons: int, genres: int, persons_per_film: int = 12, genres_per_film: int = 3, seed: int = 42) -> ContentDataset:
+    """Синтетические таблицы film_work, genre, person, genre_film_work и person_film_work."""
+    rnd = random.Random(seed)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+    def new_id() -> str:
+        return str(uuid.UUID(int=rnd.getrandbits(128)))
+
+    genre = {}
+    for i in range(genres):
+        id = new_id()
+        genre[id] = {'id': id, 'name': f'Genre {i}', 'modified': start + timedelta(seconds=i)}
+    person = {}
+    for i in range(persons):
+        id = new_id()
+        person[id] = {'id': id, 'full_name': f'Person {i}', 'modified': start + timedelta(seconds=i)}
+    film_work = {}
+    for i in range(films):
+        id = new_id()
+        modified = start + timedelta(seconds=i)
+        film_work[id] = {
+            'id': id,
+            'title': f'Film {i}',
+            'description': f'Description of film {i}' if i % 5 else None,
+            'rating': round(rnd.uniform(1, 10), 1),
+            'type': 'movie',
+            'created': modified,
+            'modified': modified,
+        }
+    genre_ids, person_ids = list(genre), list(person)
+    genre_film_work = [(film_id, genre_id) for film_id in film_work
+                       for genre_id in rnd.sample(genre_ids, min(genres_per_film, len(genre_ids)))]
+    person_film_work = [(film_id, person_id, rnd.choice(ROLES)) for film_id in film_work
+                        for person_id in rnd.sample(person_ids, min(persons_per_film, len(person_ids)))]
+    return ContentDataset(film_work, genre, person, genre_film_work, person_film_work)
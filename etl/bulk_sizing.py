@@ -0,0 +1,43 @@
+import threading
+from metrics import gauge
+
+
+BULK_CHUNK_SIZE = gauge('etl_bulk_chunk_size', 'Current number of documents in one bulk request')
+
+
+class AdaptiveChunkSize:
+    """Размер bulk-запроса, подстраиваемый под задержку ответа Elasticsearch.
+
+    После каждого запроса размер сдвигается к target_latency: если ответ
+    пришёл быстрее 0.8 * target_latency, размер растёт в growth раз, если
+    медленнее 1.2 * target_latency - уменьшается до числа документов,
+    которое уложилось бы в target_latency. Если часть документов отклонена (429),
+    размер уменьшается вдвое: кластер перегружен. Размер остаётся в
+    пределах [min_size, max_size]. Экземпляр общий для потоков загрузчика.
+    """
+
+    def __init__(self, index: str, initial: int, min_size: int, max_size: int, target_latency: float, growth: float = 1.25) -> None:
+        self._index = index
+        self._min_size = max(1, min_size)
+        self._max_size = max(self._min_size, max_size)
+        self._target_latency = target_latency
+        self._growth = growth
+        self._lock = threading.Lock()
+        self.size = min(max(initial, self._min_size), self._max_size)
+        BULK_CHUNK_SIZE.set(self.size, index=self._index)
+
+    def observe(self, documents: int, latency: float, rejected: int = 0) -> int:
+        """Учесть ответ на bulk-запрос из documents документов; вернуть новый размер."""
+        with self._lock:
+            if rejected:
+                size = self.size / 2
+            elif latency > self._target_latency * 1.2:
+                size = min(self.size, documents * self._target_latency / latency)
+            elif latency < self._target_latency * 0.8 and documents >= self.size:
+                # неполный запрос (хвост пачки) не говорит, выдержит ли кластер больший
+                size = max(self.size + 1, self.size * self._growth)
+            else:
+                return self.size
+            self.size = int(min(max(size, self._min_size), self._max_size))
+            BULK_CHUNK_SIZE.set(self.size, index=self._index)
+            return self.size
@@ -0,0 +1,84 @@
+import threading
+import time
+from typing import Callable, Iterable
+from config import logger
+from extractor import BaseExtractor
+from transformer import BaseTransformer
+from loader import BaseLoader
+from metrics import timed_stage
+
+
+class ChangeBuffer:
+    """Общий буфер id изменённых фильмов с временным окном.
+
+    Все источники изменений (фильмы, жанры, персоны) складывают сюда id
+    фильмов; раз в window секунд накопленные id без повторов проходят
+    merge -> transform -> load, после чего вызываются колбэки источников
+    (сдвиг отметок modified). add() блокируется, пока в буфере больше
+    max_pending id, чтобы память не росла при массовых изменениях.
+    """
+
+    def __init__(self, extractor: BaseExtractor, transformer: BaseTransformer, loader: BaseLoader, window: float, fetch_size: int, max_pending: int) -> None:
+        self._extractor = extractor
+        self._transformer = transformer
+        self._loader = loader
+        self._window = window
+        self._fetch_size = fetch_size
+        self._max_pending = max_pending
+        self._cond = threading.Condition()
+        self._ids: set[str] = set()
+        self._callbacks: list[tuple[Callable, threading.Event]] = []
+        self.received = 0
+        self.flushed = 0
+
+    def add(self, film_ids: Iterable[str], on_flushed: Callable[[], None]) -> threading.Event:
+        """Добавить id; вернуть событие, которое выставится после загрузки этих id."""
+        flushed = threading.Event()
+        film_ids = list(film_ids)
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._ids) < self._max_pending)
+            self.received += len(film_ids)
+            self._ids.update(film_ids)
+            self._callbacks.append((on_flushed, flushed))
+        return flushed
+
+    def _load(self, ids: list[str]) -> None:
+        for i in range(0, len(ids), self._fetch_size):
+            chunk = ids[i:i + self._fetch_size]
+            with timed_stage('buffer', 'merge', len(chunk)):
+                rows = self._extractor.merge_ids(chunk)
+            if rows:
+                with timed_stage('buffer', 'transform', len(rows)):
+                    models = self._transformer.transform(rows)
+                with timed_stage('buffer', 'bulk', len(models)):
+                    self._loader.load_data(models)
+
+    def flush(self) -> None:
+        with self._cond:
+            ids, self._ids = self._ids, set()
+            callbacks, self._callbacks = self._callbacks, []
+        if not ids and not callbacks:
+            return
+        try:
+            self._load(list(ids))
+        except Exception as err:
+            logger.error(f'change buffer: flush of {len(ids)} films failed, retrying next window: {err}')
+            with self._cond:
+                self._ids |= ids
+                self._callbacks = callbacks + self._callbacks
+            return
+        for on_flushed, flushed in callbacks:
+            on_flushed()
+            flushed.set()
+        with self._cond:
+            self.flushed += len(ids)
+            self._cond.notify_all()
+        logger.debug(f'change buffer: flushed {len(ids)} films, {self.received - self.flushed} duplicates coalesced so far')
+
+    def run(self) -> None:
+        while True:
+            time.sleep(self._window)
+            self.flush()
+
+    def start(self) -> None:
+        threading.Thread(target=self.run, daemon=True).start()
@@ -13,17 +13,91 @@ dsn = {
     'password': os.getenv('POSTGRES_PASSWORD')
 }
 target_schema = os.getenv('TARGET_SCHEMA')
+pg_pool_min = int(os.getenv('PG_POOL_MIN', 1))
+pg_pool_max = int(os.getenv('PG_POOL_MAX', 8))
+pg_health_check_interval = float(os.getenv('PG_HEALTH_CHECK_INTERVAL', 30))
 fetch_size = int(os.getenv('FETCH_SIZE', 1000))
 fetch_timeout = int(os.getenv('FETCH_TIMEOUT'))
+schedule_min_interval = float(os.getenv('SCHEDULE_MIN_INTERVAL', 0.5))
+schedule_max_interval = float(os.getenv('SCHEDULE_MAX_INTERVAL', fetch_timeout))
+metrics_port = int(os.getenv('METRICS_PORT', 9108))
+inspect_probe_ttl = float(os.getenv('INSPECT_PROBE_TTL', 1))
+inspect_create_indexes = os.getenv('INSPECT_CREATE_INDEXES', 'false').lower() == 'true'
+# threads | async (asyncio with asyncpg and AsyncElasticsearch)
+etl_engine = os.getenv('ETL_ENGINE', 'threads')
+async_concurrency = int(os.getenv('ASYNC_CONCURRENCY', 8))
+stream_extract = os.getenv('STREAM_EXTRACT', 'true').lower() == 'true'
+# sequential | pipelined (pipelined always uses streaming extraction)
+execution_mode = os.getenv('EXECUTION_MODE', 'sequential')
+pipeline_queue_depth = int(os.getenv('PIPELINE_QUEUE_DEPTH', 4))
+# poll | notify (LISTEN/NOTIFY triggers from sql/change_capture.sql)
+change_capture = os.getenv('CHANGE_CAPTURE', 'poll')
+cdc_install_triggers = os.getenv('CDC_INSTALL_TRIGGERS', 'true').lower() == 'true'
+# 0 disables the shared change buffer
+coalesce_window = float(os.getenv('COALESCE_WINDOW', 0))
+coalesce_max_pending = int(os.getenv('COALESCE_MAX_PENDING', fetch_size * 10))
+
+# person and genre changes as partial update actions instead of full film documents
+partial_updates = os.getenv('PARTIAL_UPDATES', 'false').lower() == 'true'
+# genre and person names cached in memory: film merges read only film_work and link tables
+dimension_cache = os.getenv('DIMENSION_CACHE', 'false').lower() == 'true'
+dimension_cache_max_persons = int(os.getenv('DIMENSION_CACHE_MAX_PERSONS', 100000))
+
+# model | fast
+transformer_mode = os.getenv('TRANSFORMER', 'model')
+transformer_validate = os.getenv('TRANSFORMER_VALIDATE', 'false').lower() == 'true'
 
 #elasticsearch configuration
 elastic_host = os.getenv('ELASTIC_HOST')
 elastic_user = os.getenv('ELASTIC_USER')
 elastic_password = os.getenv('ELASTIC_PASSWORD')
+# serial | parallel | ndjson
+loader_mode = os.getenv('LOADER_MODE', 'serial')
+bulk_chunk_size = int(os.getenv('BULK_CHUNK_SIZE', fetch_size))
+bulk_max_chunk_bytes = int(os.getenv('BULK_MAX_CHUNK_BYTES', 10 * 1024 * 1024))
+bulk_thread_count = int(os.getenv('BULK_THREAD_COUNT', 4))
+bulk_queue_size = int(os.getenv('BULK_QUEUE_SIZE', 4))
+# ndjson loader: documents per bulk request follow the response latency within [min, max]
+bulk_adaptive = os.getenv('BULK_ADAPTIVE', 'true').lower() == 'true'
+bulk_target_latency = float(os.getenv('BULK_TARGET_LATENCY', 1.0))
+bulk_min_chunk_size = int(os.getenv('BULK_MIN_CHUNK_SIZE', 50))
+bulk_max_chunk_size = int(os.getenv('BULK_MAX_CHUNK_SIZE', bulk_chunk_size * 10))
+# documents rejected with 429 are sent again up to this many times
+bulk_max_retries = int(os.getenv('BULK_MAX_RETRIES', 8))
+bulk_retry_backoff = float(os.getenv('BULK_RETRY_BACKOFF', 0.5))
+es_schema_dir = os.getenv('ES_SCHEMA_DIR', '../es')
+index_alias = os.getenv('INDEX_ALIAS', 'movies')
+# indices filled from the same film rows in one pass: persons, genres
+extra_indices = [index.strip() for index in os.getenv('EXTRA_INDICES', '').split(',') if index.strip()]
+reindex_delete_old = os.getenv('REINDEX_DELETE_OLD', 'true').lower() == 'true'
 
 #logs and storage configuration
 logs_path = os.getenv('LOGS_PATH', './logs/etl.log')
 logging_level = os.getenv('LOGGING_LEVEL', 'DEBUG')
-logger = Logger(logs_path, logging_level)
+# text | json
+log_format = os.getenv('LOG_FORMAT', 'text')
+# per-category levels, e.g. "payload=DEBUG,batch=INFO"; payload dumps are OFF unless enabled here
+log_levels = {'payload': 'OFF'}
+log_levels.update((key.strip(), value.strip()) for key, value in (item.split('=', 1) for item in os.getenv('LOG_LEVELS', '').split(',') if '=' in item))
+# share of batches whose payload is dumped, and the size cap of one dump
+log_payload_sample = float(os.getenv('LOG_PAYLOAD_SAMPLE', 0.01))
+log_payload_max_items = int(os.getenv('LOG_PAYLOAD_MAX_ITEMS', 3))
+log_payload_max_chars = int(os.getenv('LOG_PAYLOAD_MAX_CHARS', 2000))
+log_queue_size = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+logger = Logger(logs_path, logging_level, log_format, log_levels, log_payload_sample, log_payload_max_items, log_payload_max_chars, log_queue_size)
 
-storage_path = os.getenv('STORAGE_PATH')
\ No newline at end of file
+storage_path = os.getenv('STORAGE_PATH')
+state_dir = os.path.dirname(storage_path or './state/file.json')
+# json | sqlite
+state_backend = os.getenv('STATE_BACKEND', 'json')
+state_sqlite_path = os.getenv('STATE_SQLITE_PATH', os.path.join(state_dir, 'state.sqlite3'))
+state_flush_interval = float(os.getenv('STATE_FLUSH_INTERVAL', 0))
+# documents refused by Elasticsearch are appended here; empty disables the spool
+dead_letter_path = os.getenv('DEAD_LETTER_PATH', os.path.join(state_dir, 'dead_letter.ndjson'))
+full_load_workers = int(os.getenv('FULL_LOAD_WORKERS', os.cpu_count() or 1))
+full_load_shards = int(os.getenv('FULL_LOAD_SHARDS', full_load_workers * 4))
+# copy (COPY ... TO STDOUT with a client-side merge join) | select (cursor and merge queries)
+full_load_extract = os.getenv('FULL_LOAD_EXTRACT', 'copy')
+full_load_state_path = os.getenv('FULL_LOAD_STATE_PATH', os.path.join(state_dir, 'full_load.json'))
+hash_cache_enabled = os.getenv('HASH_CACHE', 'false').lower() == 'true'
+hash_cache_path = os.getenv('HASH_CACHE_PATH', os.path.join(state_dir, 'doc_hashes.sqlite3'))
\ No newline at end of file
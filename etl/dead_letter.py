@@ -0,0 +1,129 @@
+import argparse
+import fcntl
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterable, Iterator
+import orjson
+from config import logger, dead_letter_path
+from metrics import counter
+
+DEAD_LETTERS = counter('etl_dead_letters_total', 'Documents Elasticsearch refused, written to the dead-letter spool')
+
+
+class DeadLetterSpool:
+    """Журнал документов, которые Elasticsearch не принял (ошибка маппинга, 429 после всех повторов).
+
+    Записи дописываются в конец файла NDJSON, по строке на документ: индекс,
+    id, действие (index/update), тело действия и ошибка. Пачка с такими
+    документами загружается без них и отметка modified сдвигается дальше;
+    отложенные документы пересобираются из Postgres через replay. Тело
+    хранится для разбора ошибок и не отправляется повторно.
+
+    Дописывание и забор журнала (take) выполняются под блокировкой файла
+    (flock на path + '.lock'), поэтому повтор можно запускать отдельным
+    процессом при работающем ETL.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._replay_path = path + '.replay'
+        self._lock_path = path + '.lock'
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(self._lock_path, 'ab') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def write(self, entries: Iterable[dict[str, any]]) -> None:
+        """Дописать записи {index, id, action, body, error}; пачка пишется одним вызовом write."""
+        entries = list(entries)
+        time = datetime.now(timezone.utc).isoformat()
+        lines = [orjson.dumps({'time': time, **entry}) + b'\n' for entry in entries]
+        if not lines:
+            return
+        with self._locked(), open(self.path, 'ab') as spool:
+            spool.write(b''.join(lines))
+        for entry in entries:
+            DEAD_LETTERS.inc(index=entry['index'])
+        logger.warning(f'dead letter: {len(lines)} documents spooled to {self.path}')
+
+    @contextmanager
+    def take(self) -> Iterator[list[dict[str, any]]]:
+        """Забрать записи для повтора.
+
+        Файл переименовывается, поэтому новые отказы во время повтора пишутся
+        в новый файл. Забранный файл (.replay) удаляется, только когда блок
+        with завершился без ошибки; незавершённый прошлый повтор забирается
+        следующим вызовом первым и повторяется целиком.
+        """
+        with self._locked():
+            if not os.path.exists(self._replay_path) and os.path.exists(self.path):
+                os.replace(self.path, self._replay_path)
+        if not os.path.exists(self._replay_path):
+            yield []
+            return
+        with open(self._replay_path, 'rb') as spool:
+            entries = [orjson.loads(line) for line in spool if line.strip()]
+        yield entries
+        os.remove(self._replay_path)
+
+
+def film_ids(entries: Iterable[dict[str, any]]) -> tuple[set[str], set[str]]:
+    """Фильмы, из строк которых пересобираются документы записей, и жанры, фильм которых ещё нужно найти.
+
+    Документ фильма пересобирается по своему id (и после отказа частичного
+    обновления тоже), документ персоны - по фильмам из параметров upsert,
+    документ жанра - по любому фильму жанра.
+    """
+    films, genres = set(), set()
+    for entry in entries:
+        if entry['index'] == 'persons':
+            films.update(film['id'] for film in entry['body']['script']['params']['films'])
+        elif entry['index'] == 'genres':
+            genres.add(entry['id'])
+        else:
+            films.add(entry['id'])
+    return films, genres
+
+
+def replay(spool: DeadLetterSpool, component) -> tuple[int, int]:
+    """Пересобрать отложенные документы из Postgres и загрузить их загрузчиком ETL (component - ETLComponent).
+
+    Содержимое берётся текущее, поэтому повтор не затирает документ, который
+    ETL уже проиндексировал заново; неизменившиеся документы отсекает кеш
+    хешей. Снова отклонённые документы возвращаются в журнал обычным путём
+    загрузчика. Возвращает число пересобранных фильмов и число фильмов,
+    которых в Postgres уже нет.
+    """
+    with spool.take() as entries:
+        films, genres = film_ids(entries)
+        if genres:
+            films.update(component.genre_film_ids(sorted(genres)))
+        found = component.reload_films(sorted(films))
+    return found, len(films) - found
+
+
+dead_letter = DeadLetterSpool(dead_letter_path) if dead_letter_path else None
+
+
+if __name__ == '__main__':
+    from config import dsn, elastic_host, fetch_size, fetch_timeout, pg_pool_min, pg_pool_max, pg_health_check_interval
+    from utils import elastic_client_context, pg_pool_context
+    from etl import ETLComponent
+    from state import State
+    from storage import MemoryStorage
+
+    argparse.ArgumentParser(description='Повторная загрузка документов из журнала отказов (DEAD_LETTER_PATH)').parse_args()
+    if dead_letter is None:
+        raise SystemExit('DEAD_LETTER_PATH is empty, the dead-letter spool is disabled')
+    with pg_pool_context(dsn, pg_pool_min, pg_pool_max, pg_health_check_interval) as pg_pool, elastic_client_context(elastic_host) as client:
+        # отметки modified основного ETL повтор не трогает
+        component = ETLComponent(pg_pool, client, State(MemoryStorage()), fetch_size, fetch_timeout)
+        rebuilt, missing = replay(dead_letter, component)
+    logger.info(f'dead letter replay: {rebuilt} films rebuilt, {missing} no longer exist')
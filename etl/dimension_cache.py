@@ -0,0 +1,123 @@
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from datetime import datetime
+from typing import Iterable
+from config import logger
+from utils import pg_backoff
+from pool import PGConnectionPool
+from metrics import counter
+
+DIMENSION_LOOKUPS = counter('etl_dimension_cache_lookups_total', 'Genre and person lookups in the dimension cache by result')
+
+
+class _Dimension:
+    """Записи одного справочника: id -> (значение, modified), LRU при max_size.
+
+    Изменённая запись заменяется «надгробием» (None, modified): значение,
+    прочитанное из Postgres раньше изменения (modified меньше), в кеш уже
+    не попадёт, даже если запрос, начатый до изменения, завершится позже.
+    """
+
+    def __init__(self, max_size: int | None = None) -> None:
+        self._entries: OrderedDict[str, tuple[str | None, datetime]] = OrderedDict()
+        self._max_size = max_size
+
+    def get(self, id: str) -> str | None:
+        entry = self._entries.get(id)
+        if entry is None or entry[0] is None:
+            return None
+        if self._max_size is not None:
+            self._entries.move_to_end(id)
+        return entry[0]
+
+    def put(self, id: str, value: str, modified: datetime) -> None:
+        current = self._entries.get(id)
+        if current is not None and current[1] > modified:
+            return
+        self._entries[id] = (value, modified)
+        if self._max_size is not None:
+            self._entries.move_to_end(id)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, id: str, modified: datetime | None) -> None:
+        if modified is None:
+            self._entries.pop(id, None)
+            return
+        current = self._entries.get(id)
+        if current is None or current[1] < modified:
+            self._entries[id] = (None, modified)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DimensionCache:
+    """Кеш справочников genre (целиком) и person (LRU на max_persons записей) в памяти процесса.
+
+    С ним merge фильмов читает из Postgres только строки film_work и таблицы
+    связей, а имена жанров и персон подставляет из кеша; промахи дочитываются
+    одним запросом по id. Воркеры жанров и персон сообщают об изменённых
+    записях (id, modified) через invalidate, поэтому устаревшие имена не
+    переживают ближайшую обработку изменений этих таблиц.
+    """
+
+    def __init__(self, pool: PGConnectionPool, max_persons: int) -> None:
+        self._pool = pool
+        self._lock = threading.Lock()
+        self._dimensions = {'genre': _Dimension(), 'person': _Dimension(max_persons)}
+        self._max_persons = max_persons
+
+    # столбец с именем записи по таблице справочника
+    name_columns = {'genre': 'name', 'person': 'full_name'}
+
+    def _query(self, table: str, condition: str = '') -> str:
+        return f'SELECT id, {self.name_columns[table]}, modified FROM content.{table}{condition}'
+
+    @pg_backoff()
+    def _fetch(self, query: str) -> list[dict[str, any]]:
+        with self._pool.connection() as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(query)
+            return cursor.fetchall()
+
+    def _store(self, table: str, rows: list[dict[str, any]]) -> dict[str, str]:
+        column = self.name_columns[table]
+        dimension = self._dimensions[table]
+        with self._lock:
+            for row in rows:
+                dimension.put(str(row['id']), row[column], row['modified'])
+        return {str(row['id']): row[column] for row in rows}
+
+    def warm(self) -> None:
+        """Загрузить все жанры и последние изменённые персоны (не больше max_persons)."""
+        self._store('genre', self._fetch(self._query('genre')))
+        self._store('person', self._fetch(self._query('person', f' ORDER BY modified DESC LIMIT {self._max_persons}')))
+        logger.info(f'dimension cache: warmed {len(self._dimensions["genre"])} genres, {len(self._dimensions["person"])} persons')
+
+    def names(self, table: str, ids: Iterable[str]) -> dict[str, str]:
+        """Имена записей справочника по id; промахи дочитываются из Postgres одним запросом."""
+        found, missing = {}, []
+        dimension = self._dimensions[table]
+        with self._lock:
+            for id in set(ids):
+                name = dimension.get(id)
+                if name is None:
+                    missing.append(id)
+                else:
+                    found[id] = name
+        DIMENSION_LOOKUPS.inc(len(found), dimension=table, result='hit')
+        if missing:
+            DIMENSION_LOOKUPS.inc(len(missing), dimension=table, result='miss')
+            ids_str = ','.join(f"'{id}'" for id in missing)
+            found.update(self._store(table, self._fetch(self._query(table, f' WHERE id IN ({ids_str})'))))
+        return found
+
+    def invalidate(self, table: str, rows: Iterable[tuple[str, str | datetime | None]]) -> None:
+        """Отметить изменённые записи (id, modified): следующее обращение перечитает их из Postgres."""
+        dimension = self._dimensions[table]
+        with self._lock:
+            for id, modified in rows:
+                if isinstance(modified, str):
+                    modified = datetime.fromisoformat(modified)
+                dimension.invalidate(str(id), modified)
@@ -1,13 +1,28 @@
 import abc
-from psycopg2.extensions import connection as _connection
 from elasticsearch import Elasticsearch
-from typing import Callable
-from loader import BaseLoader, Loader
+from typing import Callable, Iterator
+from loader import BaseLoader, Loader, ParallelLoader, NdjsonLoader
 from inspector import DBInspector
-from config import logger
-from extractor import BaseExtractor, PersonExtractor, FilmworkExtractor, GenreExtractor
-from transformer import BaseTransformer, Transformer
+from config import (logger, stream_extract, execution_mode, pipeline_queue_depth, loader_mode,
+                    bulk_chunk_size, bulk_max_chunk_bytes, bulk_thread_count, bulk_queue_size, index_alias,
+                    dsn, change_capture, cdc_install_triggers, coalesce_window, coalesce_max_pending,
+                    hash_cache_enabled, hash_cache_path, transformer_mode, transformer_validate,
+                    inspect_probe_ttl, inspect_create_indexes, schedule_min_interval, schedule_max_interval, partial_updates,
+                    extra_indices, bulk_adaptive, bulk_target_latency, bulk_min_chunk_size, bulk_max_chunk_size,
+                    dimension_cache, dimension_cache_max_persons)
+from extractor import Batch, BaseExtractor, PersonExtractor, FilmworkExtractor, GenreExtractor
+from dimension_cache import DimensionCache
+from transformer import BaseTransformer, Transformer, FastTransformer
 from state import State
+from pipeline import Pipeline
+from pool import PGConnectionPool
+from listener import ChangeListener, ChangeSet
+from change_buffer import ChangeBuffer
+from hash_cache import HashCache
+from scheduler import Schedule
+from metrics import LAG_SECONDS, timed_stage
+from bulk_sizing import AdaptiveChunkSize
+from sinks import Sink, SINK_TYPES, FanOutTransformer, FanOutLoader
 
 
 class BaseETLComponent(abc.ABC):
@@ -38,7 +53,7 @@ class BaseETLComponent(abc.ABC):
 
 
 import threading
-import time
+from functools import partial
 
 class ETLComponent(BaseETLComponent):
 
@@ -57,37 +72,215 @@ class ETLComponent(BaseETLComponent):
     @property
     def loader(self):
         return self._loader
-    def __init__(self, db_conn: _connection, client: Elasticsearch, state: State, fetch_size: int, fetch_timeout: int):
-        self._conn_inst = db_conn
+    def __init__(self, pool: PGConnectionPool, client: Elasticsearch, state: State, fetch_size: int, fetch_timeout: int):
+        self._pool = pool
         self._client = client
         self._state = state
         self._fetch_size = fetch_size
         self._fetch_timeout = fetch_timeout
-        self._db_inspector = DBInspector(self._conn_inst, self._state)
-        self._person_extractor = PersonExtractor(self._conn_inst, self._state, self._fetch_size)
-        self._genre_extractor = GenreExtractor(self._conn_inst, self._state, self._fetch_size)
-        self._filmwork_extractor = FilmworkExtractor(self._conn_inst, self._state, self._fetch_size)
-        self._transformer = Transformer()
-        self._loader = Loader(self._client, 'movies', self._fetch_size)
-
-    def _process_entity(self, inspector_method: Callable, extractor: BaseExtractor, transformer: BaseTransformer, loader: BaseLoader) -> None:
-        while True:
-            if inspector_method():
-                data = extractor.extract_data()
-                logger.debug(data)
-                models = transformer.transform(data)
-                loader.load_data(models)
-            time.sleep(self._fetch_timeout)
+        self._db_inspector = DBInspector(self._pool, self._state, inspect_probe_ttl)
+        self._dimensions = DimensionCache(self._pool, dimension_cache_max_persons) if dimension_cache else None
+        self._person_extractor = PersonExtractor(self._pool, self._state, self._fetch_size, self._dimensions)
+        self._genre_extractor = GenreExtractor(self._pool, self._state, self._fetch_size, self._dimensions)
+        self._filmwork_extractor = FilmworkExtractor(self._pool, self._state, self._fetch_size, self._dimensions)
+        self._transformer = FastTransformer(transformer_validate) if transformer_mode == 'fast' else Transformer()
+        self._hash_cache = HashCache(hash_cache_path) if hash_cache_enabled else None
+        self._loader = self._build_loader(index_alias, self._hash_cache)
+        if extra_indices:
+            sinks = self._build_sinks(extra_indices)
+            self._transformer = FanOutTransformer(self._transformer, sinks)
+            self._loader = FanOutLoader(self._loader, sinks)
+        self._listener = ChangeListener(dsn, self._pool) if change_capture == 'notify' else None
+        self._stop = threading.Event()
+        self.schedules: dict[str, Schedule] = {}
+        self._buffer = None
+        if coalesce_window > 0:
+            merger = FilmworkExtractor(self._pool, self._state, self._fetch_size, self._dimensions)
+            self._buffer = ChangeBuffer(merger, self._transformer, self._loader, coalesce_window, self._fetch_size, coalesce_max_pending)
+
+    def _build_loader(self, index: str, hash_cache: HashCache | None = None) -> BaseLoader:
+        if loader_mode == 'ndjson':
+            sizer = AdaptiveChunkSize(index, bulk_chunk_size, bulk_min_chunk_size, bulk_max_chunk_size, bulk_target_latency) if bulk_adaptive else None
+            return NdjsonLoader(self._client, index, bulk_chunk_size, bulk_thread_count, bulk_max_chunk_bytes, hash_cache, sizer)
+        if loader_mode == 'parallel':
+            return ParallelLoader(self._client, index, bulk_chunk_size, bulk_thread_count, bulk_max_chunk_bytes, bulk_queue_size, hash_cache)
+        return Loader(self._client, index, self._fetch_size, hash_cache)
+
+    def _build_sinks(self, indices: list[str]) -> list[Sink]:
+        """Дополнительные индексы fan-out; кеш хешей у них не используется: он ведётся по id фильмов."""
+        sinks = []
+        for index in indices:
+            if index not in SINK_TYPES:
+                raise ValueError(f'EXTRA_INDICES: unknown index {index!r}, expected one of {sorted(SINK_TYPES)}')
+            transformer_class, upsert = SINK_TYPES[index]
+            sinks.append(Sink(index, transformer_class(), self._build_loader(index), upsert))
+        return sinks
+
+    @staticmethod
+    def _inspect(inspector_method: Callable, extractor: BaseExtractor) -> str | None:
+        with timed_stage(extractor.entity, 'inspect'):
+            return inspector_method()
+
+    def _process_entity(self, schedule: Schedule, inspector_method: Callable, extractor: BaseExtractor, transformer: BaseTransformer, loader: BaseLoader) -> None:
+        while not self._stop.is_set():
+            processed = 0
+            if until := self._inspect(inspector_method, extractor):
+                if execution_mode == 'pipelined' or stream_extract or self._buffer is not None:
+                    processed = self._sync(extractor, transformer, loader, until=until)
+                else:
+                    batch = extractor.extract_data()
+                    logger.payload('extract', batch.rows, entity=extractor.entity, batch=batch.id)
+                    if batch.rows:
+                        models = transformer.transform(batch.rows)
+                        loader.load_data(models)
+                    extractor.commit(batch)
+                    processed = len(batch.rows)
+            self._stop.wait(schedule.next_delay(processed))
+
+    def _process_changes(self, changes: ChangeSet, inspector_method: Callable, extractor: BaseExtractor, transformer: BaseTransformer, loader: BaseLoader) -> None:
+        while not self._stop.is_set():
+            resync, changed = changes.wait(self._fetch_timeout)
+            if resync and (until := self._inspect(inspector_method, extractor)):
+                if self._sync(extractor, transformer, loader, until=until) >= self._fetch_size:
+                    # пачки были полными - догоняем дальше, не дожидаясь уведомлений
+                    changes.request_resync()
+            if changed:
+                logger.debug(f'{type(extractor).__name__}: {len(changed)} changed rows notified')
+                self._sync(extractor, transformer, loader, changed)
+
+    def _sync(self, extractor: BaseExtractor, transformer: BaseTransformer, loader: BaseLoader, changes: dict[str, str | None] | None = None, until: str | None = None) -> int:
+        """Обработать изменения по отметке modified (не дальше until) или, если переданы, конкретные изменённые записи.
+
+        Возвращает число обработанных фильмов.
+        """
+        if self._buffer is not None:
+            batches = extractor.iter_film_ids(until) if changes is None else extractor.iter_changed(changes)
+            return self._buffer_batches(batches, extractor)
+        if partial_updates and extractor.partial_updates:
+            batches = extractor.extract_updates(until) if changes is None else extractor.extract_changed_updates(changes)
+            return self._run_updates(batches, extractor, loader)
+        batches = extractor.extract_batches(until) if changes is None else extractor.extract_changed(changes)
+        return self._run_batches(batches, extractor, transformer, loader)
+
+    def _buffer_batches(self, batches: Iterator[Batch], extractor: BaseExtractor) -> int:
+        flushed, processed = None, 0
+        for batch in batches:
+            flushed = self._buffer.add([row['id'] for row in batch.rows], partial(extractor.commit, batch))
+            processed += len(batch.rows)
+            if self._stop.is_set():
+                break
+        if flushed is not None:
+            flushed.wait()
+        return processed
+
+    def _run_batches(self, batches: Iterator[Batch], extractor: BaseExtractor, transformer: BaseTransformer, loader: BaseLoader) -> int:
+        if execution_mode == 'pipelined':
+            return self._process_pipelined(batches, extractor, transformer, loader)
+        return self._process_stream(batches, extractor, transformer, loader)
+
+    def _process_stream(self, batches: Iterator[Batch], extractor: BaseExtractor, transformer: BaseTransformer, loader: BaseLoader) -> int:
+        processed = 0
+        for batch in batches:
+            if batch.rows:
+                logger.payload('extract', batch.rows, entity=extractor.entity, batch=batch.id)
+                with timed_stage(extractor.entity, 'transform', len(batch.rows)) as transform:
+                    models = transformer.transform(batch.rows)
+                with timed_stage(extractor.entity, 'bulk', len(models)) as load:
+                    loader.load_data(models)
+                logger.event('batch', 'batch loaded', entity=extractor.entity, batch=batch.id, rows=len(batch.rows),
+                             transform_seconds=round(transform.seconds, 4), bulk_seconds=round(load.seconds, 4))
+                processed += len(batch.rows)
+            extractor.commit(batch)
+            if self._stop.is_set():
+                break
+        return processed
+
+    def _run_updates(self, batches: Iterator[Batch], extractor: BaseExtractor, loader: BaseLoader) -> int:
+        processed = 0
+        for batch in batches:
+            if batch.rows:
+                with timed_stage(extractor.entity, 'bulk', len(batch.rows)) as load:
+                    loader.update_data(batch.rows)
+                logger.event('batch', 'batch updated', entity=extractor.entity, batch=batch.id, rows=len(batch.rows),
+                             bulk_seconds=round(load.seconds, 4))
+                processed += len(batch.rows)
+            extractor.commit(batch)
+            if self._stop.is_set():
+                break
+        return processed
+
+    def _until_stopped(self, batches: Iterator[Batch]) -> Iterator[Batch]:
+        """Пачки источника до запроса остановки; уже выбранные пачки конвейер догружает и фиксирует по порядку."""
+        for batch in batches:
+            yield batch
+            if self._stop.is_set():
+                return
+
+    def _process_pipelined(self, batches: Iterator[Batch], extractor: BaseExtractor, transformer: BaseTransformer, loader: BaseLoader) -> int:
+        def transform(batch):
+            if batch.rows:
+                with timed_stage(extractor.entity, 'transform', len(batch.rows)):
+                    batch.rows = transformer.transform(batch.rows)
+            return batch
+
+        def load(batch):
+            if batch.rows:
+                with timed_stage(extractor.entity, 'bulk', len(batch.rows)) as load:
+                    loader.load_data(batch.rows)
+                logger.event('batch', 'batch loaded', entity=extractor.entity, batch=batch.id, rows=len(batch.rows),
+                             bulk_seconds=round(load.seconds, 4))
+            extractor.commit(batch)
+
+        pipeline = Pipeline(type(extractor).__name__, pipeline_queue_depth, size=lambda batch: len(batch.rows))
+        pipeline.run(('extract', self._until_stopped(batches)), ('transform', transform), ('load', load))
+        return pipeline.stats[0].items
 
     def perform_etl(self) -> None:
-        threads = [
-            threading.Thread(target=self._process_entity, args=(self.db_inspector.inspect_filmwork, self._filmwork_extractor, self._transformer, self._loader)),
-            threading.Thread(target=self._process_entity, args=(self.db_inspector.inspect_genre, self._genre_extractor, self._transformer, self._loader)),
-            threading.Thread(target=self._process_entity, args=(self.db_inspector.inspect_person, self._person_extractor, self._transformer, self._loader)),
+        entities = [
+            ('film_work', self.db_inspector.inspect_filmwork, self._filmwork_extractor),
+            ('genre', self.db_inspector.inspect_genre, self._genre_extractor),
+            ('person', self.db_inspector.inspect_person, self._person_extractor),
         ]
+        threads = []
+        for name, inspector_method, extractor in entities:
+            LAG_SECONDS.set_function(extractor.lag, entity=name)
+        self.db_inspector.ensure_indexes(inspect_create_indexes)
+        if self._dimensions is not None:
+            self._dimensions.warm()
+        if self._buffer is not None:
+            self._buffer.start()
+        if self._listener is not None:
+            if cdc_install_triggers:
+                self._listener.install_triggers()
+            self._listener.start()
+            for name, inspector_method, extractor in entities:
+                threads.append(threading.Thread(target=self._process_changes, args=(self._listener.changes[name], inspector_method, extractor, self._transformer, self._loader)))
+        else:
+            for name, inspector_method, extractor in entities:
+                self.schedules[name] = Schedule(self._fetch_size, schedule_min_interval, schedule_max_interval)
+                threads.append(threading.Thread(target=self._process_entity, args=(self.schedules[name], inspector_method, extractor, self._transformer, self._loader)))
 
         for thread in threads:
             thread.start()
 
         for thread in threads:
             thread.join()
+        self._state.flush()
+        logger.info('ETL stopped')
+
+    def genre_film_ids(self, genre_ids: list[str]) -> list[str]:
+        return self._filmwork_extractor.genre_film_ids(genre_ids)
+
+    def reload_films(self, ids: list[str]) -> int:
+        """Пересобрать документы фильмов по id из Postgres и загрузить их, как при обычной обработке; вернуть число найденных фильмов."""
+        found = 0
+        for i in range(0, len(ids), self._fetch_size):
+            rows = self._filmwork_extractor.merge_ids(ids[i:i + self._fetch_size])
+            if rows:
+                self._loader.load_data(self._transformer.transform(rows))
+            found += len(rows)
+        return found
+
+    def stop(self) -> None:
+        """Попросить воркеры завершиться после текущей пачки."""
+        self._stop.set()
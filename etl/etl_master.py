@@ -1,19 +1,28 @@
 from storage import BaseStorage
 from state import State
+from config import state_flush_interval, etl_engine
 from etl import ETLComponent
+from pool import PGConnectionPool
 
 class ETLMaster:
     
     #
     # Perhaps it is good idea to delete all the self attributes
     #
-    def __init__(self, conn_inst, client, storage: BaseStorage, fetch_size: int, fetch_timeout):
-        self._conn_inst = conn_inst
+    def __init__(self, pool: PGConnectionPool, client, storage: BaseStorage, fetch_size: int, fetch_timeout):
+        self._pool = pool
         self._client = client
         self._storage = storage
-        self._state = State(self._storage)
+        self._state = State(self._storage, state_flush_interval)
         self._fetch_size = fetch_size
         self._fetch_timeout = fetch_timeout
-        self._etl = ETLComponent(self._conn_inst, self._client, self._state, self._fetch_size, self._fetch_timeout)
+        if etl_engine == 'async':
+            from async_etl import AsyncETLComponent
+            self._etl = AsyncETLComponent(self._state, self._fetch_size, self._fetch_timeout)
+        else:
+            self._etl = ETLComponent(self._pool, self._client, self._state, self._fetch_size, self._fetch_timeout)
     def run_etl(self):
-        self._etl.perform_etl()
\ No newline at end of file
+        self._etl.perform_etl()
+
+    def stop(self):
+        self._etl.stop()
\ No newline at end of file
@@ -1,15 +1,39 @@
 import abc
-from psycopg2.extensions import connection as _connection
+import itertools
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+from uuid import uuid4
 from contextlib import closing
-from state import State
+from state import State, MAX_ID
 from datetime import datetime
 from utils import pg_backoff
+from pool import PGConnectionPool
+from pg_copy import CopyStream
+from dimension_cache import DimensionCache
 from config import logger
+from metrics import timed_batches, timed_stage
+
+
+@dataclass
+class Batch:
+    """Пачка строк потоковой выгрузки.
+
+    checkpoint заполнен только у последней пачки, после обработки которой
+    можно сдвинуть отметку modified в состоянии; checkpoint_id - id
+    последней строки с этим modified (курсор (modified, id)), None -
+    обработаны все строки с этим modified.
+    """
+    rows: list[dict[str, any]]
+    checkpoint: str | None = None
+    checkpoint_id: str | None = None
+    # номер пачки в процессе, для логов
+    id: int = field(default_factory=itertools.count(1).__next__)
 
 
 class BaseExtractor(abc.ABC):   
     @abc.abstractmethod
-    def extract_data(self) -> dict[str, any]:
+    def extract_data(self) -> Batch:
+        """Все изменённые строки одной пачкой; курсор сдвигает commit(batch) после загрузки."""
         pass
 
     @abc.abstractmethod
@@ -24,30 +48,240 @@ class BaseExtractor(abc.ABC):
     def _get_time_modified(self):
         pass
 
+    @abc.abstractmethod
+    def extract_batches(self, until: str | None = None) -> Iterator[Batch]:
+        pass
+
+    @abc.abstractmethod
+    def extract_changed(self, changes: dict[str, str | None]) -> Iterator[Batch]:
+        pass
+
+    @abc.abstractmethod
+    def commit(self, batch: Batch) -> None:
+        pass
+
 
 class ExtractorComponent(BaseExtractor):
+    # изменение строки сущности затрагивает в документе фильма только её поля,
+    # и вместо полной пересборки документа можно отправить частичное обновление
+    partial_updates = False
+    # справочник, которым является таблица сущности: её изменения сбрасываются из кеша справочников
+    dimension = None
 
-    def __init__(self, conn_inst: _connection, state: State, fetch_size: int):
-        self._conn_inst = conn_inst
+    def __init__(self, pool: PGConnectionPool, state: State, fetch_size: int, dimensions: DimensionCache | None = None):
+        self._pool = pool
         self._state = state
         self._fetch_size = fetch_size
+        self._dimensions = dimensions
+
+    def _invalidate(self, changed: Iterable[tuple[str, any]]) -> None:
+        """Сбросить из кеша справочников изменённые записи (id, modified) сущности."""
+        if self._dimensions is not None and self.dimension is not None:
+            self._dimensions.invalidate(self.dimension, changed)
 
     def _fetch(self, query: str) -> list:
-        with closing(self._conn_inst.cursor()) as cursor:
+        with self._pool.connection() as conn, closing(conn.cursor()) as cursor:
             cursor.execute(query)
             data = list()
             while len(batch := cursor.fetchmany(self._fetch_size)):
                 data.extend(batch)
         return data
-    
+
+    def _stream(self, query: str) -> Iterator[list[dict[str, any]]]:
+        """Выполнить запрос на именованном (серверном) курсоре и отдавать строки пачками по fetch_size."""
+        cursor_name = f'{self.__class__.__name__.lower()}_{uuid4().hex}'
+        with self._pool.connection() as conn, closing(conn.cursor(name=cursor_name)) as cursor:
+            cursor.itersize = self._fetch_size
+            cursor.execute(query)
+            while len(batch := cursor.fetchmany(self._fetch_size)):
+                yield batch
+
+    @staticmethod
+    def _until(until: str | None) -> str:
+        return f' AND modified <= \'{until}\'' if until is not None else ''
+
+    @staticmethod
+    def _after(time_modified, last_id: str | None, alias: str = '') -> str:
+        """Условие keyset-курсора: строки после (modified, id) в порядке ORDER BY modified, id."""
+        return f'({alias}modified, {alias}id) > (\'{time_modified}\', \'{last_id or MAX_ID}\')'
+
+    def _resume_query(self, until: str | None = None) -> str:
+        """Запрос изменённых строк с места, на котором остановилась прошлая обработка."""
+        return self._changed_query(self._get_time_modified(), until, self._state.get_state(self.last_id_key_name))
+
+    @staticmethod
+    def _checkpoint(data: list[dict[str, any]]) -> tuple[str, str]:
+        return str(data[-1]['modified']), str(data[-1]['id'])
+
+    def _with_checkpoint(self, batches: Iterator[list[dict[str, any]]], checkpoint: str | None, checkpoint_id: str | None = None) -> Iterator[Batch]:
+        prev = None
+        for rows in batches:
+            if prev is not None:
+                yield Batch(prev)
+            prev = rows
+        yield Batch(prev or [], checkpoint, checkpoint_id)
+
+    def _iter_enriched(self, data: list[dict[str, any]]) -> Iterator[Batch]:
+        yield from self._with_checkpoint(timed_batches(self.entity, 'enrich', self._stream(self._enrich_query(data))), *self._checkpoint(data))
+
     @pg_backoff()
-    def _merge_data(self, data: list[dict[str, any]]) -> list[dict[str, any]]:
+    def iter_film_ids(self, until: str | None = None) -> Iterator[Batch]:
+        """Пачки id изменённых фильмов; until - верхняя граница modified, полученная от инспектора."""
+        for data in timed_batches(self.entity, 'extract', self._stream(self._resume_query(until))):
+            logger.debug(f'{self.time_modified_key_name} - iter_film_ids: recieved rows: {len(data)}')
+            self._invalidate((row['id'], row['modified']) for row in data)
+            yield from self._iter_enriched(data)
+
+    @pg_backoff()
+    def iter_changed(self, changes: dict[str, str | None]) -> Iterator[Batch]:
+        """Пачки id фильмов, затронутых изменением конкретных записей (id -> modified).
+
+        Отметка modified сдвигается только вперёд и только в последней, пустой пачке.
+        """
+        self._invalidate(changes.items())
+        data = [{'id': id} for id in changes]
+        for i in range(0, len(data), self._fetch_size):
+            yield from self._iter_enriched_ids(data[i:i + self._fetch_size])
+        yield Batch([], self._newer_checkpoint(changes.values()))
+
+    def _iter_enriched_ids(self, data: list[dict[str, any]]) -> Iterator[Batch]:
+        yield from self._with_checkpoint(timed_batches(self.entity, 'enrich', self._stream(self._enrich_query(data))), None)
+
+    def _newer_checkpoint(self, modified: Iterable[str | None]) -> str | None:
+        modified = [datetime.fromisoformat(value) for value in modified if value is not None]
+        if not modified:
+            return None
+        checkpoint = max(modified)
+        current = self._state.get_state(self.time_modified_key_name)
+        if current is not None and datetime.fromisoformat(current) >= checkpoint:
+            return None
+        return str(checkpoint)
+
+    def _merge_batches(self, batches: Iterator[Batch]) -> Iterator[Batch]:
+        for batch in batches:
+            if batch.rows:
+                with timed_stage(self.entity, 'merge', len(batch.rows)):
+                    batch.rows = self._merge_data(batch.rows)
+            yield batch
+
+    @pg_backoff()
+    def extract_batches(self, until: str | None = None) -> Iterator[Batch]:
+        yield from self._merge_batches(self.iter_film_ids(until))
+
+    @pg_backoff()
+    def extract_changed(self, changes: dict[str, str | None]) -> Iterator[Batch]:
+        yield from self._merge_batches(self.iter_changed(changes))
+
+    def _iter_patches(self, data: list[dict[str, any]]) -> Iterator[list[dict[str, any]]]:
+        # строки одного фильма не делятся между пачками: скрипт обновления персон убирает персону
+        # из ролей, которых нет в патче, и половина строк фильма удалила бы роли из другой половины
+        pending = []
+        for rows in timed_batches(self.entity, 'enrich', self._stream(self._updates_query(data))):
+            rows = pending + rows
+            split = len(rows)
+            while split and rows[split - 1]['film_work_id'] == rows[-1]['film_work_id']:
+                split -= 1
+            pending = rows[split:]
+            if split:
+                yield self._patches(rows[:split])
+        if pending:
+            yield self._patches(pending)
+
+    @pg_backoff()
+    def extract_updates(self, until: str | None = None) -> Iterator[Batch]:
+        """Пачки частичных обновлений документов фильмов (см. partial_updates) вместо полной сборки документов."""
+        for data in timed_batches(self.entity, 'extract', self._stream(self._resume_query(until))):
+            self._invalidate((row['id'], row['modified']) for row in data)
+            yield from self._with_checkpoint(self._iter_patches(data), *self._checkpoint(data))
+
+    @pg_backoff()
+    def extract_changed_updates(self, changes: dict[str, str | None]) -> Iterator[Batch]:
+        self._invalidate(changes.items())
+        data = [{'id': id} for id in changes]
+        for i in range(0, len(data), self._fetch_size):
+            for patches in self._iter_patches(data[i:i + self._fetch_size]):
+                yield Batch(patches)
+        yield Batch([], self._newer_checkpoint(changes.values()))
+
+    def merge_ids(self, ids: list[str]) -> list[dict[str, any]]:
+        return self._merge_data([{'id': id} for id in ids])
+
+    @pg_backoff()
+    def genre_film_ids(self, genre_ids: list[str]) -> list[str]:
+        """По одному фильму каждого жанра: документ жанра пересобирается из строки любого его фильма."""
+        genre_ids_str = ','.join([f"'{id}'" for id in genre_ids])
+        rows = self._fetch(f'SELECT DISTINCT ON (genre_id) film_work_id FROM content.genre_film_work WHERE genre_id IN ({genre_ids_str}) ORDER BY genre_id')
+        return [str(row['film_work_id']) for row in rows]
+
+    def commit(self, batch: Batch) -> None:
+        """Сдвинуть курсор (modified, id); вызывается после того, как Elasticsearch принял пачку."""
+        if batch.checkpoint is not None:
+            self._state.set_states({self.time_modified_key_name: batch.checkpoint, self.last_id_key_name: batch.checkpoint_id})
+
+    def lag(self) -> float | None:
+        """Секунд от последней сохранённой отметки modified до текущего момента."""
+        checkpoint = self._state.get_state(self.time_modified_key_name)
+        if checkpoint is None:
+            return None
+        checkpoint = datetime.fromisoformat(checkpoint)
+        now = datetime.now(checkpoint.tzinfo)
+        return (now - checkpoint).total_seconds()
+
+    @staticmethod
+    def _merge_films_query(data: list[dict[str, any]]) -> str:
+        filmwork_ids_str = ','.join([f"'{row['id']}'" for row in data])
+        return f"SELECT fw.id as film_work_id, fw.title, fw.description, fw.rating, fw.type, fw.created, fw.modified, array_agg(DISTINCT g.name) as genres, COALESCE (json_agg(DISTINCT jsonb_build_object('genre_id', g.id, 'genre_name', g.name)) FILTER (WHERE g.id is not null),'[]') as genres_list FROM content.film_work fw LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id LEFT JOIN content.genre g ON g.id = gfw.genre_id WHERE fw.id IN ({filmwork_ids_str}) GROUP BY fw.id"
+
+    @staticmethod
+    def _merge_persons_query(data: list[dict[str, any]]) -> str:
+        filmwork_ids_str = ','.join([f"'{row['id']}'" for row in data])
+        return f"SELECT fw.id as film_work_id, COALESCE (json_agg(DISTINCT jsonb_build_object('person_role', pfw.role,'person_id', p.id,'person_name', p.full_name)) FILTER (WHERE p.id is not null),'[]') as persons FROM content.film_work fw LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id LEFT JOIN content.person p ON p.id = pfw.person_id WHERE fw.id IN ({filmwork_ids_str}) GROUP BY fw.id"
+
+    @staticmethod
+    def _films_query(data: list[dict[str, any]]) -> str:
         filmwork_ids_str = ','.join([f"'{row['id']}'" for row in data])
-        query = f'SELECT fw.id as film_work_id, fw.title, fw.description, fw.rating, fw.type, fw.created, fw.modified, array_agg(DISTINCT g.name) as genres FROM content.film_work fw LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id LEFT JOIN content.genre g ON g.id = gfw.genre_id WHERE fw.id IN ({filmwork_ids_str}) GROUP BY fw.id'        
-        data = self._fetch(query)
+        return f'SELECT fw.id as film_work_id, fw.title, fw.description, fw.rating, fw.type, fw.created, fw.modified FROM content.film_work fw WHERE fw.id IN ({filmwork_ids_str})'
+
+    @staticmethod
+    def _links_query(data: list[dict[str, any]]) -> str:
+        filmwork_ids_str = ','.join([f"'{row['id']}'" for row in data])
+        return (f"SELECT film_work_id, 'genre' AS dimension, genre_id AS id, NULL AS role FROM content.genre_film_work WHERE film_work_id IN ({filmwork_ids_str}) "
+                f"UNION ALL SELECT film_work_id, 'person', person_id, role FROM content.person_film_work WHERE film_work_id IN ({filmwork_ids_str})")
+
+    @pg_backoff()
+    def _merge_cached(self, data: list[dict[str, any]]) -> list[dict[str, any]]:
+        """merge через кеш справочников: из Postgres читаются только фильмы и связи, строки те же, что у merge-запросов."""
+        films = self._fetch(self._films_query(data))
+        links = self._fetch(self._links_query(data))
+        names = {table: self._dimensions.names(table, [str(link['id']) for link in links if link['dimension'] == table]) for table in ('genre', 'person')}
+        genres, persons = {}, {}
+        for link in links:
+            film_id, id = str(link['film_work_id']), str(link['id'])
+            name = names[link['dimension']].get(id)
+            if name is None:
+                # запись справочника удалена после чтения связей
+                continue
+            if link['dimension'] == 'genre':
+                genres.setdefault(film_id, {})[id] = name
+            else:
+                persons.setdefault(film_id, {})[(link['role'], id)] = name
+        for row in films:
+            film_genres = genres.get(str(row['film_work_id']), {})
+            row['genres'] = sorted(set(film_genres.values())) or [None]
+            row['genres_list'] = [{'genre_id': id, 'genre_name': name} for id, name in film_genres.items()]
+            row['persons'] = [{'person_role': role, 'person_id': id, 'person_name': name}
+                              for (role, id), name in persons.get(str(row['film_work_id']), {}).items()]
+        logger.debug(f'film_work - merge_cached: recieved rows: {len(films)}, links: {len(links)}')
+        return films
+
+    @pg_backoff()
+    def _merge_data(self, data: list[dict[str, any]]) -> list[dict[str, any]]:
+        if self._dimensions is not None:
+            return self._merge_cached(data)
+        persons_query = self._merge_persons_query(data)
+        data = self._fetch(self._merge_films_query(data))
         logger.debug(f'film_work - merge_data: recieved rows: {len(data)}')
-        query = f"SELECT fw.id as film_work_id, COALESCE (json_agg(DISTINCT jsonb_build_object('person_role', pfw.role,'person_id', p.id,'person_name', p.full_name)) FILTER (WHERE p.id is not null),'[]') as persons FROM content.film_work fw LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id LEFT JOIN content.person p ON p.id = pfw.person_id WHERE fw.id IN ({filmwork_ids_str}) GROUP BY fw.id"
-        persons_data = self._fetch(query)
+        persons_data = self._fetch(persons_query)
         persons_data_dict = {row['film_work_id']: row['persons'] for row in persons_data}
         for row in data:
             row['persons'] = persons_data_dict[row['film_work_id']]
@@ -57,7 +291,11 @@ class ExtractorComponent(BaseExtractor):
 
 class PersonExtractor(ExtractorComponent):
 
+    entity = 'person'
+    partial_updates = True
+    dimension = 'person'
     time_modified_key_name = 'person_time_modified'
+    last_id_key_name = 'person_last_id'
 
     def _get_time_modified(self):
         time_modified = self._state.get_state(self.time_modified_key_name)
@@ -65,25 +303,41 @@ class PersonExtractor(ExtractorComponent):
             time_modified = datetime.min
         return time_modified
     
-    def __init__(self, conn_inst: _connection, state: State, fetch_size: int):
-        super().__init__(conn_inst, state, fetch_size)
+    def __init__(self, pool: PGConnectionPool, state: State, fetch_size: int, dimensions: DimensionCache | None = None):
+        super().__init__(pool, state, fetch_size, dimensions)
 
     @pg_backoff()
-    def extract_data(self) -> list[dict[str, any]]:
-        time_modified = self._get_time_modified()
-        query = f'SELECT id, modified FROM content.person WHERE modified > \'{time_modified}\' ORDER BY modified'
-        data = self._fetch(query)
+    def extract_data(self) -> Batch:
+        data = self._fetch(self._resume_query())
         logger.debug(f'person – extract_data: recieved rows: {len(data)}')
+        if not data:
+            return Batch([])
+        self._invalidate((row['id'], row['modified']) for row in data)
         enriched_data = self._enrich_data(data)
-        filmwork_data = self._merge_data(enriched_data)
-        self._state.set_state(self.time_modified_key_name, str(data[-1]['modified']))
-        return filmwork_data
+        return Batch(self._merge_data(enriched_data), *self._checkpoint(data))
     
+    def _changed_query(self, time_modified, until: str | None = None, last_id: str | None = None) -> str:
+        return f'SELECT id, modified FROM content.person WHERE {self._after(time_modified, last_id)}{self._until(until)} ORDER BY modified, id'
+
+    def _enrich_query(self, data: list[dict[str, any]]) -> str:
+        person_ids_str = ','.join([f"'{row['id']}'" for row in data])
+        return f'SELECT DISTINCT fw.id, fw.modified FROM content.film_work fw LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id WHERE pfw.person_id IN ({person_ids_str}) ORDER BY fw.modified'
+
+    def _updates_query(self, data: list[dict[str, any]]) -> str:
+        person_ids_str = ','.join([f"'{row['id']}'" for row in data])
+        return f'SELECT pfw.film_work_id, pfw.role, p.id AS person_id, p.full_name FROM content.person_film_work pfw JOIN content.person p ON p.id = pfw.person_id WHERE pfw.person_id IN ({person_ids_str}) ORDER BY pfw.film_work_id'
+
+    @staticmethod
+    def _patches(rows: list[dict[str, any]]) -> list[dict[str, any]]:
+        """Персоны фильма с актуальными именами: {'id': film_id, 'people': [{'id', 'name', 'role'}]}."""
+        people = {}
+        for row in rows:
+            people.setdefault(str(row['film_work_id']), []).append({'id': str(row['person_id']), 'name': row['full_name'], 'role': row['role']})
+        return [{'id': film_id, 'people': film_people} for film_id, film_people in people.items()]
+
     @pg_backoff()
     def _enrich_data(self, data: list[dict[str, any]]) -> list[dict[str, any]]:
-        person_ids_str = ','.join([f"'{row['id']}'" for row in data])
-        query = f'SELECT DISTINCT fw.id, fw.modified FROM content.film_work fw LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id WHERE pfw.person_id IN ({person_ids_str}) ORDER BY fw.modified'
-        data = self._fetch(query)
+        data = self._fetch(self._enrich_query(data))
         logger.debug(f'person – enrich_data: recieved rows: {len(data)}')
         return data
     
@@ -93,7 +347,9 @@ class PersonExtractor(ExtractorComponent):
 
 class FilmworkExtractor(ExtractorComponent):
 
+    entity = 'film_work'
     time_modified_key_name = 'filmwork_time_modified'
+    last_id_key_name = 'filmwork_last_id'
 
     def _get_time_modified(self):
         time_modified = self._state.get_state(self.time_modified_key_name)
@@ -101,27 +357,139 @@ class FilmworkExtractor(ExtractorComponent):
             time_modified = datetime(1970, 1, 1)
         return time_modified
     
-    def __init__(self, conn_inst: _connection, state: State, fetch_size: int):
-        super().__init__(conn_inst, state, fetch_size)
+    def __init__(self, pool: PGConnectionPool, state: State, fetch_size: int, dimensions: DimensionCache | None = None):
+        super().__init__(pool, state, fetch_size, dimensions)
 
     @pg_backoff()
-    def extract_data(self) -> list[dict[str, any]]:
-        time_modified = self._get_time_modified()
-        query = f'SELECT fw.id, fw.modified FROM content.film_work fw WHERE modified > \'{time_modified}\' ORDER BY modified'
-        data = self._fetch(query)
+    def extract_data(self) -> Batch:
+        data = self._fetch(self._resume_query())
         logger.debug(f'film_work - extract_data: recieved rows: {len(data)}')
-        filmwork_data = self._merge_data(data)
-        self._state.set_state(self.time_modified_key_name, str(data[-1]['modified']))
-        return filmwork_data
+        if not data:
+            return Batch([])
+        return Batch(self._merge_data(data), *self._checkpoint(data))
     
+    def _changed_query(self, time_modified, until: str | None = None, last_id: str | None = None) -> str:
+        return f'SELECT fw.id, fw.modified FROM content.film_work fw WHERE {self._after(time_modified, last_id, "fw.")}{self._until(until)} ORDER BY fw.modified, fw.id'
+
+    def _iter_enriched(self, data: list[dict[str, any]]) -> Iterator[Batch]:
+        yield Batch(data, *self._checkpoint(data))
+
+    def _iter_enriched_ids(self, data: list[dict[str, any]]) -> Iterator[Batch]:
+        yield Batch(data)
+
     def _enrich_data(self, data: list[dict[str, any]]) -> list[dict[str, any]]:
         return super()._enrich_data(data)
     
     
 
+class FilmworkShardExtractor(FilmworkExtractor):
+    """Выгрузка фильмов с id из диапазона [lower, upper) для шардированной полной загрузки.
+
+    Отметка modified не используется: шард загружается целиком, учёт
+    загруженных шардов ведёт координатор.
+    """
+
+    @staticmethod
+    def _shard_query(lower: str, upper: str | None) -> str:
+        upper_condition = f' AND fw.id < \'{upper}\'' if upper is not None else ''
+        return f'SELECT fw.id FROM content.film_work fw WHERE fw.id >= \'{lower}\'{upper_condition} ORDER BY fw.id'
+
+    @pg_backoff()
+    def extract_shard(self, lower: str, upper: str | None) -> Iterator[Batch]:
+        for data in timed_batches(self.entity, 'extract', self._stream(self._shard_query(lower, upper))):
+            with timed_stage(self.entity, 'merge', len(data)):
+                yield Batch(self._merge_data(data))
+
+
+class _LinkGroups:
+    """Строки таблицы связей, отсортированные по film_work_id, сгруппированные по фильму."""
+
+    def __init__(self, rows: Iterable[list[str | None]]) -> None:
+        self._groups = itertools.groupby(rows, key=lambda row: row[0])
+        self._advance()
+
+    def _advance(self) -> None:
+        self._id, self._rows = next(self._groups, (None, None))
+
+    def take(self, film_id: str) -> list[list[str | None]]:
+        """Строки фильма film_id; фильмы должны запрашиваться по возрастанию id."""
+        while self._id is not None and self._id < film_id:
+            self._advance()
+        if self._id != film_id:
+            return []
+        rows = list(self._rows)
+        self._advance()
+        return rows
+
+
+class CopyShardExtractor(FilmworkShardExtractor):
+    """Выгрузка шарда фильмов через COPY (...) TO STDOUT вместо курсора и merge-запросов с IN (...).
+
+    film_work и таблицы связей (с именами жанров и персон) выгружаются тремя
+    параллельными COPY в порядке film_work_id и соединяются на стороне
+    клиента слиянием отсортированных потоков. Строки те же, что у _merge_data.
+    Нужно три подключения пула.
+    """
+
+    @staticmethod
+    def _range(column: str, lower: str, upper: str | None) -> str:
+        upper_condition = f' AND {column} < \'{upper}\'' if upper is not None else ''
+        return f'WHERE {column} >= \'{lower}\'{upper_condition} ORDER BY {column}'
+
+    def _copy_queries(self, lower: str, upper: str | None) -> tuple[str, str, str]:
+        films = ('SELECT fw.id, fw.title, fw.description, fw.rating, fw.type, fw.created, fw.modified FROM content.film_work fw '
+                 + self._range('fw.id', lower, upper))
+        genres = ('SELECT gfw.film_work_id, g.id, g.name FROM content.genre_film_work gfw JOIN content.genre g ON g.id = gfw.genre_id '
+                  + self._range('gfw.film_work_id', lower, upper))
+        persons = ('SELECT pfw.film_work_id, pfw.role, p.id, p.full_name FROM content.person_film_work pfw JOIN content.person p ON p.id = pfw.person_id '
+                   + self._range('pfw.film_work_id', lower, upper))
+        return films, genres, persons
+
+    @staticmethod
+    def _film_row(film: list[str | None], genre_rows: list[list[str | None]], person_rows: list[list[str | None]]) -> dict[str, any]:
+        id, title, description, rating, type, created, modified = film
+        film_genres = {genre_id: name for _, genre_id, name in genre_rows}
+        return {
+            'film_work_id': id,
+            'title': title,
+            'description': description,
+            'rating': float(rating) if rating is not None else None,
+            'type': type,
+            'created': datetime.fromisoformat(created) if created is not None else None,
+            'modified': datetime.fromisoformat(modified) if modified is not None else None,
+            'genres': sorted(set(film_genres.values())) or [None],
+            'genres_list': [{'genre_id': genre_id, 'genre_name': name} for genre_id, name in film_genres.items()],
+            'persons': [{'person_role': role, 'person_id': person_id, 'person_name': name}
+                        for role, person_id, name in dict.fromkeys((role, person_id, name) for _, role, person_id, name in person_rows)],
+        }
+
+    def _rows(self, lower: str, upper: str | None) -> Iterator[list[dict[str, any]]]:
+        films_query, genres_query, persons_query = self._copy_queries(lower, upper)
+        with CopyStream(self._pool, films_query) as films, CopyStream(self._pool, genres_query) as genres, \
+                CopyStream(self._pool, persons_query) as persons:
+            genre_groups, person_groups = _LinkGroups(genres), _LinkGroups(persons)
+            batch = []
+            for film in films:
+                batch.append(self._film_row(film, genre_groups.take(film[0]), person_groups.take(film[0])))
+                if len(batch) == self._fetch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+    @pg_backoff()
+    def extract_shard(self, lower: str, upper: str | None) -> Iterator[Batch]:
+        for rows in timed_batches(self.entity, 'extract', self._rows(lower, upper)):
+            yield Batch(rows)
+
+
 class GenreExtractor(ExtractorComponent):
 
+    entity = 'genre'
+    partial_updates = True
+    dimension = 'genre'
     time_modified_key_name = 'genre_time_modified'
+    last_id_key_name = 'genre_last_id'
 
     def _get_time_modified(self):
         time_modified = self._state.get_state(self.time_modified_key_name)
@@ -129,25 +497,38 @@ class GenreExtractor(ExtractorComponent):
             time_modified = datetime(1970, 1, 1)
         return time_modified
     
-    def __init__(self, conn_inst: _connection, state: State, fetch_size: int):
-        super().__init__(conn_inst, state, fetch_size)
+    def __init__(self, pool: PGConnectionPool, state: State, fetch_size: int, dimensions: DimensionCache | None = None):
+        super().__init__(pool, state, fetch_size, dimensions)
 
     @pg_backoff()
-    def extract_data(self) -> list[dict[str, any]]:
-        time_modified = self._get_time_modified()
-        query = f'SELECT g.id, g.modified FROM content.genre g WHERE modified > \'{time_modified}\' ORDER BY modified'
-        data = self._fetch(query)
-        logger.debug(f'genre - extract_data: recieved rows: {len(data)}')
+    def extract_data(self) -> Batch:
+        data = self._fetch(self._resume_query())
+        logger.debug(f'genre – extract_data: recieved rows: {len(data)}')
+        if not data:
+            return Batch([])
+        self._invalidate((row['id'], row['modified']) for row in data)
         enriched_data = self._enrich_data(data)
-        filmwork_data = self._merge_data(enriched_data)
-        self._state.set_state(self.time_modified_key_name, str(data[-1]['modified']))
-        return filmwork_data
+        return Batch(self._merge_data(enriched_data), *self._checkpoint(data))
     
+    def _changed_query(self, time_modified, until: str | None = None, last_id: str | None = None) -> str:
+        return f'SELECT g.id, g.modified FROM content.genre g WHERE {self._after(time_modified, last_id, "g.")}{self._until(until)} ORDER BY g.modified, g.id'
+
+    def _enrich_query(self, data: list[dict[str, any]]) -> str:
+        genre_ids_str = ','.join([f"'{row['id']}'" for row in data])
+        return f'SELECT DISTINCT fw.id, fw.modified FROM content.film_work fw LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id WHERE gfw.genre_id IN ({genre_ids_str}) ORDER BY fw.modified'
+
+    def _updates_query(self, data: list[dict[str, any]]) -> str:
+        genre_ids_str = ','.join([f"'{row['id']}'" for row in data])
+        return f"SELECT gfw.film_work_id, array_agg(DISTINCT g.name) AS genres, json_agg(DISTINCT jsonb_build_object('genre_id', g.id, 'genre_name', g.name)) AS genres_list FROM content.genre_film_work gfw JOIN content.genre g ON g.id = gfw.genre_id WHERE gfw.film_work_id IN (SELECT film_work_id FROM content.genre_film_work WHERE genre_id IN ({genre_ids_str})) GROUP BY gfw.film_work_id ORDER BY gfw.film_work_id"
+
+    @staticmethod
+    def _patches(rows: list[dict[str, any]]) -> list[dict[str, any]]:
+        """Полный список жанров фильма: {'id': film_id, 'genres': [...], 'genres_list': [{'genre_id', 'genre_name'}]}."""
+        return [{'id': str(row['film_work_id']), 'genres': row['genres'], 'genres_list': row['genres_list']} for row in rows]
+
     @pg_backoff()
     def _enrich_data(self, data: list[dict[str, any]]) -> list[dict[str, any]]:
-        genre_ids_str = ','.join([f"'{row['id']}'" for row in data])
-        query = f'SELECT DISTINCT fw.id, fw.modified FROM content.film_work fw LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id WHERE gfw.genre_id IN ({genre_ids_str}) ORDER BY fw.modified'
-        data = self._fetch(query)
+        data = self._fetch(self._enrich_query(data))
         logger.debug(f'genre – enrich_data: recieved rows: {len(data)}')
         return data
     
@@ -0,0 +1,148 @@
+import argparse
+import signal
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from elasticsearch import Elasticsearch
+from config import (logger, dsn, elastic_host, fetch_size, pg_pool_min, pg_pool_max, pg_health_check_interval,
+                    index_alias, bulk_chunk_size, bulk_max_chunk_bytes, bulk_thread_count,
+                    transformer_mode, transformer_validate, storage_path, state_backend, state_sqlite_path,
+                    full_load_workers, full_load_shards, full_load_state_path, full_load_extract,
+                    bulk_adaptive, bulk_target_latency, bulk_min_chunk_size, bulk_max_chunk_size)
+from utils import pg_pool_context
+from extractor import FilmworkExtractor, FilmworkShardExtractor, CopyShardExtractor, GenreExtractor, PersonExtractor
+from transformer import BaseTransformer, Transformer, FastTransformer
+from loader import BaseLoader, NdjsonLoader
+from storage import JsonFileStorage, MemoryStorage, SqliteStorage
+from state import State
+from pool import PGConnectionPool
+from metrics import timed_stage
+from reindex import Clock
+from bulk_sizing import AdaptiveChunkSize
+
+
+class ShardCoordinator:
+    """Учёт шардов полной загрузки.
+
+    film_work делится на shards диапазонов id равной ширины (для случайных
+    UUID это примерно равные по числу строк части). Номера загруженных
+    шардов и время начала загрузки сохраняются в отдельном файле состояния,
+    поэтому прерванная загрузка продолжается с незагруженных шардов.
+    """
+
+    # ключи состояния одной загрузки
+    keys = ('shards', 'started', 'done')
+
+    def __init__(self, state: State, shards: int, restart: bool = False) -> None:
+        self._state = state
+        if restart:
+            self.reset()
+        saved = self._state.get_state('shards')
+        if saved is not None and saved != shards:
+            logger.warning(f'full load: resuming a run split into {saved} shards, ignoring shards={shards}')
+        self.shards = saved or shards
+        self._state.set_state('shards', self.shards)
+
+    @property
+    def started(self) -> str | None:
+        return self._state.get_state('started')
+
+    @started.setter
+    def started(self, value: str) -> None:
+        self._state.set_state('started', value)
+
+    def bounds(self, shard: int) -> tuple[str, str | None]:
+        """Границы id шарда: [lower, upper), у последнего шарда верхней границы нет."""
+        lower = str(uuid.UUID(int=(1 << 128) * shard // self.shards))
+        upper = str(uuid.UUID(int=(1 << 128) * (shard + 1) // self.shards)) if shard + 1 < self.shards else None
+        return lower, upper
+
+    def pending(self) -> list[int]:
+        done = set(self._state.get_state('done') or [])
+        return [shard for shard in range(self.shards) if shard not in done]
+
+    def mark_done(self, shard: int) -> None:
+        self._state.set_state('done', sorted(set(self._state.get_state('done') or []) | {shard}))
+
+    def reset(self) -> None:
+        """Забыть загрузку: сбросить её ключи через State, чтобы отложенный flush не вернул старые значения."""
+        self._state.set_states(dict.fromkeys(self.keys))
+        self._state.flush()
+
+    def finish(self) -> None:
+        """Забыть завершённую загрузку: следующий запуск начнёт новую."""
+        self.reset()
+
+
+_worker: tuple[FilmworkShardExtractor, BaseTransformer, BaseLoader] | None = None
+
+
+def _init_worker() -> None:
+    """Подключения процесса-воркера: свой Postgres, свой клиент Elasticsearch."""
+    global _worker
+    # Ctrl+C обрабатывает координатор, воркеры останавливаются через shutdown пула
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # COPY-выгрузка читает film_work и обе таблицы связей одновременно
+    pool = PGConnectionPool(dsn, 1, 3 if full_load_extract == 'copy' else 1, pg_health_check_interval)
+    client = Elasticsearch(elastic_host)
+    transformer = FastTransformer(transformer_validate) if transformer_mode == 'fast' else Transformer()
+    sizer = AdaptiveChunkSize(index_alias, bulk_chunk_size, bulk_min_chunk_size, bulk_max_chunk_size, bulk_target_latency) if bulk_adaptive else None
+    loader = NdjsonLoader(client, index_alias, bulk_chunk_size, bulk_thread_count, bulk_max_chunk_bytes, sizer=sizer)
+    extractor_class = CopyShardExtractor if full_load_extract == 'copy' else FilmworkShardExtractor
+    _worker = extractor_class(pool, State(MemoryStorage()), fetch_size), transformer, loader
+
+
+def _load_shard(shard: int, lower: str, upper: str | None) -> tuple[int, int]:
+    extractor, transformer, loader = _worker
+    written = loader.written
+    for batch in extractor.extract_shard(lower, upper):
+        if batch.rows:
+            with timed_stage('film_work', 'transform', len(batch.rows)):
+                models = transformer.transform(batch.rows)
+            with timed_stage('film_work', 'bulk', len(models)):
+                loader.load_data(models)
+    return shard, loader.written - written
+
+
+def full_load(pg_pool: PGConnectionPool, workers: int, shards: int, restart: bool = False) -> None:
+    """Полная загрузка фильмов в INDEX_ALIAS пулом процессов с продолжением по шардам.
+
+    По завершении отметки modified основного ETL выставляются на время
+    начала загрузки, и изменения, сделанные во время неё, догрузит ETL.
+    """
+    coordinator = ShardCoordinator(State(JsonFileStorage(full_load_state_path)), shards, restart)
+    if coordinator.started is None:
+        coordinator.started = Clock(pg_pool).now()
+    pending = coordinator.pending()
+    logger.info(f'full load: {len(pending)} of {coordinator.shards} shards to load with {workers} workers, started at {coordinator.started}')
+
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = [executor.submit(_load_shard, shard, *coordinator.bounds(shard)) for shard in pending]
+        try:
+            for future in as_completed(futures):
+                shard, written = future.result()
+                coordinator.mark_done(shard)
+                total += written
+                logger.info(f'full load: shard {shard} done, {written} documents, {len(coordinator.pending())} shards left')
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            logger.error(f'full load: interrupted, {len(coordinator.pending())} shards left; run again to resume')
+            raise
+
+    storage = SqliteStorage(state_sqlite_path) if state_backend == 'sqlite' else JsonFileStorage(storage_path)
+    state = State(storage)
+    for extractor in (FilmworkExtractor, GenreExtractor, PersonExtractor):
+        state.set_states({extractor.time_modified_key_name: coordinator.started, extractor.last_id_key_name: None})
+    state.flush()
+    coordinator.finish()
+    logger.info(f'full load: done, {total} documents in this run; ETL continues from {coordinator.started}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Шардированная полная загрузка фильмов в несколько процессов')
+    parser.add_argument('--workers', type=int, default=full_load_workers)
+    parser.add_argument('--shards', type=int, default=full_load_shards)
+    parser.add_argument('--restart', action='store_true', help='забыть загруженные шарды и начать заново')
+    args = parser.parse_args()
+    with pg_pool_context(dsn, pg_pool_min, pg_pool_max, pg_health_check_interval) as pg_pool:
+        full_load(pg_pool, args.workers, args.shards, args.restart)
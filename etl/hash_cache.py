@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Iterable
+
+
+class HashCache:
+    """Хеши содержимого проиндексированных документов (id -> hash) в SQLite.
+
+    Загрузчик сверяет хеш нового _source с сохранённым и не отправляет
+    в Elasticsearch документы, которые не изменились. Хеш записывается
+    только после подтверждения индексации, поэтому потерянная запись
+    приведёт к лишней, но не к пропущенной индексации. Если индекс
+    пересоздаётся не через reindex.py, кэш нужно очистить (clear()).
+    """
+
+    lookup_chunk = 500
+
+    def __init__(self, path: str) -> None:
+        dir_name = os.path.dirname(path)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS doc_hash (id TEXT PRIMARY KEY, hash TEXT NOT NULL)')
+
+    @staticmethod
+    def digest(source: dict[str, any] | bytes) -> str:
+        """Хеш _source; уже сериализованный документ (bytes) хешируется как есть."""
+        if not isinstance(source, bytes):
+            source = json.dumps(source, sort_keys=True, ensure_ascii=False, default=str).encode()
+        return hashlib.blake2b(source, digest_size=16).hexdigest()
+
+    def get_many(self, ids: list[str]) -> dict[str, str]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(ids), self.lookup_chunk):
+                chunk = ids[i:i + self.lookup_chunk]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(f'SELECT id, hash FROM doc_hash WHERE id IN ({placeholders})', chunk)
+                found.update(rows.fetchall())
+        return found
+
+    def put_many(self, items: Iterable[tuple[str, str]]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO doc_hash (id, hash) VALUES (?, ?)', items)
+
+    def forget_many(self, ids: list[str]) -> None:
+        """Забыть хеши документов, изменённых в индексе в обход полной индексации (частичные обновления)."""
+        with self._lock, self._conn:
+            for i in range(0, len(ids), self.lookup_chunk):
+                chunk = ids[i:i + self.lookup_chunk]
+                placeholders = ','.join('?' * len(chunk))
+                self._conn.execute(f'DELETE FROM doc_hash WHERE id IN ({placeholders})', chunk)
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM doc_hash')
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,79 @@
+import json
+import os
+from datetime import datetime, timezone
+from elasticsearch import Elasticsearch, NotFoundError
+from utils import es_backoff
+from config import logger
+
+
+class IndexManager:
+    """Управление версионными индексами за алиасом.
+
+    Новый индекс создаётся из той же схемы, что и в es/, с настройками
+    для массовой загрузки (без refresh и реплик); после загрузки настройки
+    восстанавливаются, индекс сливается в один сегмент, и алиас атомарно
+    переключается на него.
+    """
+
+    bulk_settings = {'refresh_interval': '-1', 'number_of_replicas': 0}
+    forcemerge_timeout = 3600
+
+    def __init__(self, client: Elasticsearch, alias: str, schema_dir: str) -> None:
+        self._client = client
+        self._alias = alias
+        self._schema_path = os.path.join(schema_dir, f'{alias}.json')
+
+    def _load_schema(self) -> dict[str, any]:
+        with open(self._schema_path, 'r') as schema_file:
+            return json.load(schema_file)
+
+    def _live_settings(self) -> dict[str, any]:
+        settings = self._load_schema()['settings']
+        return {
+            'refresh_interval': settings.get('refresh_interval', '1s'),
+            'number_of_replicas': settings.get('number_of_replicas', 1),
+        }
+
+    @es_backoff()
+    def create_index(self) -> str:
+        """Создать версионный индекс с настройками для массовой загрузки."""
+        schema = self._load_schema()
+        index = f'{self._alias}_{datetime.now(timezone.utc):%Y%m%d%H%M%S}'
+        settings = {**schema['settings'], **self.bulk_settings}
+        self._client.indices.create(index=index, settings=settings, mappings=schema['mappings'])
+        logger.info(f'reindex: created index {index}')
+        return index
+
+    @es_backoff()
+    def finish_load(self, index: str) -> None:
+        """Вернуть рабочие настройки, обновить и слить сегменты индекса."""
+        self._client.indices.put_settings(index=index, settings=self._live_settings())
+        self._client.indices.refresh(index=index)
+        self._client.options(request_timeout=self.forcemerge_timeout).indices.forcemerge(index=index, max_num_segments=1)
+        logger.info(f'reindex: index {index} restored and force-merged')
+
+    def _aliased_indices(self) -> list[str]:
+        try:
+            return list(self._client.indices.get_alias(name=self._alias).keys())
+        except NotFoundError:
+            return []
+
+    @es_backoff()
+    def swap_alias(self, index: str) -> list[str]:
+        """Атомарно направить алиас на index; вернуть индексы, с которых он снят."""
+        old = [name for name in self._aliased_indices() if name != index]
+        actions = []
+        if not old and self._client.indices.exists(index=self._alias):
+            # индекс, созданный es_index.sh под именем алиаса, удаляется в том же запросе
+            actions.append({'remove_index': {'index': self._alias}})
+        actions += [{'remove': {'index': name, 'alias': self._alias}} for name in old]
+        actions.append({'add': {'index': index, 'alias': self._alias}})
+        self._client.indices.update_aliases(actions=actions)
+        logger.info(f'reindex: alias {self._alias} -> {index} (was {old or "-"})')
+        return old
+
+    @es_backoff()
+    def delete_indices(self, indices: list[str]) -> None:
+        for index in indices:
+            self._client.indices.delete(index=index)
+            logger.info(f'reindex: deleted index {index}')
@@ -1,14 +1,17 @@
+import re
+import threading
+import time
 from contextlib import closing
 import abc
 from datetime import datetime
 from config import logger, target_schema
 from utils import pg_backoff
-from psycopg2.extensions import connection as _connection
-from state import State
+from pool import PGConnectionPool
+from state import State, MAX_ID
 class BaseInspector(abc.ABC):
 
     @abc.abstractmethod
-    def inspect(self) -> int:
+    def inspect(self) -> str | None:
         pass
 
     def _get_time_modified(self):
@@ -16,64 +19,126 @@ class BaseInspector(abc.ABC):
 
 class InspectorComponent(BaseInspector):
     
-    def __init__(self, conn_inst: _connection, state: State, table_name: str, time_modified_key_name: str):
-        self._conn_inst = conn_inst
+    def __init__(self, pool: PGConnectionPool, state: State, table_name: str, time_modified_key_name: str, last_id_key_name: str):
+        self._pool = pool
         self._state = state
-        self._table_name = table_name
+        self.table_name = table_name
         self.time_modified_key_name = time_modified_key_name;
+        self.last_id_key_name = last_id_key_name
 
     def _get_time_modified(self):
         time_modified = self._state.get_state(self.time_modified_key_name)
         if time_modified is None:
             time_modified = datetime(1970, 1, 1)
         return time_modified
-    
+
+    def probe_query(self) -> str:
+        """Подзапрос: новая отметка modified таблицы или NULL, если изменений нет.
+
+        Изменения ищутся после курсора (modified, id) экстрактора, поэтому
+        строки с тем же modified, что и отметка, не теряются. max() по
+        индексу на (modified, id) читает одну запись с конца индекса,
+        в отличие от COUNT, который проходит по всем изменённым строкам.
+        """
+        return f'SELECT max(modified) FROM "{target_schema}"."{self.table_name}" WHERE (modified, id) > (%s, %s)'
+
+    def probe_params(self) -> tuple:
+        return (self._get_time_modified(), self._state.get_state(self.last_id_key_name) or MAX_ID)
+
     @pg_backoff()
-    def inspect(self) -> int:
-        time_modified = self._get_time_modified()
-        query = f'SELECT COUNT(id) FROM "{target_schema}"."{self._table_name}" WHERE modified > \'{time_modified}\''
-        with closing(self._conn_inst.cursor()) as cursor:
-            cursor.execute(query)
-            val = cursor.fetchone()['count']
-        logger.debug(f'new rows in "{target_schema}"."{self._table_name}\" since \'{time_modified}\': {val}')
-        return val
+    def inspect(self) -> str | None:
+        """Вернуть новую отметку modified, если с последней обработки были изменения."""
+        with self._pool.connection() as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(f'SELECT ({self.probe_query()}) AS modified', self.probe_params())
+            val = cursor.fetchone()['modified']
+        logger.debug(f'"{target_schema}"."{self.table_name}" modified up to: {val}')
+        return None if val is None else str(val)
     
 
-class PersonInspector():
-    def __init__(self, conn_inst: _connection, state: State):
+class PersonInspector(InspectorComponent):
+    def __init__(self, pool: PGConnectionPool, state: State):
         person_time_modified = 'person_time_modified'
         table_name = 'person'
-        super().__init__(conn_inst, state, table_name, person_time_modified)
+        super().__init__(pool, state, table_name, person_time_modified, 'person_last_id')
 
-class GenreInspector():
-    def __init__(self, conn_inst: _connection, state: State):
+class GenreInspector(InspectorComponent):
+    def __init__(self, pool: PGConnectionPool, state: State):
         time_modified_key_name = 'genre_time_modified'
         table_name = 'genre'
-        super().__init__(conn_inst, state, table_name, time_modified_key_name)
+        super().__init__(pool, state, table_name, time_modified_key_name, 'genre_last_id')
 
-class FilmworkInspector():
-    def __init__(self, conn_inst: _connection, state: State):
+class FilmworkInspector(InspectorComponent):
+    def __init__(self, pool: PGConnectionPool, state: State):
         time_modified_key_name = 'filmwork_time_modified'
         table_name = 'film_work'
-        super().__init__(conn_inst, state, table_name, time_modified_key_name)
+        super().__init__(pool, state, table_name, time_modified_key_name, 'filmwork_last_id')
         
 class DBInspector():
-    def __init__(self, conn_inst: _connection, state: State):
-        self._conn_inst = conn_inst
+    """Проверка изменений всех отслеживаемых таблиц одним запросом.
+
+    Результат пробы кэшируется на probe_ttl секунд, и каждая таблица
+    забирает свою отметку из него один раз: воркеры, опрашивающие почти
+    одновременно, обходятся одним обращением к Postgres.
+    Методы inspect_* возвращают новую отметку modified (верхнюю границу
+    для экстрактора) или None, если изменений нет.
+    """
+
+    def __init__(self, pool: PGConnectionPool, state: State, probe_ttl: float = 0):
+        self._pool = pool
         self._state = state
-        self._filmwork_inspector = FilmworkInspector(self._conn_inst, self._state)
-        self._genre_inspector = GenreInspector(self._conn_inst, self._state)
-        self._person_inspector = PersonInspector(self._conn_inst, self._state)
+        self._probe_ttl = probe_ttl
+        self._filmwork_inspector = FilmworkInspector(self._pool, self._state)
+        self._genre_inspector = GenreInspector(self._pool, self._state)
+        self._person_inspector = PersonInspector(self._pool, self._state)
+        self._inspectors = (self._filmwork_inspector, self._genre_inspector, self._person_inspector)
+        self._probe_lock = threading.Lock()
+        self._probed_at = float('-inf')
+        self._watermarks: dict[str, str | None] = {}
+
+    @pg_backoff()
+    def probe(self) -> dict[str, str | None]:
+        """Новые отметки modified всех таблиц за один запрос."""
+        columns = ', '.join(f'({inspector.probe_query()}) AS "{inspector.table_name}"' for inspector in self._inspectors)
+        params = [param for inspector in self._inspectors for param in inspector.probe_params()]
+        with self._pool.connection() as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(f'SELECT {columns}', params)
+            row = cursor.fetchone()
+        watermarks = {name: None if val is None else str(val) for name, val in row.items()}
+        logger.debug(f'probe: {watermarks}')
+        return watermarks
 
-    def inspect_filmwork(self) -> bool:
-        filmwork_upd = self._filmwork_inspector.inspect()
-        return filmwork_upd > 0
+    def _watermark(self, table_name: str) -> str | None:
+        with self._probe_lock:
+            if table_name not in self._watermarks or time.monotonic() - self._probed_at >= self._probe_ttl:
+                self._watermarks = self.probe()
+                self._probed_at = time.monotonic()
+            return self._watermarks.pop(table_name)
+
+    def inspect_filmwork(self) -> str | None:
+        return self._watermark(self._filmwork_inspector.table_name)
     
-    def inspect_genre(self) -> bool:
-        genre_upd = self._genre_inspector.inspect()
-        return genre_upd > 0
+    def inspect_genre(self) -> str | None:
+        return self._watermark(self._genre_inspector.table_name)
     
-    def inspect_person(self):
-        person_upd = self._genre_inspector.inspect()
-        return person_upd.inspect() > 0
-    
\ No newline at end of file
+    def inspect_person(self) -> str | None:
+        return self._watermark(self._person_inspector.table_name)
+
+    @pg_backoff()
+    def ensure_indexes(self, create: bool = False) -> None:
+        """Проверить индексы по (modified, id) отслеживаемых таблиц; при create - создать недостающие."""
+        for inspector in self._inspectors:
+            with self._pool.connection() as conn, closing(conn.cursor()) as cursor:
+                cursor.execute('SELECT indexdef FROM pg_indexes WHERE schemaname = %s AND tablename = %s', (target_schema, inspector.table_name))
+                if any(re.search(r'\(modified\b', row['indexdef']) for row in cursor.fetchall()):
+                    continue
+                ddl = f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{inspector.table_name}_modified_id_idx" ON "{target_schema}"."{inspector.table_name}" (modified, id)'
+                if not create:
+                    logger.warning(f'no index on "{target_schema}"."{inspector.table_name}" (modified), consider: {ddl}')
+                    continue
+                conn.rollback()
+                conn.autocommit = True
+                try:
+                    cursor.execute(ddl)
+                finally:
+                    conn.autocommit = False
+                logger.info(f'created index: {ddl}')
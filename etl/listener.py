@@ -0,0 +1,106 @@
+import json
+import os
+import select
+import threading
+from contextlib import closing
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from config import logger
+from utils import pg_backoff
+from pool import PGConnectionPool
+
+
+class ChangeSet:
+    """Изменения одной сущности, накопленные между обработками: id -> modified."""
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._changes: dict[str, str | None] = {}
+        self._resync = True
+
+    def add(self, id: str, modified: str | None) -> None:
+        with self._cond:
+            current = self._changes.get(id)
+            if current is None or (modified is not None and modified > current):
+                self._changes[id] = modified
+            self._cond.notify()
+
+    def request_resync(self) -> None:
+        """Уведомления могли быть потеряны: нужно догнать изменения по отметке modified."""
+        with self._cond:
+            self._resync = True
+            self._cond.notify()
+
+    def wait(self, timeout: float) -> tuple[bool, dict[str, str | None]]:
+        """Дождаться изменений и забрать их: (нужна ли досинхронизация, id -> modified)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._changes or self._resync, timeout)
+            changes, self._changes = self._changes, {}
+            resync, self._resync = self._resync, False
+        return resync, changes
+
+
+class ChangeListener:
+    """Приём уведомлений об изменениях (LISTEN/NOTIFY) от триггеров из sql/change_capture.sql.
+
+    Изменения таблиц связей приходят как изменения фильма. После каждого
+    (пере)подключения все сущности получают запрос на досинхронизацию,
+    потому что уведомления, отправленные без слушателя, теряются.
+    """
+
+    channel = 'content_changes'
+    sql_path = os.path.join(os.path.dirname(__file__), 'sql', 'change_capture.sql')
+    routes = {
+        'film_work': ('film_work', 'id'),
+        'genre_film_work': ('film_work', 'film_work_id'),
+        'person_film_work': ('film_work', 'film_work_id'),
+        'genre': ('genre', 'id'),
+        'person': ('person', 'id'),
+    }
+
+    def __init__(self, dsn: dict, pool: PGConnectionPool, poll_timeout: float = 5) -> None:
+        self._dsn = dsn
+        self._pool = pool
+        self._poll_timeout = poll_timeout
+        self.changes = {entity: ChangeSet() for entity, _ in set(self.routes.values())}
+
+    @pg_backoff()
+    def install_triggers(self) -> None:
+        with open(self.sql_path, 'r') as sql_file:
+            sql = sql_file.read()
+        with self._pool.connection() as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(sql)
+            conn.commit()
+        logger.info('change capture: triggers installed')
+
+    def _dispatch(self, payload: str) -> None:
+        change = json.loads(payload)
+        route = self.routes.get(change.get('table'))
+        if route is None:
+            return
+        entity, id_field = route
+        if id_field in change:
+            modified = change.get('modified') if id_field == 'id' else None
+            self.changes[entity].add(change[id_field], modified)
+
+    @pg_backoff()
+    def listen(self) -> None:
+        conn = psycopg2.connect(**self._dsn)
+        try:
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with closing(conn.cursor()) as cursor:
+                cursor.execute(f'LISTEN {self.channel}')
+            for changes in self.changes.values():
+                changes.request_resync()
+            logger.info(f'change capture: listening on "{self.channel}"')
+            while True:
+                if select.select([conn], [], [], self._poll_timeout) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._dispatch(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+    def start(self) -> None:
+        threading.Thread(target=self.listen, daemon=True).start()
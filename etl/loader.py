@@ -1,9 +1,19 @@
 import abc
-from typing import Iterable
-from utils import es_backoff
+import time
+from collections import deque
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+from utils import es_backoff, jittered
+from config import logger, bulk_max_retries, bulk_retry_backoff
 from pydantic import BaseModel
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import bulk, parallel_bulk
+from hash_cache import HashCache
+from serializer import BulkSerializer
+from metrics import counter, summary
+from bulk_sizing import AdaptiveChunkSize
+from dead_letter import dead_letter
 
 class BaseLoader(abc.ABC):
     @property
@@ -16,37 +26,326 @@ class BaseLoader(abc.ABC):
         pass
 
 
+BULK_REJECTED = counter('etl_bulk_rejected_total', 'Documents rejected by Elasticsearch with 429 and sent again')
+
+
+# Обновляет или добавляет персон фильма в actors/directors/writers, убирает их из полей ролей,
+# которых у них в фильме больше нет, и пересобирает *_names.
+# Если ничего не изменилось, документ не переиндексируется (noop).
+UPDATE_PEOPLE_SCRIPT = """
+boolean changed = false;
+Map roles = new HashMap();
+for (def person : params.people) {
+  if (!roles.containsKey(person.id)) { roles[person.id] = new HashSet(); }
+  String field = params.fields[person.role];
+  if (field == null) { continue; }
+  roles[person.id].add(field);
+  if (ctx._source[field] == null) { ctx._source[field] = new ArrayList(); }
+  def found = null;
+  for (def entry : ctx._source[field]) { if (entry.id == person.id) { found = entry; break; } }
+  if (found == null) { ctx._source[field].add(['id': person.id, 'name': person.name]); changed = true; }
+  else if (found.name != person.name) { found.name = person.name; changed = true; }
+}
+for (String field : params.fields.values()) {
+  if (ctx._source[field] == null) { continue; }
+  def kept = new ArrayList();
+  for (def entry : ctx._source[field]) {
+    if (roles.containsKey(entry.id) && !roles[entry.id].contains(field)) { changed = true; } else { kept.add(entry); }
+  }
+  ctx._source[field] = kept;
+}
+if (changed) {
+  for (String field : params.fields.values()) {
+    def names = new ArrayList();
+    if (ctx._source[field] != null) { for (def entry : ctx._source[field]) { names.add(entry.name); } }
+    ctx._source[field + '_names'] = names;
+  }
+} else {
+  ctx.op = 'noop';
+}
+"""
+PERSON_ROLE_FIELDS = {'actor': 'actors', 'director': 'directors', 'writer': 'writers'}
+
+
 class ComponentLoader(BaseLoader):
-    def __init__(self, client: Elasticsearch, index: str, fetch_size: int):
+    def __init__(self, client: Elasticsearch, index: str, fetch_size: int, hash_cache: HashCache | None = None):
         self._client = client
         self._index = index
         self._fetch_size = fetch_size
-    
-    def _get_bulk_data(self, models: list[BaseModel]):
-        bulk_data = []
+        self._hash_cache = hash_cache
+        self.written = 0
+        self.skipped = 0
+
+    def _iter_actions(self, models: Iterable[BaseModel | dict[str, any]]) -> Iterator[dict[str, any]]:
         for model in models:
-            bulk_data.append(
-                {
-                    "_index": self._index,
-                    "_id": str(model.id),
-                    "_source": model.model_dump()
-                }
-            )
-        return bulk_data
-    
+            source = model if isinstance(model, dict) else model.model_dump()
+            yield {
+                "_index": self._index,
+                "_id": str(source['id']),
+                "_source": source
+            }
+
+    def _get_bulk_data(self, models: list[BaseModel]):
+        return list(self._iter_actions(models))
+
+    @staticmethod
+    def _identify(action: dict[str, any]) -> tuple[str, any]:
+        return action['_id'], action['_source']
+
+    def _skip_unchanged(self, bulk_data: list, identify: Callable[[any], tuple[str, any]] | None = None) -> tuple[list, dict[str, str]]:
+        """Отбросить документы, хеш которых совпадает с уже проиндексированным; вернуть остальные и их хеши.
+
+        identify возвращает (id, source) элемента; по умолчанию элемент - bulk-действие.
+        """
+        if self._hash_cache is None:
+            return bulk_data, {}
+        identify = identify or self._identify
+        keyed = []
+        for item in bulk_data:
+            id, source = identify(item)
+            keyed.append((id, HashCache.digest(source), item))
+        known = self._hash_cache.get_many([id for id, _, _ in keyed])
+        changed = [(id, digest, item) for id, digest, item in keyed if known.get(id) != digest]
+        skipped = len(bulk_data) - len(changed)
+        self.skipped += skipped
+        if skipped:
+            logger.debug(f'hash cache: skipped {skipped} unchanged of {len(bulk_data)} documents (total skipped {self.skipped})')
+        return [item for _, _, item in changed], {id: digest for id, digest, _ in changed}
+
+    def _remember(self, ids: Iterable[str], hashes: dict[str, str]) -> None:
+        if self._hash_cache is not None:
+            self._hash_cache.put_many((id, hashes[id]) for id in ids if id in hashes)
+
+    def _dead_letter(self, action: str, failed: list[tuple[dict[str, any], any]]) -> None:
+        """Записать непринятые документы (ответ bulk, тело действия) в журнал отказов, остальная пачка идёт дальше."""
+        for item, _ in failed:
+            logger.error(f'bulk {action}: document failed: {item}')
+        if dead_letter is not None:
+            dead_letter.write({'index': self._index, 'id': item.get('_id'), 'action': action, 'body': body, 'error': item.get('error')}
+                              for item, body in failed)
+
+    @es_backoff()
+    def _bulk(self, bulk_data_batch: Iterable) -> list[dict[str, any]]:
+        _, errors = bulk(self._client, bulk_data_batch, raise_on_error=False, max_retries=bulk_max_retries, initial_backoff=bulk_retry_backoff)
+        return [next(iter(error.values())) for error in errors]
+
+    # поля документа фильма, которые можно обновить частичным doc
+    patch_fields = ('genres',)
+
+    def _update_body(self, patch: dict[str, any]) -> dict[str, any]:
+        """Тело update-действия: скрипт для персон фильма, готовый скрипт (upsert) или частичный doc."""
+        if 'people' in patch:
+            params = {'people': patch['people'], 'fields': PERSON_ROLE_FIELDS}
+            return {'script': {'source': UPDATE_PEOPLE_SCRIPT, 'lang': 'painless', 'params': params}}
+        if 'script' in patch:
+            return {key: patch[key] for key in ('script', 'scripted_upsert', 'upsert') if key in patch}
+        return {'doc': {key: patch[key] for key in self.patch_fields if key in patch}}
+
     @es_backoff()
-    def _bulk(self, bulk_data_batch: Iterable):
-        bulk(self._client, bulk_data_batch)
+    def _bulk_updates(self, actions: list[dict[str, any]]) -> list[dict[str, any]]:
+        _, errors = bulk(self._client, actions, chunk_size=self._fetch_size, raise_on_error=False,
+                         max_retries=bulk_max_retries, initial_backoff=bulk_retry_backoff)
+        return [next(iter(error.values())) for error in errors]
+
+    def update_data(self, patches: list[dict[str, any]]) -> None:
+        """Частичное обновление документов фильмов (extract_updates экстракторов персон и жанров)."""
+        actions = [{'_op_type': 'update', '_index': self._index, '_id': patch['id'], 'retry_on_conflict': 3, **self._update_body(patch)}
+                   for patch in patches]
+        self._record_updates(patches, self._bulk_updates(actions))
+
+    def _record_updates(self, patches: list[dict[str, any]], failed: list[dict[str, any]]) -> None:
+        # фильма ещё нет в индексе: его полностью проиндексирует обработка film_work
+        missing = [item for item in failed if item.get('status') == 404]
+        errors = [item for item in failed if item.get('status') != 404]
+        if self._hash_cache is not None:
+            self._hash_cache.forget_many([patch['id'] for patch in patches])
+        if errors:
+            by_id = {patch['id']: patch for patch in patches}
+            self._dead_letter('update', [(error, self._update_body(by_id[error['_id']])) for error in errors])
+        logger.debug(f'bulk update: {len(patches) - len(failed)} updated, {len(missing)} not indexed yet, {len(errors)} failed')
 
 
     def load_data(self, models: list[BaseModel]) -> None:
-        bulk_data = self._get_bulk_data(models)
+        bulk_data, hashes = self._skip_unchanged(self._get_bulk_data(models))
         n = 1
         while len(bulk_data_batch := bulk_data[self._fetch_size*(n-1):self._fetch_size*n]) > 0:     
-            self._bulk(bulk_data_batch)
+            errors = self._bulk(bulk_data_batch)
+            self._record_actions(bulk_data_batch, errors, hashes)
             n += 1
+
+    def _record_actions(self, bulk_data: list[dict[str, any]], errors: list[dict[str, any]], hashes: dict[str, str]) -> None:
+        """Учесть результат bulk по действиям helpers: запомнить хеши принятых, непринятые - в журнал отказов."""
+        failed_ids = {error.get('_id') for error in errors}
+        indexed = [action['_id'] for action in bulk_data if action['_id'] not in failed_ids]
+        self._remember(indexed, hashes)
+        self.written += len(indexed)
+        if errors:
+            sources = {action['_id']: action['_source'] for action in bulk_data}
+            self._dead_letter('index', [(error, sources.get(error.get('_id'))) for error in errors])
         
         
+class ParallelLoader(ComponentLoader):
+    """Загрузчик на parallel_bulk.
+
+    Действия формируются лениво и режутся на пачки по числу документов
+    (chunk_size) и по размеру тела запроса (max_chunk_bytes); одновременно
+    в Elasticsearch уходит до thread_count bulk-запросов. Результат
+    возвращается по каждому документу, ошибки отдельных документов
+    не прерывают загрузку остальных.
+    """
+
+    def __init__(self, client: Elasticsearch, index: str, chunk_size: int, thread_count: int, max_chunk_bytes: int, queue_size: int, hash_cache: HashCache | None = None):
+        super().__init__(client, index, chunk_size, hash_cache)
+        self._thread_count = thread_count
+        self._max_chunk_bytes = max_chunk_bytes
+        self._queue_size = queue_size
+
+    def stream_results(self, actions: Iterable[dict[str, any]]) -> Iterator[tuple[bool, dict[str, any]]]:
+        """Поток результатов (ok, item) по каждому документу."""
+        yield from parallel_bulk(
+            self._client,
+            actions,
+            thread_count=self._thread_count,
+            chunk_size=self._fetch_size,
+            max_chunk_bytes=self._max_chunk_bytes,
+            queue_size=self._queue_size,
+            raise_on_error=False,
+        )
+
+    @es_backoff()
+    def _parallel_bulk(self, bulk_data: list[dict[str, any]]) -> list[dict[str, any]]:
+        return [next(iter(item.values())) for ok, item in self.stream_results(bulk_data) if not ok]
+
+    def load_data(self, models: list[BaseModel]) -> None:
+        bulk_data, hashes = self._skip_unchanged(self._get_bulk_data(models))
+        errors = self._parallel_bulk(bulk_data)
+        self._record_actions(bulk_data, errors, hashes)
+        logger.debug(f'parallel_bulk: indexed {len(bulk_data) - len(errors)}, failed {len(errors)}')
+
+
+class NdjsonLoader(ComponentLoader):
+    """Загрузчик предварительно сериализованных bulk-запросов.
+
+    Каждый документ один раз рендерится в NDJSON (BulkSerializer), тела
+    запросов собираются из готовых байтов по числу документов и размеру
+    и отправляются через client.bulk параллельно, до thread_count
+    запросов одновременно. Размер тел и время кодирования пачки
+    пишутся в метрики bulk_body_bytes и bulk_encode_seconds.
+
+    С sizer число документов в запросе подстраивается под задержку ответа
+    (AdaptiveChunkSize) и читается перед нарезкой каждого запроса.
+    Документы, отклонённые кластером с 429, отправляются повторно (только
+    они) с растущей паузой со случайным разбросом, до max_retries раз.
+    """
+
+    response_filter = 'errors,items.*._id,items.*.status,items.*.error'
+
+    def __init__(self, client: Elasticsearch, index: str, chunk_size: int, thread_count: int, max_chunk_bytes: int, hash_cache: HashCache | None = None,
+                 sizer: AdaptiveChunkSize | None = None, max_retries: int = bulk_max_retries, retry_backoff: float = bulk_retry_backoff):
+        super().__init__(client, index, chunk_size, hash_cache)
+        self._max_chunk_bytes = max_chunk_bytes
+        self._thread_count = thread_count
+        self._sizer = sizer
+        self._max_retries = max_retries
+        self._retry_backoff = retry_backoff
+        self._serializer = BulkSerializer(index)
+        self._executor = ThreadPoolExecutor(max_workers=thread_count, thread_name_prefix=f'bulk-{index}')
+        self._body_bytes = summary('bulk_body_bytes', 'Size of bulk request bodies in bytes')
+        self._encode_seconds = summary('bulk_encode_seconds', 'Time to serialize a batch of documents')
+
+    def _render(self, models: list[BaseModel | dict[str, any]]) -> list[tuple[str, bytes]]:
+        start = time.perf_counter()
+        rendered = [self._serializer.render(model) for model in models]
+        self._encode_seconds.observe(time.perf_counter() - start, index=self._index)
+        return rendered
+
+    @es_backoff()
+    def _send(self, body: bytes) -> list[dict[str, any]]:
+        self._body_bytes.observe(len(body), index=self._index)
+        response = self._client.bulk(operations=body, filter_path=self.response_filter)
+        return [next(iter(item.values())) for item in response.get('items', [])]
+
+    def _chunks(self, rendered: list[tuple[str, bytes]]) -> Iterator[list[tuple[str, bytes]]]:
+        """Нарезать документы на запросы по числу документов (текущему размеру sizer) и размеру в байтах."""
+        chunk, size, limit = [], 0, self._chunk_limit()
+        for item in rendered:
+            if chunk and (len(chunk) >= limit or size + len(item[1]) > self._max_chunk_bytes):
+                yield chunk
+                chunk, size, limit = [], 0, self._chunk_limit()
+            chunk.append(item)
+            size += len(item[1])
+        if chunk:
+            yield chunk
+
+    def _chunk_limit(self) -> int:
+        return self._sizer.size if self._sizer is not None else self._fetch_size
+
+    def _send_chunk(self, chunk: list[tuple[str, bytes]]) -> list[dict[str, any]]:
+        """Отправить запрос; отклонённые с 429 документы отправлять повторно, пока есть попытки."""
+        items: list[dict[str, any] | None] = [None] * len(chunk)
+        pending = list(range(len(chunk)))
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            response = self._send(b''.join(chunk[i][1] for i in pending))
+            latency = time.perf_counter() - start
+            rejected = []
+            for i, item in zip(pending, response):
+                items[i] = item
+                if item.get('status') == 429:
+                    rejected.append(i)
+            if self._sizer is not None:
+                self._sizer.observe(len(pending), latency, len(rejected))
+            if not rejected or attempt >= self._max_retries:
+                return items
+            t = jittered(min(self._retry_backoff * (2 ** attempt), 30))
+            BULK_REJECTED.inc(len(rejected), index=self._index)
+            logger.warning(f'ndjson bulk: {len(rejected)} of {len(pending)} documents rejected (429), resending in {t:.2f}s')
+            time.sleep(t)
+            pending = rejected
+            attempt += 1
+
+    def _send_chunks(self, chunks: Iterator[list[tuple[str, bytes]]]) -> Iterator[list[dict[str, any]]]:
+        """Отправлять запросы параллельно, не более thread_count одновременно.
+
+        Следующий запрос нарезается только когда освобождается поток, поэтому
+        его размер учитывает задержку уже полученных ответов.
+        """
+        in_flight = deque()
+        for chunk in chunks:
+            if len(in_flight) >= self._thread_count:
+                yield in_flight.popleft().result()
+            in_flight.append(self._executor.submit(self._send_chunk, chunk))
+        while in_flight:
+            yield in_flight.popleft().result()
+
+    def load_data(self, models: list[BaseModel | dict[str, any]]) -> None:
+        rendered, hashes = self._skip_unchanged(self._render(models), lambda item: (item[0], BulkSerializer.source(item[1])))
+        self._record(self._send_chunks(self._chunks(rendered)), hashes, rendered)
+
+    def update_data(self, patches: list[dict[str, any]]) -> None:
+        rendered = [self._serializer.render_update(patch['id'], self._update_body(patch)) for patch in patches]
+        failed = [item for items in self._send_chunks(self._chunks(rendered))
+                  for item in items if not 200 <= item.get('status', 500) < 300]
+        self._record_updates(patches, failed)
+
+    def _record(self, responses: Iterable[list[dict[str, any]]], hashes: dict[str, str], rendered: list[tuple[str, bytes]]) -> None:
+        """Учесть ответы bulk-запросов: запомнить хеши проиндексированных, непринятые - в журнал отказов."""
+        indexed, errors = [], []
+        for items in responses:
+            for item in items:
+                if 200 <= item.get('status', 500) < 300:
+                    indexed.append(item['_id'])
+                else:
+                    errors.append(item)
+        self._remember(indexed, hashes)
+        self.written += len(indexed)
+        if errors:
+            lines = dict(rendered)
+            self._dead_letter('index', [(error, orjson.loads(BulkSerializer.source(lines[error['_id']]))) for error in errors])
+        logger.debug(f'ndjson bulk: indexed {len(indexed)}, failed {len(errors)}')
+
+
 class Loader(ComponentLoader):
-    def __init__(self, client: Elasticsearch, index: str, fetch_size: int):
-        super().__init__(client, index, fetch_size)
\ No newline at end of file
+    def __init__(self, client: Elasticsearch, index: str, fetch_size: int, hash_cache: HashCache | None = None):
+        super().__init__(client, index, fetch_size, hash_cache)
\ No newline at end of file
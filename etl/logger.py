@@ -1,9 +1,79 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
+from metrics import counter
+
+# уровень, при котором категория не пишется совсем
+OFF = logging.CRITICAL + 10
+logging.addLevelName(OFF, 'OFF')
+
+LOG_DROPPED = counter('etl_log_records_dropped_total', 'Log records dropped because the background log queue was full')
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который при переполненной очереди отбрасывает запись, а не блокирует рабочий поток.
+
+    Сообщение не форматируется при постановке в очередь: его соберёт фоновый поток.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # очередь внутри процесса: запись не нужно готовить к pickle
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись одной строкой JSON: время, уровень, категория, сообщение и поля из extra."""
+
+    _reserved = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName', 'category', 'fields'}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'category': getattr(record, 'category', None),
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in self._reserved)
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Текстовый формат; поля из extra дописываются в конец строки как key=value."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return line
 
 
 class Logger(logging.Logger):
-    def __init__(self, logs_path: str, logging_level: str):
+    """Логгер ETL.
+
+    Записи складываются в очередь, а форматирует и пишет их в файл фоновый
+    поток (QueueListener), поэтому рабочие потоки не ждут диска. У записей
+    есть категория (event/payload): уровень каждой категории задаётся
+    отдельно, по умолчанию дампы данных (payload) выключены. Дампы пишутся
+    для доли payload_sample пачек и обрезаются до payload_max_items
+    элементов и payload_max_chars символов.
+    """
+
+    def __init__(self, logs_path: str, logging_level: str, log_format: str = 'text', category_levels: dict[str, str] | None = None,
+                 payload_sample: float = 1.0, payload_max_items: int = 10, payload_max_chars: int = 2000, queue_size: int = 10000):
         super().__init__(__name__)
 
         logs_dir = os.path.dirname(logs_path)
@@ -13,8 +83,78 @@ class Logger(logging.Logger):
             with open(logs_path, 'w'):
                 pass
 
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        fh = logging.FileHandler(logs_path)
-        fh.setLevel(logging_level)
-        fh.setFormatter(formatter)
-        self.addHandler(fh)
\ No newline at end of file
+        self.setLevel(logging_level)
+        self._category_levels = {category: self._level(category, level) for category, level in (category_levels or {}).items()}
+        self._payload_sample = payload_sample
+        self._payload_max_items = payload_max_items
+        self._payload_max_chars = payload_max_chars
+        self._queue_size = queue_size
+
+        if log_format == 'json':
+            formatter = JsonFormatter()
+        else:
+            formatter = TextFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self._file_handler = logging.FileHandler(logs_path)
+        self._file_handler.setFormatter(formatter)
+        self._start_listener()
+        # после fork у дочернего процесса нет фонового потока: запускаем свой
+        os.register_at_fork(after_in_child=self._start_listener)
+        atexit.register(self.close)
+
+    @staticmethod
+    def _level(category: str, name: str) -> int:
+        level = logging.getLevelName(name.upper())
+        if not isinstance(level, int):
+            raise ValueError(f'LOG_LEVELS: unknown level {name!r} for category {category!r}, expected one of DEBUG, INFO, WARNING, ERROR, CRITICAL, OFF')
+        return level
+
+    def _start_listener(self) -> None:
+        for handler in list(self.handlers):
+            self.removeHandler(handler)
+        log_queue = queue.Queue(self._queue_size)
+        self.addHandler(_DroppingQueueHandler(log_queue))
+        self._listener = logging.handlers.QueueListener(log_queue, self._file_handler)
+        self._listener.start()
+
+    def close(self) -> None:
+        """Дописать записи из очереди и остановить фоновый поток."""
+        if self._listener._thread is not None:
+            self._listener.stop()
+        self._file_handler.close()
+
+    def category_enabled(self, category: str, level: int = logging.DEBUG) -> bool:
+        return level >= self._category_levels.get(category, logging.NOTSET) and self.isEnabledFor(level)
+
+    def event(self, category: str, message: str, level: int = logging.DEBUG, **fields) -> None:
+        """Структурная запись: поля попадают в JSON отдельными ключами, в текст - как key=value."""
+        if self.category_enabled(category, level):
+            self.log(level, message, extra={'category': category, 'fields': fields, **fields}, stacklevel=2)
+
+    def payload(self, category: str, data: list, **fields) -> None:
+        """Дамп данных пачки (строк, документов) с выборкой и обрезкой.
+
+        repr строится в фоновом потоке, поэтому в запись попадает копия
+        первых payload_max_items элементов, а не сам список.
+        """
+        if not self.category_enabled('payload') or random.random() >= self._payload_sample:
+            return
+        fields = {'source': category, 'items': len(data), **fields}
+        self.debug('%s', _Payload(data[:self._payload_max_items], len(data), self._payload_max_chars),
+                   extra={'category': 'payload', 'fields': fields, **fields}, stacklevel=2)
+
+
+class _Payload:
+    """Ленивое представление дампа: строка собирается только при форматировании записи."""
+
+    __slots__ = ('items', 'total', 'max_chars')
+
+    def __init__(self, items: list, total: int, max_chars: int):
+        self.items, self.total, self.max_chars = items, total, max_chars
+
+    def __str__(self) -> str:
+        text = repr(self.items)
+        if len(text) > self.max_chars:
+            text = text[:self.max_chars] + '...'
+        if self.total > len(self.items):
+            text += f' (+{self.total - len(self.items)} more)'
+        return text
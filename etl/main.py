@@ -1,15 +1,26 @@
-from psycopg2.extensions import connection as _connection
+import signal
 from elasticsearch import Elasticsearch
-from utils import elastic_client_context, pg_conn_context
-from config import dsn, elastic_host, storage_path, fetch_size, fetch_timeout
-from storage import JsonFileStorage
+from utils import elastic_client_context, pg_pool_context
+from config import (dsn, elastic_host, storage_path, fetch_size, fetch_timeout, pg_pool_min, pg_pool_max, pg_health_check_interval,
+                    state_backend, state_sqlite_path, metrics_port, etl_engine)
+from storage import JsonFileStorage, SqliteStorage
 from etl_master import ETLMaster
+from pool import PGConnectionPool
+import metrics
 
-def load_data(pg_conn: _connection, client: Elasticsearch):
-    storage = JsonFileStorage(storage_path)
-    etl_master = ETLMaster(pg_conn, client, storage, fetch_size, fetch_timeout)
+def load_data(pg_pool: PGConnectionPool, client: Elasticsearch):
+    storage = SqliteStorage(state_sqlite_path) if state_backend == 'sqlite' else JsonFileStorage(storage_path)
+    etl_master = ETLMaster(pg_pool, client, storage, fetch_size, fetch_timeout)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: etl_master.stop())
     etl_master.run_etl()
 
 if __name__ == '__main__':
-    with pg_conn_context(dsn) as pg_conn, elastic_client_context(elastic_host) as client:
-        load_data(pg_conn, client)
\ No newline at end of file
+    if metrics_port:
+        metrics.serve(metrics_port)
+    if etl_engine == 'async':
+        # асинхронный движок сам открывает пул asyncpg и AsyncElasticsearch
+        load_data(None, None)
+    else:
+        with pg_pool_context(dsn, pg_pool_min, pg_pool_max, pg_health_check_interval) as pg_pool, elastic_client_context(elastic_host) as client:
+            load_data(pg_pool, client)
\ No newline at end of file
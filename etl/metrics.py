@@ -0,0 +1,285 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator
+
+
+class StageStats:
+    """Счётчики одной стадии конвейера: пачки, записи, время работы и ожидания."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self.busy_time = 0.0
+        self.wait_time = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items: int, elapsed: float) -> None:
+        with self._lock:
+            self.batches += 1
+            self.items += items
+            self.busy_time += elapsed
+
+    def record_wait(self, elapsed: float) -> None:
+        with self._lock:
+            self.wait_time += elapsed
+
+    @contextmanager
+    def waiting(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_wait(time.perf_counter() - start)
+
+    @property
+    def throughput(self) -> float:
+        """Записей в секунду чистого времени работы стадии."""
+        return self.items / self.busy_time if self.busy_time else 0.0
+
+    def __str__(self) -> str:
+        return (f'{self.name}: batches={self.batches} items={self.items} '
+                f'busy={self.busy_time:.3f}s wait={self.wait_time:.3f}s rate={self.throughput:.1f}/s')
+
+
+class Summary:
+    """Количество, сумма и максимум наблюдений, раздельно по меткам."""
+
+    type = 'summary'
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._values: dict[tuple, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            count_sum_max = self._values.setdefault(key, [0, 0.0, 0.0])
+            count_sum_max[0] += 1
+            count_sum_max[1] += value
+            count_sum_max[2] = max(count_sum_max[2], value)
+
+    def collect(self) -> dict[tuple, tuple[int, float, float]]:
+        with self._lock:
+            return {key: tuple(value) for key, value in self._values.items()}
+
+
+    def samples(self) -> Iterator[tuple[str, tuple, float]]:
+        for key, (count, total, _) in self.collect().items():
+            yield f'{self.name}_count', key, count
+            yield f'{self.name}_sum', key, total
+
+
+class Counter:
+    """Монотонно растущий счётчик, раздельно по меткам."""
+
+    type = 'counter'
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self) -> Iterator[tuple[str, tuple, float]]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield self.name, key, value
+
+
+class Gauge:
+    """Текущее значение; функция, заданная через set_function, вычисляется при каждом сборе."""
+
+    type = 'gauge'
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._values: dict[tuple, float | Callable[[], float | None]] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def set_function(self, func: Callable[[], float | None], **labels: str) -> None:
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = func
+
+    def samples(self) -> Iterator[tuple[str, tuple, float]]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            if callable(value):
+                value = value()
+            if value is not None:
+                yield self.name, key, value
+
+
+class Histogram:
+    """Распределение наблюдений по корзинам (buckets), раздельно по меткам."""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...]) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts_sum = self._values.setdefault(key, [[0] * len(self.buckets), 0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts_sum[0][i] += 1
+                    break
+            counts_sum[1] += value
+
+    def samples(self) -> Iterator[tuple[str, tuple, float]]:
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket', key + (('le', _format_value(bound)),), cumulative
+            yield f'{self.name}_sum', key, total
+            yield f'{self.name}_count', key, cumulative
+
+
+_registry: dict[str, Summary | Counter | Gauge | Histogram] = {}
+_registry_lock = threading.Lock()
+
+
+def _get(cls, name: str, help: str, *args):
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = cls(name, help, *args)
+        return _registry[name]
+
+
+def summary(name: str, help: str) -> Summary:
+    """Получить метрику из общего реестра процесса, создав её при первом обращении."""
+    return _get(Summary, name, help)
+
+
+def counter(name: str, help: str) -> Counter:
+    return _get(Counter, name, help)
+
+
+def gauge(name: str, help: str) -> Gauge:
+    return _get(Gauge, name, help)
+
+
+def histogram(name: str, help: str, buckets: tuple[float, ...]) -> Histogram:
+    return _get(Histogram, name, help, buckets)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(key: tuple) -> str:
+    if not key:
+        return ''
+    labels = ','.join(f'{name}="{_escape(str(value))}"' for name, value in key)
+    return f'{{{labels}}}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render() -> str:
+    """Все метрики реестра в текстовом формате Prometheus."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for name, key, value in metric.samples():
+            lines.append(f'{name}{_format_labels(key)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def serve(port: int, host: str = '') -> ThreadingHTTPServer:
+    """Отдавать метрики по HTTP (GET /metrics) из фонового потока."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+STAGE_SECONDS = histogram('etl_stage_seconds', 'Time to process one batch in a stage',
+                          (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+BATCH_ROWS = histogram('etl_batch_rows', 'Rows in one batch of a stage', (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+ROWS = counter('etl_rows_total', 'Rows passed through a stage; rows per second is rate() of this counter')
+BACKOFF_RETRIES = counter('etl_backoff_retries_total', 'Retries made by pg_backoff and es_backoff')
+LAG_SECONDS = gauge('etl_lag_seconds', 'Now minus the last checkpointed modified')
+
+
+def observe_stage(entity: str, stage: str, rows: int, elapsed: float) -> None:
+    STAGE_SECONDS.observe(elapsed, entity=entity, stage=stage)
+    BATCH_ROWS.observe(rows, entity=entity, stage=stage)
+    ROWS.inc(rows, entity=entity, stage=stage)
+
+
+class StageTiming:
+    seconds = 0.0
+
+
+@contextmanager
+def timed_stage(entity: str, stage: str, rows: int = 0) -> Iterator[StageTiming]:
+    """Замерить стадию; время доступно и в возвращаемом объекте после выхода из блока."""
+    timing = StageTiming()
+    start = time.perf_counter()
+    yield timing
+    timing.seconds = time.perf_counter() - start
+    observe_stage(entity, stage, rows, timing.seconds)
+
+
+def timed_batches(entity: str, stage: str, batches: Iterator[list]) -> Iterator[list]:
+    """Пропустить пачки источника, замеряя время получения каждой."""
+    while True:
+        start = time.perf_counter()
+        try:
+            batch = next(batches)
+        except StopIteration:
+            return
+        observe_stage(entity, stage, len(batch), time.perf_counter() - start)
+        yield batch
@@ -0,0 +1,79 @@
+import os
+import re
+import threading
+from contextlib import closing
+from typing import Iterator
+from pool import PGConnectionPool
+
+_ESCAPE = re.compile(r'\\(.)')
+_ESCAPED_CHARS = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+
+
+def _unescape(match: re.Match) -> str:
+    return _ESCAPED_CHARS.get(match.group(1), match.group(1))
+
+
+def copy_fields(line: bytes) -> list[str | None]:
+    """Поля строки текстового формата COPY: \\N - NULL, экранирование обратной косой чертой."""
+    fields = line.decode().rstrip('\n').split('\t')
+    for i, field in enumerate(fields):
+        if '\\' in field:
+            fields[i] = None if field == '\\N' else _ESCAPE.sub(_unescape, field)
+    return fields
+
+
+class CopyStream:
+    """Результат запроса, выгружаемый через COPY (...) TO STDOUT и разбираемый построчно по мере прихода.
+
+    copy_expert выполняется в отдельном потоке на своём подключении пула и
+    пишет в pipe, из которого читает итератор: в памяти лежит только буфер
+    pipe, а Postgres не присылает больше, чем успевает разобрать потребитель.
+    Ошибка COPY поднимается из итератора после чтения полученных строк.
+    close до конца выгрузки отменяет запрос на сервере.
+    """
+
+    def __init__(self, pool: PGConnectionPool, query: str) -> None:
+        self._pool = pool
+        self._query = query
+        read_fd, write_fd = os.pipe()
+        self._reader = os.fdopen(read_fd, 'rb')
+        self._writer = os.fdopen(write_fd, 'wb')
+        self._conn = None
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(target=self._copy, name='pg-copy', daemon=True)
+        self._thread.start()
+
+    def _copy(self) -> None:
+        try:
+            with self._pool.connection() as conn, closing(conn.cursor()) as cursor:
+                self._conn = conn
+                cursor.copy_expert(f'COPY ({self._query}) TO STDOUT', self._writer)
+        except BaseException as err:
+            self._error = err
+        finally:
+            self._conn = None
+            self._writer.close()
+
+    def __iter__(self) -> Iterator[list[str | None]]:
+        for line in self._reader:
+            yield copy_fields(line)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            conn = self._conn
+            if conn is not None:
+                conn.cancel()
+            # дочитать pipe, чтобы поток COPY не встал на записи и вернул подключение в пул
+            for _ in self._reader:
+                pass
+            self._thread.join()
+        self._reader.close()
+
+    def __enter__(self) -> 'CopyStream':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,103 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterator
+from config import logger
+from metrics import StageStats
+
+_DONE = object()
+
+
+class Pipeline:
+    """Конвейер стадий, связанных ограниченными очередями.
+
+    Источник и каждая стадия работают в отдельном потоке, поэтому выгрузка
+    из Postgres и индексация в Elasticsearch идут одновременно. Глубина
+    очередей ограничивает число пачек в обработке (backpressure).
+    Первая ошибка любой стадии останавливает конвейер и пробрасывается из run().
+    """
+
+    poll_interval = 0.5
+
+    def __init__(self, name: str, queue_depth: int, size: Callable[[any], int] = len) -> None:
+        self._name = name
+        self._queue_depth = queue_depth
+        self._size = size
+        self._stop = threading.Event()
+        self._error = None
+        self.stats: list[StageStats] = []
+
+    def _put(self, q: queue.Queue, item, stats: StageStats) -> bool:
+        with stats.waiting():
+            while not self._stop.is_set():
+                try:
+                    q.put(item, timeout=self.poll_interval)
+                    return True
+                except queue.Full:
+                    continue
+        return False
+
+    def _get(self, q: queue.Queue, stats: StageStats):
+        with stats.waiting():
+            while not self._stop.is_set():
+                try:
+                    return q.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    continue
+        return _DONE
+
+    def _fail(self, err: Exception) -> None:
+        if self._error is None:
+            self._error = err
+        self._stop.set()
+
+    def _run_source(self, source: Iterator, stats: StageStats, out: queue.Queue) -> None:
+        try:
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(source)
+                except StopIteration:
+                    break
+                stats.record(self._size(item), time.perf_counter() - start)
+                if not self._put(out, item, stats):
+                    break
+            self._put(out, _DONE, stats)
+        except Exception as err:
+            self._fail(err)
+        finally:
+            close = getattr(source, 'close', None)
+            if close is not None:
+                close()
+
+    def _run_stage(self, func: Callable, stats: StageStats, inp: queue.Queue, out: queue.Queue | None) -> None:
+        try:
+            while (item := self._get(inp, stats)) is not _DONE:
+                start = time.perf_counter()
+                result = func(item)
+                stats.record(self._size(item), time.perf_counter() - start)
+                if out is not None and not self._put(out, result, stats):
+                    return
+            if out is not None:
+                self._put(out, _DONE, stats)
+        except Exception as err:
+            self._fail(err)
+
+    def run(self, source: tuple[str, Iterator], *stages: tuple[str, Callable]) -> None:
+        """Прогнать все элементы источника через стадии; последняя стадия ничего не передаёт дальше."""
+        queues = [queue.Queue(maxsize=self._queue_depth) for _ in stages]
+        source_name, source_iter = source
+        self.stats = [StageStats(source_name)] + [StageStats(name) for name, _ in stages]
+        threads = [threading.Thread(target=self._run_source, args=(source_iter, self.stats[0], queues[0]))]
+        for i, (_, func) in enumerate(stages):
+            out = queues[i + 1] if i + 1 < len(queues) else None
+            threads.append(threading.Thread(target=self._run_stage, args=(func, self.stats[i + 1], queues[i], out)))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        logger.info(f'pipeline {self._name}: ' + '; '.join(str(s) for s in self.stats))
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,125 @@
+import threading
+import time
+from contextlib import closing, contextmanager
+import psycopg2
+from psycopg2 import OperationalError, InterfaceError
+from psycopg2.extensions import connection as _connection, TRANSACTION_STATUS_UNKNOWN
+from psycopg2.extras import RealDictCursor
+from config import logger
+
+
+class _Lease:
+    def __init__(self, conn: _connection) -> None:
+        self.conn = conn
+        self.depth = 0
+        self.broken = False
+
+
+class PGConnectionPool:
+    """Пул подключений к Postgres.
+
+    Каждый поток получает собственное подключение: повторный вызов connection()
+    внутри того же потока возвращает уже выданное подключение, поэтому потоку
+    никогда не нужно больше одного и взаимоблокировка при исчерпании пула
+    невозможна. При выдаче подключение проверяется (закрыто ли оно, а если
+    простаивало дольше health_check_interval - выполняется SELECT 1);
+    сломанное подключение выбрасывается и заменяется новым. Если подключение
+    сломалось во вложенном вызове, следующий вызов connection() в том же
+    потоке заменяет его, не дожидаясь возврата внешней аренды.
+    """
+
+    def __init__(self, dsn: dict, minconn: int, maxconn: int, health_check_interval: float = 30) -> None:
+        self._dsn = dsn
+        self._health_check_interval = health_check_interval
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._idle: list[tuple[_connection, float]] = []
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self) -> _connection:
+        return psycopg2.connect(**self._dsn, cursor_factory=RealDictCursor)
+
+    def _discard(self, conn: _connection) -> None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _is_healthy(self, conn: _connection, last_used: float) -> bool:
+        if conn.closed or conn.info.transaction_status == TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - last_used < self._health_check_interval:
+            return True
+        try:
+            with closing(conn.cursor()) as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self) -> _connection:
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    idle = self._idle.pop() if self._idle else None
+                if idle is None:
+                    return self._connect()
+                conn, last_used = idle
+                if self._is_healthy(conn, last_used):
+                    return conn
+                logger.warning('PG_POOL: dropping broken connection, reconnecting')
+                self._discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _checkin(self, conn: _connection, broken: bool) -> None:
+        try:
+            if not broken and not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            if broken or conn.closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Выдать подключение текущего потока; транзакция откатывается при возврате в пул."""
+        lease = getattr(self._local, 'lease', None)
+        outer = lease is None
+        if outer:
+            lease = _Lease(self._checkout())
+            self._local.lease = lease
+        elif lease.broken:
+            # подключение сломалось во вложенном вызове, пока внешний ещё держит аренду:
+            # повтор вложенного запроса (pg_backoff) получает новое подключение вместо мёртвого
+            self._discard(lease.conn)
+            lease.conn = self._connect()
+            lease.broken = False
+        lease.depth += 1
+        try:
+            yield lease.conn
+        except (OperationalError, InterfaceError):
+            lease.broken = True
+            raise
+        finally:
+            lease.depth -= 1
+            if outer:
+                self._local.lease = None
+                self._checkin(lease.conn, lease.broken)
+
+    def closeall(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
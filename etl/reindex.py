@@ -0,0 +1,68 @@
+from contextlib import closing
+from elasticsearch import Elasticsearch
+from utils import elastic_client_context, pg_pool_context, pg_backoff
+from config import (logger, dsn, elastic_host, fetch_size, pg_pool_min, pg_pool_max, pg_health_check_interval,
+                    es_schema_dir, index_alias, reindex_delete_old,
+                    bulk_chunk_size, bulk_max_chunk_bytes, bulk_thread_count, bulk_queue_size,
+                    transformer_mode, transformer_validate)
+from extractor import BaseExtractor, FilmworkExtractor, GenreExtractor, PersonExtractor
+from transformer import BaseTransformer, Transformer, FastTransformer
+from loader import BaseLoader, ParallelLoader
+from storage import MemoryStorage
+from state import State
+from index_manager import IndexManager
+from pool import PGConnectionPool
+
+
+class Clock:
+    def __init__(self, pool: PGConnectionPool):
+        self._pool = pool
+
+    @pg_backoff()
+    def now(self) -> str:
+        """Время сервера Postgres, чтобы отметки не зависели от часов ETL-хоста."""
+        with self._pool.connection() as conn, closing(conn.cursor()) as cursor:
+            cursor.execute('SELECT now()')
+            return str(cursor.fetchone()['now'])
+
+
+def _load(extractor: BaseExtractor, transformer: BaseTransformer, loader: BaseLoader) -> None:
+    for batch in extractor.extract_batches():
+        if batch.rows:
+            loader.load_data(transformer.transform(batch.rows))
+        extractor.commit(batch)
+
+
+def _catch_up(pg_pool: PGConnectionPool, since: str, transformer: BaseTransformer, loader: BaseLoader) -> None:
+    """Догрузить изменения фильмов, жанров и персон, сделанные после since."""
+    extractors = (FilmworkExtractor, GenreExtractor, PersonExtractor)
+    state = State(MemoryStorage({extractor.time_modified_key_name: since for extractor in extractors}))
+    for extractor in extractors:
+        _load(extractor(pg_pool, state, fetch_size), transformer, loader)
+
+
+def reindex(pg_pool: PGConnectionPool, client: Elasticsearch) -> None:
+    """Полная переиндексация в новый индекс с атомарным переключением алиаса."""
+    manager = IndexManager(client, index_alias, es_schema_dir)
+    clock = Clock(pg_pool)
+    index = manager.create_index()
+    transformer = FastTransformer(transformer_validate) if transformer_mode == 'fast' else Transformer()
+    loader = ParallelLoader(client, index, bulk_chunk_size, bulk_thread_count, bulk_max_chunk_bytes, bulk_queue_size)
+
+    started = clock.now()
+    _load(FilmworkExtractor(pg_pool, State(MemoryStorage()), fetch_size), transformer, loader)
+    logger.info(f'reindex: full load into {index} done, catching up since {started}')
+    caught_up = clock.now()
+    _catch_up(pg_pool, started, transformer, loader)
+
+    manager.finish_load(index)
+    old = manager.swap_alias(index)
+    # изменения, которые основной ETL успел записать в старый индекс до переключения
+    _catch_up(pg_pool, caught_up, transformer, loader)
+    if reindex_delete_old:
+        manager.delete_indices(old)
+
+
+if __name__ == '__main__':
+    with pg_pool_context(dsn, pg_pool_min, pg_pool_max, pg_health_check_interval) as pg_pool, elastic_client_context(elastic_host) as client:
+        reindex(pg_pool, client)
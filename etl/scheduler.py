@@ -0,0 +1,27 @@
+class Schedule:
+    """Расписание опроса одной сущности.
+
+    Пока пачки приходят полными (обработано не меньше fetch_size записей),
+    следующий проход начинается сразу; если изменений было мало, пауза
+    сбрасывается до min_interval; если изменений не было, пауза растёт
+    в factor раз до max_interval.
+    """
+
+    def __init__(self, fetch_size: int, min_interval: float, max_interval: float, factor: float = 2) -> None:
+        self._fetch_size = fetch_size
+        self._min_interval = min_interval
+        self._max_interval = max(min_interval, max_interval)
+        self._factor = factor
+        self.interval = min_interval
+
+    def next_delay(self, processed: int) -> float:
+        """Пауза перед следующим проходом, если последний обработал processed записей."""
+        if processed >= self._fetch_size:
+            self.interval = self._min_interval
+            return 0
+        if processed > 0:
+            self.interval = self._min_interval
+            return self.interval
+        delay = self.interval
+        self.interval = min(self.interval * self._factor, self._max_interval)
+        return delay
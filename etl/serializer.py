@@ -0,0 +1,51 @@
+from typing import Iterable, Iterator
+import orjson
+from pydantic import BaseModel
+
+
+class BulkSerializer:
+    """Рендер документов сразу в строки NDJSON для bulk API.
+
+    Словари (FastTransformer) кодируются orjson, который сам понимает UUID
+    и datetime; pydantic-модели - собственным сериализатором pydantic
+    (model_dump_json) без промежуточного словаря. Результат - готовые
+    байты, которые передаются клиенту Elasticsearch без повторной сериализации.
+    """
+
+    def __init__(self, index: str) -> None:
+        self._index = index
+
+    def render(self, doc: BaseModel | dict[str, any]) -> tuple[str, bytes]:
+        """Вернуть id документа и его пару строк action + source."""
+        if isinstance(doc, dict):
+            id = str(doc['id'])
+            source = orjson.dumps(doc)
+        else:
+            id = str(doc.id)
+            source = doc.model_dump_json().encode()
+        action = orjson.dumps({'index': {'_index': self._index, '_id': id}})
+        return id, b'%b\n%b\n' % (action, source)
+
+    def render_update(self, id: str, body: dict[str, any]) -> tuple[str, bytes]:
+        """Пара строк update-действия для частичного обновления документа."""
+        action = orjson.dumps({'update': {'_index': self._index, '_id': id, 'retry_on_conflict': 3}})
+        return id, b'%b\n%b\n' % (action, orjson.dumps(body))
+
+    @staticmethod
+    def source(line: bytes) -> bytes:
+        """Строка source из пары, полученной от render()."""
+        return line[line.index(b'\n') + 1:]
+
+    @staticmethod
+    def chunks(rendered: Iterable[tuple[str, bytes]], chunk_size: int, max_chunk_bytes: int) -> Iterator[tuple[list[str], bytes]]:
+        """Нарезать документы на тела bulk-запросов по числу документов и размеру в байтах."""
+        ids, lines, size = [], [], 0
+        for id, line in rendered:
+            if ids and (len(ids) >= chunk_size or size + len(line) > max_chunk_bytes):
+                yield ids, b''.join(lines)
+                ids, lines, size = [], [], 0
+            ids.append(id)
+            lines.append(line)
+            size += len(line)
+        if ids:
+            yield ids, b''.join(lines)
@@ -0,0 +1,78 @@
+from dataclasses import dataclass
+from pydantic import BaseModel
+from loader import BaseLoader, ComponentLoader
+from transformer import BaseTransformer, PersonIndexTransformer, GenreIndexTransformer
+
+
+@dataclass
+class Sink:
+    """Дополнительный индекс, который заполняется из тех же строк, что и индекс фильмов.
+
+    upsert - трансформер отдаёт update-действия (скриптовый upsert), а не документы.
+    """
+    index: str
+    transformer: BaseTransformer
+    loader: ComponentLoader
+    upsert: bool = False
+
+
+# индексы, которые умеет заполнять fan-out: трансформер и признак upsert
+SINK_TYPES: dict[str, tuple[type[BaseTransformer], bool]] = {
+    'persons': (PersonIndexTransformer, True),
+    'genres': (GenreIndexTransformer, False),
+}
+
+
+class FanOutDocs(list):
+    """Документы фильмов пачки; документы дополнительных индексов - в extra по имени индекса."""
+
+    def __init__(self, docs: list[BaseModel | dict[str, any]], extra: dict[str, list[dict[str, any]]]):
+        super().__init__(docs)
+        self.extra = extra
+
+
+class FanOutTransformer(BaseTransformer):
+    """Трансформер фильмов, который за тот же проход по строкам готовит документы дополнительных индексов."""
+
+    def __init__(self, transformer: BaseTransformer, sinks: list[Sink]):
+        self._transformer = transformer
+        self._sinks = sinks
+
+    def transform(self, data: list[dict[str, any]]) -> FanOutDocs:
+        return FanOutDocs(self._transformer.transform(data), {sink.index: sink.transformer.transform(data) for sink in self._sinks})
+
+
+class FanOutLoader(BaseLoader):
+    """Загрузчик фильмов, который дописывает в дополнительные индексы их документы из FanOutDocs.
+
+    Частичные обновления фильмов (персоны, жанры) переводятся трансформерами
+    дополнительных индексов в их документы и загружаются туда же.
+    """
+
+    def __init__(self, loader: ComponentLoader, sinks: list[Sink]):
+        self._loader = loader
+        self._sinks = sinks
+
+    @property
+    def written(self) -> int:
+        return self._loader.written
+
+    @staticmethod
+    def _load(sink: Sink, docs: list[dict[str, any]]) -> None:
+        if not docs:
+            return
+        if sink.upsert:
+            sink.loader.update_data(docs)
+        else:
+            sink.loader.load_data(docs)
+
+    def load_data(self, models: list[BaseModel | dict[str, any]]) -> None:
+        self._loader.load_data(models)
+        extra = getattr(models, 'extra', {})
+        for sink in self._sinks:
+            self._load(sink, extra.get(sink.index, []))
+
+    def update_data(self, patches: list[dict[str, any]]) -> None:
+        self._loader.update_data(patches)
+        for sink in self._sinks:
+            self._load(sink, sink.transformer.transform_patches(patches))
@@ -0,0 +1,40 @@
+-- Уведомления об изменениях для ETL (LISTEN content_changes).
+-- Полезная нагрузка: {"table": ..., "id": ..., "film_work_id": ..., "modified": ...}
+CREATE OR REPLACE FUNCTION content.notify_etl_change() RETURNS trigger AS $$
+DECLARE
+    row_data jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify('content_changes', jsonb_strip_nulls(jsonb_build_object(
+        'table', TG_TABLE_NAME,
+        'id', row_data -> 'id',
+        'film_work_id', row_data -> 'film_work_id',
+        'modified', row_data -> 'modified'
+    ))::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS etl_change ON content.film_work;
+CREATE TRIGGER etl_change AFTER INSERT OR UPDATE ON content.film_work
+    FOR EACH ROW EXECUTE FUNCTION content.notify_etl_change();
+
+DROP TRIGGER IF EXISTS etl_change ON content.genre;
+CREATE TRIGGER etl_change AFTER INSERT OR UPDATE ON content.genre
+    FOR EACH ROW EXECUTE FUNCTION content.notify_etl_change();
+
+DROP TRIGGER IF EXISTS etl_change ON content.person;
+CREATE TRIGGER etl_change AFTER INSERT OR UPDATE ON content.person
+    FOR EACH ROW EXECUTE FUNCTION content.notify_etl_change();
+
+DROP TRIGGER IF EXISTS etl_change ON content.genre_film_work;
+CREATE TRIGGER etl_change AFTER INSERT OR UPDATE OR DELETE ON content.genre_film_work
+    FOR EACH ROW EXECUTE FUNCTION content.notify_etl_change();
+
+DROP TRIGGER IF EXISTS etl_change ON content.person_film_work;
+CREATE TRIGGER etl_change AFTER INSERT OR UPDATE OR DELETE ON content.person_film_work
+    FOR EACH ROW EXECUTE FUNCTION content.notify_etl_change();
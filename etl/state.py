@@ -1,23 +1,67 @@
+import atexit
+import threading
+import time
 from typing import Any
 from storage import BaseStorage
 
+# id больше любого UUID: keyset (modified, id) > (T, MAX_ID) равносилен modified > T
+MAX_ID = 'ffffffff-ffff-ffff-ffff-ffffffffffff'
+
+
 class State:
-    """Класс для работы с состояниями."""
+    """Класс для работы с состояниями.
 
-    def __init__(self, storage: BaseStorage) -> None:
+    Состояние читается из хранилища один раз и дальше живёт в памяти под
+    блокировкой. При flush_interval > 0 записи в хранилище группируются:
+    изменения сохраняются не чаще раза в flush_interval секунд (и при
+    завершении процесса), иначе - при каждом set_state.
+    """
+
+    def __init__(self, storage: BaseStorage, flush_interval: float = 0) -> None:
         self.storage = storage
+        self._flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._state = storage.retrieve_state()
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self._timer = None
+        if flush_interval > 0:
+            atexit.register(self.flush)
 
     def set_state(self, key: str, value: Any) -> None:
         """Установить состояние для определённого ключа."""
-        state = self.storage.retrieve_state()
-        state[key] = value
-        self.storage.save_state(state)
-        
+        self.set_states({key: value})
+
+    def set_states(self, values: dict[str, Any]) -> None:
+        """Установить несколько ключей разом: в хранилище они попадут одним сохранением."""
+        with self._lock:
+            self._state.update(values)
+            self._dirty = True
+            remaining = self._flush_interval - (time.monotonic() - self._last_flush)
+            if remaining <= 0:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(remaining, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
     def get_state(self, key: str) -> Any:
         """Получить состояние по определённому ключу."""
-        state = self.storage.retrieve_state()
-        val = state[key] if key in state else None
-        return val
-    
+        with self._lock:
+            return self._state.get(key)
+
+    def flush(self) -> None:
+        """Сохранить накопленные изменения в хранилище."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._dirty:
+                self.storage.save_state(dict(self._state))
+                self._dirty = False
+            self._last_flush = time.monotonic()
+
     @property
-    def isEmpty(self): return len(self.storage.retrieve_state()) < 1
+    def isEmpty(self):
+        with self._lock:
+            return len(self._state) < 1
@@ -1,5 +1,8 @@
 import abc
 import json
+import os
+import sqlite3
+import tempfile
 
 class BaseStorage(abc.ABC):
     """Абстрактное хранилище состояния.
@@ -29,9 +32,27 @@ class JsonFileStorage(BaseStorage):
 
         
     def save_state(self, state: dict[str, any]) -> None:
-        """Сохранить состояние в хранилище."""
-        with open(self.file_path, 'w') as json_file:
-            json.dump(state, json_file)
+        """Сохранить состояние в хранилище.
+
+        Запись атомарная: временный файл в том же каталоге, fsync, rename,
+        поэтому падение во время записи не оставляет файл повреждённым.
+        """
+        dir_name = os.path.dirname(os.path.abspath(self.file_path))
+        fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix='.state-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as json_file:
+                json.dump(state, json_file)
+                json_file.flush()
+                os.fsync(json_file.fileno())
+            os.replace(tmp_path, self.file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        dir_fd = os.open(dir_name, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
            
     def retrieve_state(self) -> dict[str, any]:
         """Получить состояние из хранилища."""
@@ -41,3 +62,50 @@ class JsonFileStorage(BaseStorage):
                 state = json.load(json_file)
         finally:
             return state
+
+
+class SqliteStorage(BaseStorage):
+    """Реализация хранилища на SQLite.
+
+    Каждый ключ хранится отдельной строкой, значение - в JSON;
+    сохранение выполняется одной транзакцией.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        conn.close()
+
+    def save_state(self, state: dict[str, any]) -> None:
+        """Сохранить состояние в хранилище."""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)',
+                             [(key, json.dumps(value)) for key, value in state.items()])
+        conn.close()
+
+    def retrieve_state(self) -> dict[str, any]:
+        """Получить состояние из хранилища."""
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute('SELECT key, value FROM state').fetchall()
+        conn.close()
+        return {key: json.loads(value) for key, value in rows}
+
+
+class MemoryStorage(BaseStorage):
+    """Хранилище в памяти процесса.
+
+    Подходит для разовых прогонов (например, полной переиндексации),
+    состояние которых не нужно сохранять между запусками.
+    """
+
+    def __init__(self, state: dict[str, any] | None = None) -> None:
+        self._state = dict(state or {})
+
+    def save_state(self, state: dict[str, any]) -> None:
+        """Сохранить состояние в хранилище."""
+        self._state = dict(state)
+
+    def retrieve_state(self) -> dict[str, any]:
+        """Получить состояние из хранилища."""
+        return dict(self._state)
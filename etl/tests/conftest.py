@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# модули ETL импортируются как в контейнере: из каталога etl, настройки - из окружения
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FETCH_TIMEOUT', '1')
+os.environ.setdefault('TARGET_SCHEMA', 'content')
+os.environ.setdefault('METRICS_PORT', '0')
+os.environ.setdefault('LOGS_PATH', os.path.join(tempfile.gettempdir(), 'etl-tests', 'etl.log'))
+os.environ.setdefault('STORAGE_PATH', os.path.join(tempfile.gettempdir(), 'etl-tests', 'state', 'state.json'))
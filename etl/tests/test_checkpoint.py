@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+from async_etl import AsyncETLComponent
+from extractor import Batch, FilmworkExtractor
+from state import State
+from storage import MemoryStorage
+
+
+def extractor(state: State) -> FilmworkExtractor:
+    return FilmworkExtractor(None, state, 10)
+
+
+def test_checkpoint_only_on_last_batch():
+    batches = list(extractor(State(MemoryStorage()))._with_checkpoint(iter([[1], [2], [3]]), '2024-01-01', 'id-3'))
+    assert [(batch.rows, batch.checkpoint, batch.checkpoint_id) for batch in batches] == [
+        ([1], None, None), ([2], None, None), ([3], '2024-01-01', 'id-3'),
+    ]
+
+
+def test_commit_moves_cursor_only_on_checkpoint():
+    state = State(MemoryStorage())
+    films = extractor(state)
+    films.commit(Batch([{'id': 'a'}]))
+    assert state.isEmpty
+    films.commit(Batch([], '2024-01-01', 'a'))
+    assert (state.get_state(films.time_modified_key_name), state.get_state(films.last_id_key_name)) == ('2024-01-01', 'a')
+
+
+class Transformer:
+    def transform(self, data):
+        return data
+
+
+class Loader:
+    """Загрузчик, у которого пачки завершаются не в порядке отправки: задержка пачки - в её строке."""
+
+    def __init__(self, events: list, fail: int | None = None) -> None:
+        self.events = events
+        self.fail = fail
+
+    async def load_data(self, models):
+        number, delay = models[0]
+        await asyncio.sleep(delay)
+        if number == self.fail:
+            raise ConnectionError('elasticsearch is down')
+        self.events.append(('loaded', number))
+
+
+class Extractor:
+    entity = 'film_work'
+
+    def __init__(self, batches: list[Batch], events: list) -> None:
+        self._batches = batches
+        self.events = events
+
+    async def iter_film_ids(self, until):
+        for batch in self._batches:
+            yield batch
+
+    async def merge(self, rows):
+        return rows
+
+    def commit(self, batch: Batch) -> None:
+        if batch.checkpoint is not None:
+            self.events.append(('commit', batch.checkpoint))
+
+
+def sync(batches: list[Batch], events: list, fail: int | None = None) -> None:
+    async def run():
+        component = AsyncETLComponent(State(MemoryStorage()), 10, 1)
+        component._stop = asyncio.Event()
+        component._slots = asyncio.Semaphore(4)
+        component._transformer = Transformer()
+        component._loader = Loader(events, fail)
+        await component._sync(Extractor(batches, events), 'until')
+
+    asyncio.run(run())
+
+
+BATCHES = [
+    Batch([(1, 0.03)]),
+    Batch([(2, 0)], 'c1'),
+    Batch([(3, 0)]),
+    Batch([(4, 0.01)], 'c2'),
+]
+
+
+def test_async_commits_wait_for_previous_loads():
+    events = []
+    sync(BATCHES, events)
+    # пачки 2 и 3 загружены раньше пачки 1, но c1 фиксируется только после неё, c2 - после c1
+    assert events.index(('commit', 'c1')) > events.index(('loaded', 1))
+    assert events.index(('commit', 'c1')) > events.index(('loaded', 2))
+    assert events.index(('commit', 'c2')) > events.index(('loaded', 4))
+    assert [event for event in events if event[0] == 'commit'] == [('commit', 'c1'), ('commit', 'c2')]
+
+
+def test_async_failed_load_keeps_checkpoint():
+    events = []
+    with pytest.raises(ConnectionError):
+        sync(BATCHES, events, fail=1)
+    # остальные пачки загружены, но курсор не сдвигается дальше незагруженной пачки 1
+    assert ('loaded', 4) in events
+    assert [event for event in events if event[0] == 'commit'] == []
@@ -0,0 +1,79 @@
+import os
+import pytest
+from dead_letter import DeadLetterSpool, film_ids, replay
+
+
+def entry(id: str, index: str = 'movies', action: str = 'index', body: dict | None = None) -> dict[str, any]:
+    return {'index': index, 'id': id, 'action': action, 'body': body or {}, 'error': {'type': 'mapper_parsing_exception'}}
+
+
+class Component:
+    """Замена ETLComponent: запоминает, какие фильмы пересобирались."""
+
+    def __init__(self, existing: set[str], fail: bool = False) -> None:
+        self.existing = existing
+        self.fail = fail
+        self.reloaded: list[list[str]] = []
+
+    def genre_film_ids(self, genre_ids: list[str]) -> list[str]:
+        return [f'film-of-{id}' for id in genre_ids]
+
+    def reload_films(self, ids: list[str]) -> int:
+        if self.fail:
+            raise ConnectionError('postgres is down')
+        self.reloaded.append(ids)
+        return len([id for id in ids if id in self.existing])
+
+
+@pytest.fixture
+def spool(tmp_path) -> DeadLetterSpool:
+    return DeadLetterSpool(str(tmp_path / 'dead_letter.ndjson'))
+
+
+def test_take_rotates_spool(spool):
+    spool.write([entry('a'), entry('b')])
+    with spool.take() as entries:
+        # отказы во время повтора пишутся в новый файл и в этот повтор не попадают
+        spool.write([entry('c')])
+        assert [e['id'] for e in entries] == ['a', 'b']
+    with spool.take() as entries:
+        assert [e['id'] for e in entries] == ['c']
+    with spool.take() as entries:
+        assert entries == []
+
+
+def test_interrupted_take_is_repeated_first(spool):
+    spool.write([entry('a')])
+    with pytest.raises(RuntimeError):
+        with spool.take():
+            raise RuntimeError('killed')
+    spool.write([entry('b')])
+    with spool.take() as entries:
+        assert [e['id'] for e in entries] == ['a']
+    with spool.take() as entries:
+        assert [e['id'] for e in entries] == ['b']
+    assert not os.path.exists(spool.path)
+
+
+def test_film_ids_by_index():
+    person = {'script': {'params': {'id': 'p1', 'films': [{'id': 'f2', 'roles': ['actor']}, {'id': 'f3', 'roles': ['writer']}]}}}
+    films, genres = film_ids([entry('f1'), entry('f1', action='update'), entry('p1', 'persons', 'update', person), entry('g1', 'genres')])
+    assert films == {'f1', 'f2', 'f3'}
+    assert genres == {'g1'}
+
+
+def test_replay_rebuilds_films(spool):
+    spool.write([entry('f1'), entry('f1', action='update'), entry('gone'), entry('g1', 'genres')])
+    component = Component({'f1', 'film-of-g1'})
+    assert replay(spool, component) == (2, 1)
+    assert component.reloaded == [['f1', 'film-of-g1', 'gone']]
+    assert replay(spool, component) == (0, 0)
+
+
+def test_failed_replay_keeps_entries(spool):
+    spool.write([entry('f1')])
+    with pytest.raises(ConnectionError):
+        replay(spool, Component({'f1'}, fail=True))
+    component = Component({'f1'})
+    assert replay(spool, component) == (1, 0)
+    assert component.reloaded == [['f1']]
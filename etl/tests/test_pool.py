@@ -0,0 +1,98 @@
+import threading
+import pytest
+from psycopg2 import OperationalError
+import utils
+from pool import PGConnectionPool
+from utils import pg_backoff
+
+
+class FakeConnection:
+    """Подключение, которое «сервер» может оборвать: после kill любой запрос падает с OperationalError."""
+
+    class info:
+        transaction_status = 0
+
+    def __init__(self, number: int) -> None:
+        self.number = number
+        self.dead = False
+        self.closed = 0
+
+    def _check(self) -> None:
+        if self.dead:
+            raise OperationalError('server closed the connection unexpectedly')
+
+    def rows(self, count: int):
+        for i in range(count):
+            self._check()
+            yield i
+
+    def query(self, row: int) -> tuple[int, int]:
+        self._check()
+        return row, self.number
+
+    def rollback(self) -> None:
+        self._check()
+
+    def close(self) -> None:
+        self.closed = 1
+
+
+class FakePool(PGConnectionPool):
+    def __init__(self, maxconn: int) -> None:
+        self.opened: list[FakeConnection] = []
+        super().__init__({}, 0, maxconn)
+
+    def _connect(self) -> FakeConnection:
+        self.opened.append(FakeConnection(len(self.opened) + 1))
+        return self.opened[-1]
+
+
+class Worker:
+    """Поток строк на внешней аренде и вложенный запрос на каждую строку, как iter_film_ids и _merge_data."""
+
+    def __init__(self, pool: FakePool, kill_at: int) -> None:
+        self._pool = pool
+        self._kill_at = kill_at
+        self.merged = []
+
+    @pg_backoff()
+    def stream(self, count: int):
+        with self._pool.connection() as conn:
+            for row in conn.rows(count):
+                yield self.merge(row)
+
+    @pg_backoff()
+    def merge(self, row: int) -> tuple[int, int]:
+        with self._pool.connection() as conn:
+            if row == self._kill_at and conn.number == 1:
+                conn.dead = True
+            return conn.query(row)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(utils, 'sleep', lambda t: None)
+
+
+def test_nested_call_reuses_thread_connection():
+    pool = FakePool(1)
+    worker = Worker(pool, kill_at=-1)
+    assert list(worker.stream(3)) == [(0, 1), (1, 1), (2, 1)]
+    assert len(pool.opened) == 1
+
+
+def test_connection_lost_mid_stream_recovers():
+    pool = FakePool(1)
+    worker = Worker(pool, kill_at=1)
+    result = []
+    thread = threading.Thread(target=lambda: result.extend(worker.stream(3)), daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive(), 'worker is stuck retrying on a dead connection'
+    # вложенный повтор получает новое подключение, затем поток перезапускается целиком
+    assert result == [(0, 1), (1, 2), (0, 3), (1, 3), (2, 3)]
+    assert len(pool.opened) == 3
+    assert pool.opened[0].closed
+    # все подключения возвращены: новая аренда не ждёт свободного места в пуле
+    with pool.connection():
+        pass
@@ -33,8 +33,126 @@ class ComponentTransformer(BaseTransformer):
             }
             model = Filmwork(**model_dict)
             models.append(model)
-        logger.debug(models)
+        logger.payload('transform', models)
         return models
 
 class Transformer(ComponentTransformer):
     pass
+
+
+class FastTransformer(ComponentTransformer):
+    """Быстрый путь: персоны группируются по ролям за один проход,
+    документ сразу собирается в виде, готовом для Elasticsearch.
+
+    Без validate возвращаются словари без создания pydantic-моделей
+    (данные из Postgres считаются доверенными); с validate каждый
+    документ проверяется через Filmwork.model_validate.
+    """
+
+    def __init__(self, validate: bool = False):
+        self._validate = validate
+
+    def _build(self, item: dict[str, any]) -> dict[str, any]:
+        people = {'actor': [], 'director': [], 'writer': []}
+        for person in item['persons']:
+            group = people.get(person['person_role'])
+            if group is not None:
+                group.append({'id': str(person['person_id']), 'name': person['person_name']})
+        directors, actors, writers = people['director'], people['actor'], people['writer']
+        return {
+            'id': str(item['film_work_id']),
+            'title': item['title'],
+            'description': item['description'],
+            'imdb_rating': item['rating'],
+            'genres': [genre for genre in item['genres'] if genre is not None],
+            'directors_names': [person['name'] for person in directors],
+            'actors_names': [person['name'] for person in actors],
+            'writers_names': [person['name'] for person in writers],
+            'directors': directors,
+            'actors': actors,
+            'writers': writers,
+        }
+
+    def transform(self, data: list[dict[str, any]]) -> list[dict[str, any]] | list[BaseModel]:
+        docs = [self._build(item) for item in data]
+        if self._validate:
+            return [Filmwork.model_validate(doc) for doc in docs]
+        return docs
+
+
+# Сливает фильмы персоны в документ индекса persons: роли в уже известных фильмах заменяются, новые фильмы добавляются.
+MERGE_PERSON_FILMS_SCRIPT = """
+ctx._source.id = params.id;
+ctx._source.full_name = params.full_name;
+if (ctx._source.films == null) { ctx._source.films = new ArrayList(); }
+for (def film : params.films) {
+  def found = null;
+  for (def entry : ctx._source.films) { if (entry.id == film.id) { found = entry; break; } }
+  if (found == null) { ctx._source.films.add(['id': film.id, 'roles': film.roles]); }
+  else { found.roles = film.roles; }
+}
+"""
+
+
+class PersonIndexTransformer(BaseTransformer):
+    """Документы индекса persons из строк фильмов.
+
+    Пачка содержит лишь часть фильмов персоны, поэтому результат - не
+    документы, а update-действия со скриптовым upsert, которые дописывают
+    фильмы пачки в документ персоны. Исчезнувшие связи персоны с фильмом
+    так не удаляются: для этого нужна полная переиндексация.
+    """
+
+    def _actions(self, people: dict[str, tuple[str, dict[str, set[str]]]]) -> list[dict[str, any]]:
+        actions = []
+        for person_id, (full_name, films) in people.items():
+            params = {
+                'id': person_id,
+                'full_name': full_name,
+                'films': [{'id': film_id, 'roles': sorted(roles)} for film_id, roles in films.items()],
+            }
+            actions.append({
+                'id': person_id,
+                'script': {'source': MERGE_PERSON_FILMS_SCRIPT, 'lang': 'painless', 'params': params},
+                'scripted_upsert': True,
+                'upsert': {},
+            })
+        return actions
+
+    @staticmethod
+    def _add(people: dict, film_id: str, person_id: str, full_name: str, role: str) -> None:
+        _, films = people.setdefault(person_id, (full_name, {}))
+        films.setdefault(film_id, set()).add(role)
+
+    def transform(self, data: list[dict[str, any]]) -> list[dict[str, any]]:
+        people = {}
+        for item in data:
+            for person in item['persons']:
+                self._add(people, str(item['film_work_id']), str(person['person_id']), person['person_name'], person['person_role'])
+        return self._actions(people)
+
+    def transform_patches(self, patches: list[dict[str, any]]) -> list[dict[str, any]]:
+        people = {}
+        for patch in patches:
+            for person in patch.get('people', ()):
+                self._add(people, patch['id'], person['id'], person['name'], person['role'])
+        return self._actions(people)
+
+
+class GenreIndexTransformer(BaseTransformer):
+    """Документы индекса genres из строк фильмов (поле genres_list)."""
+
+    @staticmethod
+    def _docs(genres_lists: list[list[dict[str, any]]]) -> list[dict[str, any]]:
+        genres = {}
+        for genres_list in genres_lists:
+            for genre in genres_list:
+                genres[str(genre['genre_id'])] = genre['genre_name']
+        return [{'id': id, 'name': name} for id, name in genres.items()]
+
+    def transform(self, data: list[dict[str, any]]) -> list[dict[str, any]]:
+        return self._docs([item['genres_list'] for item in data])
+
+    def transform_patches(self, patches: list[dict[str, any]]) -> list[dict[str, any]]:
+        return self._docs([patch['genres_list'] for patch in patches if 'genres_list' in patch])
+
@@ -1,12 +1,16 @@
+import inspect
+import random
 import psycopg2
-from psycopg2 import OperationalError
+from psycopg2 import OperationalError, InterfaceError
 from config import logger
 from psycopg2.extras import RealDictCursor
 from contextlib import contextmanager
-from elasticsearch import Elasticsearch, ConnectionError
+from elasticsearch import Elasticsearch, ApiError, ConnectionError, ConnectionTimeout
 from functools import wraps
 from time import sleep
 from config import dsn, elastic_host
+from pool import PGConnectionPool
+from metrics import BACKOFF_RETRIES
 
 
 @contextmanager
@@ -31,6 +35,15 @@ def elastic_client_context(*args):
     finally:
         client.transport.close()
 
+@contextmanager
+def pg_pool_context(dsn: dict, minconn: int, maxconn: int, health_check_interval: float):
+    """Контекстный менеджер для создания пула подключений к Postgres"""
+    pg_pool = PGConnectionPool(dsn, minconn, maxconn, health_check_interval)
+    try:
+        yield pg_pool
+    finally:
+        pg_pool.closeall()
+
 def pg_backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10):
     """
     Функция для повторного выполнения функции через некоторое время, если возникла ошибка. Использует наивный экспоненциальный рост времени повтора (factor) до граничного времени ожидания (border_sleep_time)
@@ -43,52 +56,104 @@ def pg_backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10):
     :param border_sleep_time: максимальное время ожидания
     :param n: количество повторов
     :return: результат выполнения функции
+
+    Генераторы перезапускаются целиком: продолжение с места остановки
+    обеспечивается отметкой modified, которую сдвигает потребитель.
+    Для объектов с пулом подключений переподключение выполняет сам пул.
     """
     def func_wrapper(func):
+        if inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def inner_gen(self, *args, **kwargs):
+                n = 0
+                while True:
+                    try:
+                        if n > 0:
+                            _pg_reconnect(self)
+                        yield from func(self, *args, **kwargs)
+                        return
+                    except (OperationalError, InterfaceError) as err:
+                        t = start_sleep_time * (factor ** n)
+                        if t > border_sleep_time:
+                            t = border_sleep_time
+                        n += 1
+                        BACKOFF_RETRIES.inc(target='postgres', operation=func.__qualname__)
+                        logger.error(f' BACKOFF: {err}, restarting stream in {t}s')
+                        sleep(t)
+            return inner_gen
+
         @wraps(func)
         def inner(self, *args, **kwargs): 
-            conn_obj_name = '_conn_inst'
             n = 0
             while True:
                 try:
-                    if hasattr(self, conn_obj_name):
-                        if n > 0:
-                            self.__dict__[conn_obj_name].close()
-                            self.__dict__[conn_obj_name] = psycopg2.connect(**dsn)
-                    else:
-                        logger.warn(f'ES_BACKOFF: object {self} doesn\'t contain object "{conn_obj_name}"')
+                    if n > 0:
+                        _pg_reconnect(self)
                     return func(self, *args, **kwargs)
-                except OperationalError as err:
+                except (OperationalError, InterfaceError) as err:
                     t = start_sleep_time * (factor ** n)
                     if t > border_sleep_time:
                         t = border_sleep_time
                     n += 1
+                    BACKOFF_RETRIES.inc(target='postgres', operation=func.__qualname__)
                     logger.error(f' BACKOFF: {err}, reconnecting in {t}s')
                     sleep(t)
         return inner
     return func_wrapper
 
+def _pg_reconnect(obj) -> None:
+    """Пересоздать собственное подключение объекта.
+
+    Объекты с пулом (_pool) ничего не делают: сломанное подключение пул
+    заменяет при следующем запросе, в том числе вложенном во внешнюю аренду.
+    """
+    conn_obj_name = '_conn_inst'
+    if conn_obj_name in obj.__dict__:
+        obj.__dict__[conn_obj_name].close()
+        obj.__dict__[conn_obj_name] = psycopg2.connect(**dsn, cursor_factory=RealDictCursor)
+    elif '_pool' not in obj.__dict__:
+        logger.warn(f'PG_BACKOFF: object {obj} doesn\'t contain object "{conn_obj_name}"')
+
+# ответы перегруженного или недоступного кластера, после которых запрос можно повторить
+ES_RETRY_STATUSES = (429, 502, 503, 504)
+
+
+def jittered(t: float) -> float:
+    """Пауза со случайным разбросом в [t/2, t]: повторы разных потоков не приходят в кластер разом."""
+    return random.uniform(t / 2, t)
+
+
 def es_backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10):
+    """Повтор запроса к Elasticsearch при обрыве соединения, таймауте и ответах 429/502/503/504.
+
+    Клиент пересоздаётся только после ошибки соединения; при перегрузке
+    кластера запрос повторяется тем же клиентом. Паузы растут как в
+    pg_backoff, но со случайным разбросом (jittered).
+    """
     def func_wrapper(func):
         @wraps(func)
         def inner(self, *args, **kwargs): 
             conn_obj_name = '_client'
             n = 0
+            reconnect = False
             while True:
                 try:
                     if hasattr(self, conn_obj_name):
-                        if n > 0:
+                        if reconnect:
                             self.__dict__[conn_obj_name].transport.close()
                             self.__dict__[conn_obj_name] = Elasticsearch(elastic_host)
+                            reconnect = False
                     else:
                         logger.warn(f'ES_BACKOFF: object {self} doesn\'t contain object "{conn_obj_name}"')
                     return func(self, *args, **kwargs)
-                except ConnectionError as err:
-                    t = start_sleep_time * (factor ** n)
-                    if t > border_sleep_time:
-                        t = border_sleep_time
+                except (ConnectionError, ConnectionTimeout, ApiError) as err:
+                    if isinstance(err, ApiError) and err.meta.status not in ES_RETRY_STATUSES:
+                        raise
+                    reconnect = isinstance(err, ConnectionError)
+                    t = jittered(min(start_sleep_time * (factor ** n), border_sleep_time))
                     n += 1
-                    logger.error(f' BACKOFF: {err}, reconnecting in {t}s')
+                    BACKOFF_RETRIES.inc(target='elasticsearch', operation=func.__qualname__)
+                    logger.error(f' BACKOFF: {err}, {"reconnecting" if reconnect else "retrying"} in {t:.2f}s')
                     sleep(t)
         return inner
     return func_wrapper
\ No newline at end of file